@@ -0,0 +1,22 @@
+"""Shared helpers of the benchmarks. The benchmarks don't need network access, all the outbound calls hit the stub
+server of the tests.
+"""
+
+import json
+
+from tests.common import StubServer
+
+BODY = json.dumps({"data": {"id": 1, "name": "Peter", "email": "peter@my-site.com"}})
+
+# Paths requested by the benchmarks
+STUB_PATHS = ("/", "/users", "/users/1")
+
+
+def get_stub_server() -> StubServer:
+    """`StubServer` that answers `BODY` to `STUB_PATHS`. Use it as a context manager:
+    ```python
+    with get_stub_server() as server:
+        requests.get(server.url + "/users")
+    ```
+    """
+    return StubServer({path: (200, BODY) for path in STUB_PATHS})
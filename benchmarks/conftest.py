@@ -0,0 +1,86 @@
+"""Fixtures of the [pytest-benchmark](https://pytest-benchmark.readthedocs.io/) suite of PyMS: the hot paths and the
+startup. The benchmarks of an optimization are parametrized with the previous implementation, to compare them in the
+same run. The suite runs offline, the outbound requests hit the stub server of the tests.
+
+The timings depend on the machine, so there is no tracked baseline: save one with the code to compare with, e.g.
+the master branch, and compare the changes with it in the same machine. It fails if the median of a benchmark is 25%
+slower, or `PYMS_BENCHMARK_THRESHOLD` percent:
+```bash
+git checkout master && tox -e benchmark-baseline
+git checkout my-branch && tox -e benchmark
+```
+The runs are saved in `.benchmarks`, which isn't tracked. The CI does the same in each pull request.
+"""
+
+import importlib.util
+import os
+
+import pytest
+import yaml
+
+from benchmarks.common import get_stub_server
+from pyms.config import config_registry
+from pyms.constants import CONFIGMAP_FILE_ENVIRONMENT
+from tests.common import MyMicroserviceNoSingleton
+
+# The suite needs pytest-benchmark, without it the benchmarks aren't collected
+collect_ignore_glob = [] if importlib.util.find_spec("pytest_benchmark") else ["test_*.py"]
+
+CONFIG = {
+    "pyms": {
+        "services": {
+            "requests": {"data": "data"},
+            "metrics": True,
+        },
+        "config": {"DEBUG": False, "TESTING": False, "APP_NAME": "Benchmark", "APPLICATION_ROOT": ""},
+    }
+}
+
+
+@pytest.fixture(scope="session")
+def config_file(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("config") / "config.yml")
+    with open(path, "w", encoding="utf-8") as config:
+        yaml.dump(CONFIG, config)
+    previous = os.environ.get(CONFIGMAP_FILE_ENVIRONMENT)
+    os.environ[CONFIGMAP_FILE_ENVIRONMENT] = path
+    config_registry.reload()
+    yield path
+    if previous is None:
+        del os.environ[CONFIGMAP_FILE_ENVIRONMENT]
+    else:
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = previous
+
+
+@pytest.fixture(scope="session")
+def microservice(config_file):  # pylint: disable=redefined-outer-name,unused-argument
+    ms = MyMicroserviceNoSingleton()
+    ms.reload_conf()
+    ms.create_app()
+    yield ms
+    ms.shutdown_services_actions()
+
+
+@pytest.fixture(scope="session")
+def stub_server():
+    with get_stub_server() as server:
+        yield server
+
+
+@pytest.fixture
+def write_config(tmp_path, monkeypatch, config_file):  # pylint: disable=redefined-outer-name,unused-argument
+    """Write a config file for a benchmark and point `PYMS_CONFIGMAP_FILE` to it. The config of the suite is
+    restored after the benchmark
+    """
+
+    def write(config: dict) -> str:
+        path = str(tmp_path / "config.yml")
+        with open(path, "w", encoding="utf-8") as config_fd:
+            yaml.dump(config, config_fd)
+        monkeypatch.setenv(CONFIGMAP_FILE_ENVIRONMENT, path)
+        config_registry.reload()
+        return path
+
+    yield write
+    monkeypatch.undo()
+    config_registry.reload()
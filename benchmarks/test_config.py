@@ -0,0 +1,145 @@
+"""Startup cost of the configuration and cost of reading it from the services. Each benchmark is parametrized with
+the previous implementation, to compare them in the same run.
+"""
+
+import time
+from unittest import mock
+
+import pytest
+
+from pyms.config import ConfFile, config_registry
+from pyms.config.conf import validate_conf
+from pyms.config.resource import ConfigResource
+from pyms.constants import CONFIG_BASE
+from pyms.crypt.driver import CryptAbstract, CryptResource
+from pyms.flask.services.driver import DriverService, ServicesResource
+from pyms.flask.services.requests import Service
+from pyms.utils import files
+
+SECRETS = 10
+
+SERVICES = 10
+
+# Round trip of a remote crypt, like `pyms.cloud.aws.kms`
+ROUND_TRIP = 0.02
+
+DECRYPT_CONFIG = {"pyms": {"config": {"enc_secret{}".format(i): "secret{}".format(i) for i in range(SECRETS)}}}
+
+STARTUP_CONFIG = {
+    "pyms": {
+        "services": {
+            "service{}".format(i): {"host": "service{}".format(i), "port": 8000 + i, "retries": 3}
+            for i in range(SERVICES)
+        },
+        "config": {"DEBUG": False, "TESTING": False, "APP_NAME": "Benchmark", "APPLICATION_ROOT": ""},
+    }
+}
+
+SERVICE_CONFIG = {
+    "data": "data",
+    "backoff_factor": 0.5,
+    "cache": {"max_entries": 100, "routes": [{"url": "http://users", "ttl": 1}]},
+}
+
+
+class RemoteCrypt(CryptAbstract):
+    def encrypt(self, message):
+        return message
+
+    def decrypt(self, encrypted):
+        time.sleep(ROUND_TRIP)
+        return encrypted
+
+
+def remote_crypt(path=None):  # pylint: disable=unused-argument
+    return RemoteCrypt()
+
+
+class MicroserviceConfig(ConfigResource):
+    config_resource = CONFIG_BASE
+
+
+SERVICE_CLASSES = [
+    type(name, (DriverService,), {"config_resource": name, "default_values": {}})
+    for name in ("service{}".format(i) for i in range(SERVICES))
+]
+
+
+def startup():
+    """The validation, the crypt, the microservice, the services resource and each service read the config file"""
+    files.files_cached.clear()
+    validate_conf()
+    crypt = CryptResource()
+    MicroserviceConfig(crypt=crypt)
+    ServicesResource()
+    for service_class in SERVICE_CLASSES:
+        service_class()
+
+
+def count_trees(fn) -> int:
+    original_init = ConfFile.__init__
+    with mock.patch.object(ConfFile, "__init__", autospec=True, side_effect=original_init) as init:
+        fn()
+    return sum(1 for call in init.call_args_list if call.kwargs.get("config") is None)
+
+
+@pytest.mark.parametrize("concurrent", [False, True], ids=["one_by_one", "decrypt_many_and_cache"])
+def test_config_decrypt(benchmark, write_config, concurrent):
+    """A config file with `enc_` secrets, built twice like `get_conf` does. Compare decrypting them one by one with
+    the concurrent `decrypt_many` and the cache of `pyms.config.decrypt`
+    """
+    write_config(DECRYPT_CONFIG)
+
+    def build_config():
+        config_registry.reload()
+        ConfFile(crypt=remote_crypt)
+        return ConfFile(crypt=remote_crypt)
+
+    if concurrent:
+        conf = benchmark.pedantic(build_config, rounds=5)
+    else:
+        with mock.patch("pyms.config.confile.decrypt_many"), mock.patch(
+            "pyms.config.confile.decrypt", side_effect=lambda crypt, encrypted: crypt.decrypt(encrypted)
+        ):
+            conf = benchmark.pedantic(build_config, rounds=5)
+
+    assert conf.pyms.config.secret0 == "secret0"
+
+
+@pytest.mark.parametrize("registry", [False, True], ids=["conf_file_per_resource", "config_registry"])
+def test_config_startup(benchmark, write_config, registry):
+    """Startup of the config of a microservice with 10 services. Compare the shared trees of
+    `pyms.config.config_registry` with a new `ConfFile` tree per resource
+    """
+    write_config(STARTUP_CONFIG)
+
+    if registry:
+
+        def startup_with_registry():
+            config_registry.reload()
+            startup()
+
+        benchmark.extra_info["trees"] = count_trees(startup_with_registry)
+        benchmark(startup_with_registry)
+    else:
+        with mock.patch.object(config_registry, "get", side_effect=ConfFile):
+            benchmark.extra_info["trees"] = count_trees(startup)
+            benchmark(startup)
+
+    # Without the registry each service builds its own tree
+    assert (benchmark.extra_info["trees"] < SERVICES) is registry
+
+
+@pytest.mark.parametrize("snapshot", [False, True], ids=["conf_file", "config_snapshot"])
+@pytest.mark.parametrize("attr", ["backoff_factor", "backoff_max", "cache"], ids=["configured", "default", "node"])
+def test_service_getattr(benchmark, attr, snapshot):
+    """`DriverService.__getattr__` with the lookup in the `ConfFile` and in the compiled `ConfigSnapshot`, for a key
+    in the config file, a key that falls back to the `default_values` and a node
+    """
+    service = Service()
+    service.set_config(ConfFile(config=SERVICE_CONFIG, empty_init=True))
+    if not snapshot:
+        service._config_snapshot = None  # pylint: disable=protected-access
+    expected = getattr(service, attr)
+
+    assert benchmark(getattr, service, attr) == expected
@@ -0,0 +1,122 @@
+"""Cost of the crypts of the config secrets. Each benchmark is parametrized with the previous implementation, to
+compare them in the same run.
+"""
+
+import base64
+import os
+import time
+from unittest import mock
+
+import pytest
+
+from pyms.config import ConfFile
+from pyms.constants import CRYPT_FILE_KEY_ENVIRONMENT
+
+MESSAGES = 50
+
+SECRETS = 20
+
+# Round trip of a KMS call
+ROUND_TRIP = 0.02
+
+
+class FakeKMSClient:
+    """KMS client that doesn't encrypt and waits `ROUND_TRIP` seconds per call"""
+
+    def generate_data_key(self, **kwargs):  # pylint: disable=unused-argument
+        time.sleep(ROUND_TRIP)
+        plaintext = os.urandom(32)
+        return {"Plaintext": plaintext, "CiphertextBlob": plaintext}
+
+    def decrypt(self, CiphertextBlob, **kwargs):  # pylint: disable=unused-argument,invalid-name
+        time.sleep(ROUND_TRIP)
+        return {"Plaintext": CiphertextBlob}
+
+
+@pytest.fixture
+def fernet_crypt(tmp_path, monkeypatch):
+    fernet = pytest.importorskip("pyms.crypt.fernet")
+    monkeypatch.setenv(CRYPT_FILE_KEY_ENVIRONMENT, str(tmp_path / "key.key"))
+    crypt = fernet.Crypt()
+    crypt.generate_key("password", write_to_file=True)
+    return crypt
+
+
+@pytest.fixture
+def kms_crypt():
+    kms = pytest.importorskip("pyms.cloud.aws.kms")
+    with mock.patch.object(kms.Crypt, "_init_boto"):
+        crypt = kms.Crypt(config=ConfFile(config={"key_id": "alias/benchmark", "envelope": True}))
+    crypt.client = FakeKMSClient()
+    return crypt
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["fernet_per_call", "cached_fernet"])
+def test_fernet_encrypt(benchmark, fernet_crypt, cached):  # pylint: disable=redefined-outer-name
+    """`pyms.crypt.fernet.Crypt` with the cached `Fernet` object, compared with reading the key and building a new
+    `Fernet` per call
+    """
+    from cryptography.fernet import Fernet  # pylint: disable=import-outside-toplevel
+
+    if cached:
+        encrypted = benchmark(fernet_crypt.encrypt, "message")
+    else:
+        encrypted = benchmark(lambda: Fernet(fernet_crypt.read_key()).encrypt(b"message"))
+
+    assert fernet_crypt.decrypt(str(encrypted, encoding="utf-8")) == "message"
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["fernet_per_call", "cached_fernet"])
+def test_fernet_decrypt(benchmark, fernet_crypt, cached):  # pylint: disable=redefined-outer-name
+    from cryptography.fernet import Fernet  # pylint: disable=import-outside-toplevel
+
+    encrypted = str(fernet_crypt.encrypt("message"), encoding="utf-8")
+    if cached:
+        decrypted = benchmark(fernet_crypt.decrypt, encrypted)
+    else:
+        decrypted = benchmark(lambda: Fernet(fernet_crypt.read_key()).decrypt(encrypted.encode()).decode())
+
+    assert decrypted == "message"
+
+
+@pytest.mark.parametrize("concurrent", [False, True], ids=["decrypt", "decrypt_many"])
+def test_fernet_batch(benchmark, fernet_crypt, concurrent):  # pylint: disable=redefined-outer-name
+    batch = [str(fernet_crypt.encrypt("message"), encoding="utf-8")] * MESSAGES
+    if concurrent:
+        decrypted = benchmark(fernet_crypt.decrypt_many, batch)
+    else:
+        decrypted = benchmark(lambda: [fernet_crypt.decrypt(value) for value in batch])
+
+    assert list(decrypted) == ["message"] * MESSAGES
+
+
+@pytest.mark.parametrize(
+    "values, concurrent, cached_data_key",
+    [
+        ("kms", False, False),
+        ("kms", True, False),
+        ("envelope", True, False),
+        ("envelope", True, True),
+    ],
+    ids=["kms_values_one_by_one", "kms_values_decrypt_many", "envelopes_no_cached_data_key", "envelopes"],
+)
+def test_kms_decrypt(benchmark, kms_crypt, values, concurrent, cached_data_key):  # pylint: disable=redefined-outer-name
+    """Decrypt 20 secrets with `pyms.cloud.aws.kms` and a KMS round trip of 20ms: each value encrypted directly with
+    KMS, one by one and with `decrypt_many`, compared with envelopes sharing a data key
+    """
+    from pyms.cloud.aws.kms import data_key_cache  # pylint: disable=import-outside-toplevel
+
+    secrets = ["secret{}".format(i) for i in range(SECRETS)]
+    if values == "kms":
+        encrypted = [str(base64.b64encode(secret.encode()), encoding="UTF-8") for secret in secrets]
+    else:
+        encrypted = [kms_crypt.encrypt(secret) for secret in secrets]
+
+    def decrypt():
+        if not cached_data_key:
+            data_key_cache.clear()
+        if concurrent:
+            return list(kms_crypt.decrypt_many(encrypted))
+        return [kms_crypt.decrypt(value) for value in encrypted]
+
+    assert benchmark.pedantic(decrypt, rounds=5) == secrets
@@ -0,0 +1,134 @@
+"""Hot paths of PyMS: the code that runs on every request, every log record or every lookup of the configuration.
+See `benchmarks/conftest.py` to run them and compare them with the baseline.
+"""
+
+import logging
+from unittest import mock
+
+import pytest
+import requests
+from flask import Response
+
+from pyms.config import ConfFile
+from pyms.flask.services import tracer as tracer_service
+from pyms.flask.services.metrics import FlaskMetricsWrapper
+from pyms.logger import CustomJsonFormatter
+
+CONFIG = {
+    "pyms": {
+        "services": {"requests": {"data": "data", "retries": 3, "propagate_headers": True}},
+        "config": {"app_name": "Benchmark", "subservice": {"timeout": 5, "hosts": ["a", "b"]}},
+    }
+}
+
+
+@pytest.fixture
+def request_context(microservice):
+    with microservice.application.test_request_context("/users/1", headers={"X-Request-Id": "1"}):
+        yield
+
+
+@pytest.fixture
+def tracer(microservice, monkeypatch):
+    """`FlaskTracing` with the mock tracer of opentracing in the app, like the tracer service sets it"""
+    opentracing = pytest.importorskip("opentracing")
+    flask_opentracing = pytest.importorskip("flask_opentracing")
+    mocktracer = pytest.importorskip("opentracing.mocktracer")
+    tracing = flask_opentracing.FlaskTracing(mocktracer.MockTracer())
+    monkeypatch.setattr(tracer_service, "opentracing", opentracing)
+    monkeypatch.setattr(microservice.application, "tracer", tracing, raising=False)
+    return tracing
+
+
+def test_conf_file_construction(benchmark):
+    conf = benchmark(ConfFile, config=CONFIG)
+
+    assert conf.pyms.config.app_name == "Benchmark"
+
+
+def test_conf_file_attribute_access(benchmark):
+    conf = ConfFile(config=CONFIG)
+
+    def access():
+        return conf.pyms.config.subservice.timeout
+
+    assert benchmark(access) == 5
+
+
+def test_driver_service_getattr(benchmark, microservice):
+    service = microservice.requests
+
+    def access():
+        return service.data, service.retries
+
+    assert benchmark(access) == ("data", service.default_values["retries"])
+
+
+def test_requests_get_headers(benchmark, microservice, request_context):  # pylint: disable=unused-argument
+    headers = benchmark(microservice.requests._get_headers, {"Accept": "application/json"}, True)
+
+    assert headers["Accept"] == "application/json"
+
+
+def test_requests_build_url(benchmark, microservice):
+    url = benchmark(microservice.requests._build_url, "http://localhost/users/{user_id}", {"user_id": 1})
+
+    assert url == "http://localhost/users/1"
+
+
+def test_requests_parse_response(benchmark, microservice, stub_server):
+    response = requests.get(stub_server.url, timeout=5)
+
+    assert benchmark(microservice.requests.parse_response, response)["id"] == 1
+
+
+def test_requests_get_for_object(benchmark, microservice, stub_server):
+    """The `ConfFile` objects built per call are saved in the `extra_info` of the benchmark"""
+    service = microservice.requests
+    url = stub_server.url + "/users/{user_id}"
+    with mock.patch.object(ConfFile, "__init__", autospec=True, side_effect=ConfFile.__init__) as init:
+        service.get_for_object(url, path_params={"user_id": 1})
+    benchmark.extra_info["conf_files_per_call"] = init.call_count
+
+    assert benchmark(service.get_for_object, url, path_params={"user_id": 1})["id"] == 1
+    assert benchmark.extra_info["conf_files_per_call"] == 0
+
+
+def test_metrics_hooks(benchmark, request_context):  # pylint: disable=unused-argument
+    wrapper = FlaskMetricsWrapper("Benchmark")
+    response = Response("{}", status=200)
+
+    def hooks():
+        wrapper.before_request()
+        return wrapper.after_request(response)
+
+    assert benchmark(hooks) is response
+
+
+def test_logger_add_fields(benchmark, request_context):  # pylint: disable=unused-argument
+    formatter = CustomJsonFormatter()
+    record = logging.LogRecord("pyms", logging.INFO, __file__, 1, "message", None, None)
+
+    def add_fields():
+        log_record = {}
+        formatter.add_fields(log_record, record, {})
+        return log_record
+
+    assert benchmark(add_fields)["severity"] == "INFO"
+
+
+def test_inject_span_in_headers(benchmark, microservice, request_context, tracer):  # pylint: disable=unused-argument
+    tracer._before_request_fn([])  # Span of the inbound request, started by `FlaskTracing` before each request
+    try:
+        headers = benchmark(microservice.requests.insert_trace_headers, {"Accept": "application/json"})
+    finally:
+        tracer._after_request_fn()
+
+    assert headers["Accept"] == "application/json"
+    assert "ot-tracer-traceid" in headers
+
+
+def test_create_app(benchmark, microservice):
+    app = benchmark.pedantic(microservice.create_app, rounds=100, warmup_rounds=5)
+
+    assert app.config["APP_NAME"] == "Benchmark"
@@ -0,0 +1,52 @@
+"""Cost of the outbound calls of `pyms.flask.services.requests.Service`. Each benchmark is parametrized with the
+previous implementation, to compare them in the same run.
+"""
+
+import pytest
+import requests
+
+from pyms.flask.services.http.template import compile_template
+from pyms.flask.services.requests import Service
+
+TEMPLATES = [
+    ("http://users-service/users", {}),
+    ("http://users-service/users/{user_id}", {"user_id": 123}),
+    (
+        "{base_url}/users/{user_id}/posts/{post_id}",
+        {"base_url": "http://users-service:8080", "user_id": 123, "post_id": "2020/01"},
+    ),
+]
+
+
+@pytest.mark.parametrize("pooled", [False, True], ids=["session_per_call", "pooled_session"])
+def test_requests_session(benchmark, microservice, stub_server, pooled):
+    """A new `requests.Session` per outbound call, compared with the pooled sessions of the service"""
+    service = microservice.requests
+    url = stub_server.url + "/users"
+
+    def new_session_per_call():
+        session = service.requests(session=requests.Session())
+        try:
+            return session.get(url)
+        finally:
+            session.close()
+
+    response = benchmark(lambda: service.get(url)) if pooled else benchmark(new_session_per_call)
+
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("implementation", ["format_map", "build_url", "compiled_template"])
+@pytest.mark.parametrize("template, path_params", TEMPLATES, ids=["no_path_params", "1_path_param", "3_path_params"])
+def test_url_templates(benchmark, template, path_params, implementation):
+    """`str.format_map`, the previous implementation of `Service._build_url`, compared with the compiled and cached
+    URL templates of `pyms.flask.services.http.template`
+    """
+    if implementation == "format_map":
+        url = benchmark(template.format_map, path_params)
+    elif implementation == "build_url":
+        url = benchmark(Service._build_url, template, path_params)  # pylint: disable=protected-access
+    else:
+        url = benchmark(compile_template(template).expand, path_params)
+
+    assert url.startswith("http://users-service")
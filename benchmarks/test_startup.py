@@ -0,0 +1,70 @@
+"""Startup cost of a microservice: the imports, the creation of the services and the load of the swagger. Each
+benchmark is parametrized with the previous implementation, to compare them in the same run.
+"""
+
+import os
+import shutil
+import subprocess  # nosec
+import sys
+from pathlib import Path
+
+import pytest
+
+from pyms.config import config_registry
+from tests.common import MyMicroserviceNoSingleton
+
+CONFIG = {
+    "pyms": {
+        "services": {"requests": {"data": "data"}, "requests_async": {"data": "data"}, "metrics": True},
+        "config": {"DEBUG": False, "TESTING": False, "APP_NAME": "Benchmark"},
+    }
+}
+
+SPEC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "swagger_for_tests")
+
+
+@pytest.mark.parametrize(
+    "code", ["pass", "import pyms.flask.app", "import pyms.cmd"], ids=["python", "pyms.flask.app", "pyms.cmd"]
+)
+def test_import(benchmark, code):
+    """Time to import `pyms.flask.app` and `pyms.cmd` in a new interpreter, compared with an empty one"""
+    process = benchmark.pedantic(subprocess.run, args=([sys.executable, "-c", code],), rounds=5)  # nosec
+
+    assert process.returncode == 0
+
+
+@pytest.mark.parametrize("access_services", [False, True], ids=["lazy_services", "all_services"])
+def test_create_microservice(benchmark, write_config, access_services):
+    """Create a `Microservice` whose services are created on the first access, compared with creating all of them"""
+    write_config(CONFIG)
+
+    def create_microservice():
+        config_registry.reload()
+        ms = MyMicroserviceNoSingleton()
+        ms.services = list(CONFIG["pyms"]["services"])
+        if access_services:
+            for service_name in ms.services:
+                getattr(ms, service_name)
+        return ms
+
+    assert benchmark(create_microservice).services == list(CONFIG["pyms"]["services"])
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["get_bundled_specs", "get_cached_specs"])
+def test_swagger_specs(benchmark, tmp_path, cached):
+    """Load the swagger of the tests resolving and validating it with prance, compared with loading it from the
+    cache built by `pyms merge-swagger --cache`, used with `spec_cache: true`
+    """
+    swagger = pytest.importorskip("pyms.flask.services.swagger")
+    spec_dir = str(tmp_path / "swagger")
+    shutil.copytree(SPEC_DIR, spec_dir)
+    cache_dir = str(tmp_path / "cache")
+    main_file = Path(spec_dir, "swagger.yaml")
+    swagger.merge_swagger_file(str(main_file), build_cache=True, cache_dir=cache_dir)
+
+    if cached:
+        specs = benchmark(swagger.get_cached_specs, main_file, cache_dir)
+    else:
+        specs = benchmark(swagger.get_bundled_specs, main_file)
+
+    assert specs["info"]
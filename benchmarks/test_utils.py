@@ -0,0 +1,88 @@
+"""Cost of the JSON backends and of the debug logs of the outbound calls. Each benchmark is parametrized with the
+previous implementation, to compare them in the same run.
+"""
+
+import logging
+import os
+
+import pytest
+
+from pyms.logger.lazy import log_debug
+from pyms.utils.json_backend import JSON_BACKENDS, STDLIB, get_backend
+
+SIZES = [1024, 100 * 1024, 1024 * 1024, 5 * 1024 * 1024]
+
+URL = "http://users-service/users"
+
+BODY = {"users": [{"id": i, "name": "Peter", "email": "peter@my-site.com", "password": "1234"} for i in range(200)]}
+
+HEADERS = {"Authorization": "Bearer 1234", "Content-Type": "application/json", "X-B3-TraceId": "1" * 32}
+
+
+def make_payload(size: int) -> dict:
+    """A `data` node with a list of users of about `size` bytes once serialized, like the responses parsed by
+    `pyms.flask.services.requests.Service.parse_response`
+    """
+    user = {
+        "id": 1,
+        "name": "Peter",
+        "email": "peter@my-site.com",
+        "active": True,
+        "score": 12.5,
+        "tags": ["admin", "staff"],
+        "address": {"street": "Fake street", "number": 123, "city": "Barcelona"},
+    }
+    return {"data": [dict(user, id=i) for i in range(max(size // 180, 1))]}
+
+
+@pytest.fixture
+def logger():
+    benchmark_logger = logging.getLogger("pyms-benchmark")
+    benchmark_logger.propagate = False
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        handler = logging.StreamHandler(devnull)
+        benchmark_logger.addHandler(handler)
+        yield benchmark_logger
+        benchmark_logger.removeHandler(handler)
+
+
+@pytest.mark.parametrize("backend_name", JSON_BACKENDS)
+@pytest.mark.parametrize("size", SIZES, ids=["1KB", "100KB", "1MB", "5MB"])
+def test_json_loads(benchmark, size, backend_name):
+    backend = get_backend(backend_name)
+    if backend is None:
+        pytest.skip("{} isn't installed".format(backend_name))
+    payload = make_payload(size)
+    encoded = get_backend(STDLIB).dumps_bytes(payload)
+
+    assert benchmark(backend.loads, encoded) == payload
+
+
+@pytest.mark.parametrize("backend_name", JSON_BACKENDS)
+@pytest.mark.parametrize("size", SIZES, ids=["1KB", "100KB", "1MB", "5MB"])
+def test_json_dumps(benchmark, size, backend_name):
+    backend = get_backend(backend_name)
+    if backend is None:
+        pytest.skip("{} isn't installed".format(backend_name))
+    payload = make_payload(size)
+
+    assert get_backend(STDLIB).loads(benchmark(backend.dumps_bytes, payload)) == payload
+
+
+@pytest.mark.parametrize("lazy", [False, True], ids=["str_format", "log_debug"])
+@pytest.mark.parametrize("level", [logging.INFO, logging.DEBUG], ids=["info", "debug"])
+def test_debug_log(benchmark, logger, level, lazy):  # pylint: disable=redefined-outer-name
+    """Debug message of an outbound POST with a large body. Compare the previous eager `str.format` with
+    `pyms.logger.lazy.log_debug`, which formats nothing when the level is disabled
+    """
+    logger.setLevel(level)
+
+    def eager():
+        logger.debug("Post with url {}, json {}, headers {}, kwargs {}".format(URL, BODY, HEADERS, {}))
+
+    if lazy:
+        benchmark(log_debug, logger, "Post with", url=URL, json=BODY, headers=HEADERS, kwargs={})
+    else:
+        benchmark(eager)
+
+    assert logger.isEnabledFor(logging.DEBUG) is (level == logging.DEBUG)
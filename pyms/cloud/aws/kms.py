@@ -1,8 +1,109 @@
+"""Encrypt and decrypt with [AWS KMS](https://aws.amazon.com/kms/). With `envelope: true` the messages are encrypted
+locally with AES-GCM and a data key generated by KMS, and stored with the data key encrypted by KMS:
+```
+pyms-envelope:v1:<encrypted data key>:<nonce>:<ciphertext>
+```
+A data key decrypts many values with a single call to KMS: the plain data keys are cached in memory for
+`data_key_max_age` seconds and `data_key_max_uses` messages. The values encrypted directly with KMS are still
+supported, and `decrypt_many` decrypts them concurrently.
+"""
+
 import base64
+import concurrent.futures
+import functools
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
+from pyms.config import config_registry
 from pyms.crypt.driver import CryptAbstract
 from pyms.utils import check_package_exists, import_package
 
+ENVELOPE_PREFIX = "pyms-envelope:v1:"
+
+DEFAULT_DATA_KEY_MAX_AGE = 300
+
+DEFAULT_DATA_KEY_MAX_USES = 1000
+
+NONCE_SIZE = 12
+
+
+class DataKey:
+    """Plain and encrypted data key, with its creation time and how many times it was used"""
+
+    __slots__ = ("plaintext", "encrypted", "created", "uses")
+
+    def __init__(self, plaintext: bytes, encrypted: bytes):
+        self.plaintext = plaintext
+        self.encrypted = encrypted
+        self.created = time.monotonic()
+        self.uses = 0
+
+
+class DataKeyCache:
+    """Data keys by KMS key and SHA-256 of the encrypted data key, plus the one used to encrypt new messages with
+    each KMS key. A data key expires after `max_age` seconds or `max_uses` messages, the next message gets a new one
+    from KMS.
+    """
+
+    def __init__(self):
+        self._keys: Dict[Any, DataKey] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(key_id: str, encrypted: bytes) -> Tuple[str, str]:
+        """Key of a data key to decrypt messages. A KMS key only gets the data keys it decrypted or generated"""
+        return key_id, hashlib.sha256(encrypted).hexdigest()
+
+    @staticmethod
+    def get_encryption_key(key_id: str) -> Tuple[str, str]:
+        """Key of the data key used to encrypt new messages with a KMS key"""
+        return key_id, "encryption"
+
+    def get(self, key: Any, max_age: float, max_uses: int) -> Optional[DataKey]:
+        """Data key if it hasn't expired. Each call counts as a use"""
+        with self._lock:
+            data_key = self._keys.get(key)
+            if data_key is None:
+                return None
+            if time.monotonic() - data_key.created >= max_age or data_key.uses >= max_uses:
+                del self._keys[key]
+                return None
+            data_key.uses += 1
+            return data_key
+
+    def set(self, key: Any, data_key: DataKey) -> None:
+        with self._lock:
+            data_key.uses += 1
+            self._keys[key] = data_key
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys.clear()
+
+
+# Shared by all the Crypt objects of the process, ConfFile builds one per node of the configuration
+data_key_cache = DataKeyCache()
+
+config_registry.subscribe(data_key_cache.clear)
+
+
+@functools.lru_cache(maxsize=None)
+def get_kms_client():  # pragma: no cover
+    """boto3 KMS client, created once. boto3 clients are thread safe"""
+    check_package_exists("boto3")
+    boto3 = import_package("boto3")
+    boto3.set_stream_logger(name="botocore")
+    return boto3.client("kms")
+
+
+def _b64encode(value: bytes) -> str:
+    return str(base64.b64encode(value), encoding="UTF-8")
+
 
 class Crypt(CryptAbstract):
     encryption_algorithm = "SYMMETRIC_DEFAULT"  # 'SYMMETRIC_DEFAULT' | 'RSAES_OAEP_SHA_1' | 'RSAES_OAEP_SHA_256'
@@ -12,31 +113,123 @@ class Crypt(CryptAbstract):
         self._init_boto()
         super().__init__(*args, **kwargs)
 
+    def get_setting(self, name: str, default: Any) -> Any:
+        if not self.config:
+            return default
+        return self.config.get(name, default)
+
     def encrypt(self, message: str) -> str:  # pragma: no cover
+        if self.get_setting("envelope", False):
+            return self.encrypt_envelope(message)
         ciphertext = self.client.encrypt(
             KeyId=self.config.key_id,
             Plaintext=bytes(message, encoding="UTF-8"),
         )
         return str(base64.b64encode(ciphertext["CiphertextBlob"]), encoding="UTF-8")
 
+    def encrypt_envelope(self, message: str) -> str:
+        """Encrypt with AES-GCM and a data key generated by KMS, reused while it doesn't expire"""
+        key_id = self.config.key_id
+        data_key = data_key_cache.get(data_key_cache.get_encryption_key(key_id), *self._get_data_key_limits())
+        if data_key is None:
+            response = self.client.generate_data_key(KeyId=key_id, KeySpec="AES_256")
+            data_key = DataKey(response["Plaintext"], response["CiphertextBlob"])
+            data_key_cache.set(data_key_cache.get_encryption_key(key_id), data_key)
+            # Decrypting the messages of this process doesn't need to call KMS
+            data_key_cache.set(
+                data_key_cache.get_key(key_id, data_key.encrypted), DataKey(data_key.plaintext, data_key.encrypted)
+            )
+        nonce = os.urandom(NONCE_SIZE)
+        ciphertext = AESGCM(data_key.plaintext).encrypt(
+            nonce, bytes(message, encoding="UTF-8"), ENVELOPE_PREFIX.encode()
+        )
+        return ENVELOPE_PREFIX + ":".join(_b64encode(value) for value in (data_key.encrypted, nonce, ciphertext))
+
+    def _get_data_key_limits(self) -> Tuple[float, int]:
+        return (
+            self.get_setting("data_key_max_age", DEFAULT_DATA_KEY_MAX_AGE),
+            self.get_setting("data_key_max_uses", DEFAULT_DATA_KEY_MAX_USES),
+        )
+
     def _init_boto(self) -> None:  # pragma: no cover
-        check_package_exists("boto3")
-        boto3 = import_package("boto3")
-        boto3.set_stream_logger(name="botocore")
-        self.client = boto3.client("kms")
+        self.client = get_kms_client()
 
     def _aws_decrypt(self, blob_text: bytes) -> str:  # pragma: no cover
+        return str(self._aws_decrypt_bytes(blob_text), encoding="UTF-8")
+
+    def _aws_decrypt_bytes(self, blob_text: bytes) -> bytes:
         response = self.client.decrypt(
             CiphertextBlob=blob_text, KeyId=self.config.key_id, EncryptionAlgorithm=self.encryption_algorithm
         )
-        return str(response["Plaintext"], encoding="UTF-8")
+        return response["Plaintext"]
 
     def _parse_encrypted(self, encrypted: str) -> bytes:
         blob_text = base64.b64decode(encrypted)
         return blob_text
 
+    @staticmethod
+    def _parse_envelope(encrypted: str) -> Tuple[bytes, bytes, bytes]:
+        """Encrypted data key, nonce and ciphertext of an envelope"""
+        encrypted_data_key, nonce, ciphertext = encrypted.replace(ENVELOPE_PREFIX, "", 1).split(":")
+        return base64.b64decode(encrypted_data_key), base64.b64decode(nonce), base64.b64decode(ciphertext)
+
+    @staticmethod
+    def is_envelope(encrypted: str) -> bool:
+        return encrypted.startswith(ENVELOPE_PREFIX)
+
+    def _get_plain_data_key(self, encrypted_data_key: bytes) -> bytes:
+        """Plain data key from the cache or, if it isn't cached or has expired, from KMS"""
+        key = data_key_cache.get_key(self.config.key_id, encrypted_data_key)
+        data_key = data_key_cache.get(key, *self._get_data_key_limits())
+        if data_key is None:
+            data_key = DataKey(self._aws_decrypt_bytes(encrypted_data_key), encrypted_data_key)
+            data_key_cache.set(key, data_key)
+        return data_key.plaintext
+
+    def decrypt_envelope(self, encrypted: str, plain_data_key: Optional[bytes] = None) -> str:
+        encrypted_data_key, nonce, ciphertext = self._parse_envelope(encrypted)
+        if plain_data_key is None:
+            plain_data_key = self._get_plain_data_key(encrypted_data_key)
+        return str(AESGCM(plain_data_key).decrypt(nonce, ciphertext, ENVELOPE_PREFIX.encode()), encoding="UTF-8")
+
     def decrypt(self, encrypted: str) -> str:
+        if self.is_envelope(encrypted):
+            return self.decrypt_envelope(encrypted)
         blob_text = self._parse_encrypted(encrypted)
         decrypted = self._aws_decrypt(blob_text)
 
         return decrypted
+
+    def decrypt_many(self, encrypted_values: List) -> List:
+        """Decrypt several values with one call to KMS per data key, plus one per value encrypted directly with
+        KMS. The calls are done concurrently, with up to `decrypt_workers` threads.
+        :param encrypted_values: ciphertexts
+        :return: list of decrypted values, in the same order
+        """
+        data_keys = {
+            self._parse_envelope(encrypted)[0] for encrypted in encrypted_values if self.is_envelope(encrypted)
+        }
+        calls = [functools.partial(self._get_plain_data_key, data_key) for data_key in data_keys]
+        calls += [
+            functools.partial(self.decrypt, encrypted)
+            for encrypted in encrypted_values
+            if not self.is_envelope(encrypted)
+        ]
+        results = iter(self._run(calls))
+        plain_data_keys = {data_key: next(results) for data_key in data_keys}
+        decrypted = results
+        return [
+            (
+                self.decrypt_envelope(encrypted, plain_data_keys[self._parse_envelope(encrypted)[0]])
+                if self.is_envelope(encrypted)
+                else next(decrypted)
+            )
+            for encrypted in encrypted_values
+        ]
+
+    def _run(self, calls: List) -> List:
+        if len(calls) <= 1:
+            return [call() for call in calls]
+        workers = min(self.decrypt_workers, len(calls))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pyms-kms") as pool:
+            return list(pool.map(lambda call: call(), calls))
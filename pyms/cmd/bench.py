@@ -0,0 +1,263 @@
+"""Benchmark the routes of a microservice, used by `pyms bench`. The app is created from a config file, or from
+`--app`, and driven in process through the test client of Flask (`wsgi` mode), or through a local server with
+one HTTP connection per request (`socket` mode). Each route reports its latency percentiles, its throughput and
+the memory allocated per request, measured with `tracemalloc` in a separate pass so tracing doesn't slow down the
+timed requests.
+
+```bash
+pyms bench --config config.yml --route /healthcheck --route /metrics --workers 4 --json
+```
+"""
+
+import http.client
+import math
+import os
+import platform
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Text
+
+from flask import Flask
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from pyms import __version__
+from pyms.constants import CONFIGMAP_FILE_ENVIRONMENT
+from pyms.flask.app import Microservice
+from pyms.utils import import_from
+
+BENCH_MODES = ("wsgi", "socket")
+
+DEFAULT_ROUTES = ["/healthcheck"]
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Don't log the requests of the benchmark"""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of `values`, which must be sorted"""
+    if not values:
+        return 0.0
+    rank = math.ceil(percent / 100 * len(values))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def load_app(config: Optional[Text] = None, app: Optional[Text] = None) -> Flask:
+    """
+    Create the Flask app to benchmark
+    :param config: path of the config file, `PYMS_CONFIGMAP_FILE` is used if it's not set
+    :param app: `module:name`, where `name` is a `Microservice` class, a Flask app or a function that returns any of
+    them. A `Microservice` of the current directory is created if it's not set
+    :return:
+    """
+    if config:
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = os.path.abspath(config)
+    application: Any = Microservice
+    if app:
+        module, _, name = app.partition(":")
+        application = import_from(module, name or "app")
+    if isinstance(application, type) and issubclass(application, Microservice):
+        application = application()
+    elif not isinstance(application, Flask) and callable(application):
+        application = application()
+    if isinstance(application, Microservice):
+        if config:
+            # Parse the config file again, it creates the app too
+            application.reload_conf()
+        else:
+            application.create_app()
+        application = application.application
+    return application
+
+
+def wsgi_client(app: Flask) -> Callable[[Text], int]:
+    client = app.test_client()
+
+    def get(route: Text) -> int:
+        return client.get(route).status_code
+
+    return get
+
+
+def socket_client(host: Text, port: int) -> Callable[[Text], int]:
+    def get(route: Text) -> int:
+        connection = http.client.HTTPConnection(host, port)
+        try:
+            connection.request("GET", route)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    return get
+
+
+def measure_latencies(
+    client_factory: Callable[[], Callable[[Text], int]], route: Text, requests: int, workers: int
+) -> Dict[str, Any]:
+    """Send `requests` GET requests to `route` from `workers` threads, each one with its own client
+    :return: latencies in seconds, errors and elapsed seconds
+    """
+    counts = [requests // workers + (1 if i < requests % workers else 0) for i in range(workers)]
+
+    def worker(count: int):
+        get = client_factory()
+        latencies, errors = [], 0
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                status = get(route)
+            except (OSError, http.client.HTTPException):
+                status = 0
+            latencies.append(time.perf_counter() - start)
+            if not 200 <= status < 400:
+                errors += 1
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pyms-bench") as executor:
+        results = list(executor.map(worker, counts))
+    elapsed = time.perf_counter() - start
+    return {
+        "latencies": sorted(latency for latencies, _ in results for latency in latencies),
+        "errors": sum(errors for _, errors in results),
+        "seconds": elapsed,
+    }
+
+
+def measure_allocations(app: Flask, route: Text, requests: int) -> Dict[str, float]:
+    """Mean peak and retained bytes allocated by a request to `route`, sent one by one with the test client. The
+    tracing is started and stopped around each request to reset the peak. If it was already started, i.e. by
+    `python -X tracemalloc`, it's left running and the peak is reset with `tracemalloc.reset_peak`, which needs
+    Python 3.9: before, the peak can include the allocations of the previous requests
+    """
+    get = wsgi_client(app)
+    start_tracing = not tracemalloc.is_tracing()
+    peaks, retained = [], []
+    for _ in range(requests):
+        if start_tracing:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            get(route)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if start_tracing:
+                tracemalloc.stop()
+        peaks.append(max(peak - before, 0))
+        retained.append(current - before)
+    return {
+        "alloc_peak_bytes": statistics.mean(peaks) if peaks else 0.0,
+        "alloc_retained_bytes": statistics.mean(retained) if retained else 0.0,
+    }
+
+
+def bench_route(
+    client_factory: Callable[[], Callable[[Text], int]], route: Text, requests: int, workers: int, warmup: int
+) -> Dict[str, Any]:
+    if warmup:
+        measure_latencies(client_factory, route, warmup, 1)
+    measured = measure_latencies(client_factory, route, requests, workers)
+    latencies = [latency * 1000 for latency in measured["latencies"]]
+    return {
+        "route": route,
+        "requests": requests,
+        "errors": measured["errors"],
+        "seconds": measured["seconds"],
+        "throughput": requests / measured["seconds"] if measured["seconds"] else 0.0,
+        "latency_ms": {
+            "mean": statistics.mean(latencies) if latencies else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else 0.0,
+        },
+    }
+
+
+def run_bench(  # pylint: disable=too-many-positional-arguments
+    app: Flask,
+    routes: Optional[List[Text]] = None,
+    requests: int = 1000,
+    workers: int = 1,
+    mode: Text = "wsgi",
+    warmup: int = 10,
+    alloc_requests: int = 50,
+) -> Dict[str, Any]:
+    """
+    Benchmark `routes` of `app`
+    :param app: Flask app
+    :param routes: paths to request with GET, `/healthcheck` by default
+    :param requests: requests per route
+    :param workers: concurrent threads sending the requests
+    :param mode: `wsgi` to call the app in process, `socket` to call it through a local HTTP server
+    :param warmup: requests per route sent before measuring
+    :param alloc_requests: requests per route to measure the allocations, 0 to skip it
+    :return: dict serializable to JSON
+    """
+    if mode not in BENCH_MODES:
+        raise ValueError("Unknown bench mode {}, use one of {}".format(mode, ", ".join(BENCH_MODES)))
+    routes = routes or DEFAULT_ROUTES
+    workers = max(workers, 1)
+    server = None
+    if mode == "socket":
+        server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietRequestHandler)
+        threading.Thread(target=server.serve_forever, name="pyms-bench-server", daemon=True).start()
+        host, port = server.server_address[:2]
+
+        def client_factory():
+            return socket_client(host, port)
+
+    else:
+
+        def client_factory():
+            return wsgi_client(app)
+
+    try:
+        results = [bench_route(client_factory, route, requests, workers, warmup) for route in routes]
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    if alloc_requests:
+        for result in results:
+            result.update(measure_allocations(app, result["route"], alloc_requests))
+    return {
+        "pyms": __version__,
+        "python": platform.python_version(),
+        "mode": mode,
+        "workers": workers,
+        "routes": results,
+    }
+
+
+def format_results(results: Dict[str, Any]) -> Text:
+    lines = [
+        "mode: {mode}, workers: {workers}".format(**results),
+        "{:<30} {:>8} {:>7} {:>10} {:>9} {:>9} {:>9} {:>12}".format(
+            "route", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms", "alloc bytes"
+        ),
+    ]
+    for result in results["routes"]:
+        lines.append(
+            "{:<30} {:>8} {:>7} {:>10.1f} {:>9.3f} {:>9.3f} {:>9.3f} {:>12.0f}".format(
+                result["route"],
+                result["requests"],
+                result["errors"],
+                result["throughput"],
+                result["latency_ms"]["p50"],
+                result["latency_ms"]["p95"],
+                result["latency_ms"]["p99"],
+                result.get("alloc_peak_bytes", 0.0),
+            )
+        )
+    return "\n".join(lines)
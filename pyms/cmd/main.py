@@ -2,13 +2,12 @@
 from __future__ import print_function, unicode_literals
 
 import argparse
+import json
 import os
 import sys
 
 from pyms.config import create_conf_file
-from pyms.crypt.fernet import Crypt
-from pyms.flask.services.swagger import merge_swagger_file
-from pyms.utils import check_package_exists, import_from, utils
+from pyms.utils import check_package_exists, import_from, import_package, utils
 
 
 def _asbool(value):
@@ -24,6 +23,46 @@ def _asbool(value):
 
     return value.lower() in ("true", "1")
 
+
+def _add_bench_parser(commands):
+    parser_bench = commands.add_parser("bench", help="Benchmark the routes of a microservice")
+    parser_bench.add_argument("bench", action="store_true", help="Benchmark the routes of a microservice")
+    parser_bench.add_argument("-c", "--config", help="Config file path, PYMS_CONFIGMAP_FILE by default")
+    parser_bench.add_argument(
+        "-a", "--app", help="module:name of a Microservice class, a Flask app or a function that returns them"
+    )
+    parser_bench.add_argument(
+        "-r", "--route", action="append", dest="routes", help="Route to request with GET, /healthcheck by default"
+    )
+    parser_bench.add_argument("-n", "--requests", default=1000, type=int, help="Requests per route")
+    parser_bench.add_argument("-w", "--workers", default=1, type=int, help="Concurrent workers")
+    parser_bench.add_argument(
+        "-m", "--mode", default="wsgi", choices=["wsgi", "socket"], help="Call the app in process or by HTTP"
+    )
+    parser_bench.add_argument("--warmup", default=10, type=int, help="Requests per route before measuring")
+    parser_bench.add_argument(
+        "--alloc-requests", default=50, type=int, help="Requests per route to measure allocations, 0 to skip it"
+    )
+    parser_bench.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser_bench.add_argument("-o", "--output", help="Write the results as JSON to this file")
+
+
+def _get_bench_args(args):
+    return {
+        "app": {"config": args.config, "app": args.app},
+        "options": {
+            "routes": args.routes,
+            "requests": args.requests,
+            "workers": args.workers,
+            "mode": args.mode,
+            "warmup": args.warmup,
+            "alloc_requests": args.alloc_requests,
+        },
+        "json": args.json,
+        "output": args.output,
+    }
+
+
 class Command:
     config = None
 
@@ -69,6 +108,18 @@ class Command:
         parser_merge_swagger.add_argument(
             "-f", "--file", default=os.path.join("project", "swagger", "swagger.yaml"), help="Swagger file path"
         )
+        parser_merge_swagger.add_argument(
+            "-c",
+            "--cache",
+            action="store_true",
+            help="Build the cache of the resolved swagger, used by the app with spec_cache instead of resolving it "
+            "on startup",
+        )
+        parser_merge_swagger.add_argument(
+            "--cache-dir", help="Directory of the cache, the spec_cache_dir of the app. ~/.cache/pyms by default"
+        )
+
+        _add_bench_parser(commands)
 
         parser_create_config = commands.add_parser("create-config", help="Generate a config file")
         parser_create_config.add_argument("create_config", action="store_true", help="Generate a config file")
@@ -89,11 +140,12 @@ class Command:
             self.branch = args.branch
         except AttributeError:
             self.startproject = False
-        try:
-            self.merge_swagger = args.merge_swagger
-            self.file = args.file
-        except AttributeError:
-            self.merge_swagger = False
+        self.merge_swagger = (
+            {"main_file": args.file, "build_cache": args.cache, "cache_dir": args.cache_dir}
+            if args.command_name == "merge-swagger"
+            else False
+        )
+        self.bench = _get_bench_args(args) if args.command_name == "bench" else False
         try:
             self.create_config = args.create_config
         except Exception:
@@ -111,7 +163,8 @@ class Command:
         return input(msg)  # nosec
 
     def run(self):
-        crypt = Crypt()
+        # The crypt and the swagger service are imported only by the commands that use them
+        crypt = import_from("pyms.crypt.fernet", "Crypt")() if self.create_key or self.encrypt else None
         if self.create_key:
             path = crypt._loader.get_path_from_env()  # pylint: disable=protected-access
             pwd = self.get_input("Type a password to generate the key file: ")
@@ -136,11 +189,14 @@ class Command:
             self.print_ok("Created project OK")
         if self.merge_swagger:
             try:
-                merge_swagger_file(main_file=self.file)
+                merge_swagger_file = import_from("pyms.flask.services.swagger", "merge_swagger_file")
+                merge_swagger_file(**self.merge_swagger)
                 self.print_ok("Swagger file generated [swagger-complete.yaml]")
             except FileNotFoundError as ex:
                 self.print_error(ex.__str__())
                 return False
+        if self.bench and not self.run_bench():
+            return False
         if self.create_config:
             use_requests = self.yes_no_input("Do you want to use request")
             use_swagger = self.yes_no_input("Do you want to use swagger")
@@ -153,6 +209,21 @@ class Command:
                 return False
         return True
 
+    def run_bench(self):
+        bench = import_package("pyms.cmd.bench")
+        results = bench.run_bench(bench.load_app(**self.bench["app"]), **self.bench["options"])
+        if self.bench["output"]:
+            with open(self.bench["output"], "w", encoding="utf-8") as output_file:
+                json.dump(results, output_file, indent=2)
+        if self.bench["json"]:
+            print(json.dumps(results, indent=2))
+        else:
+            print(bench.format_results(results))
+        if any(result["errors"] for result in results["routes"]):
+            self.print_error("Some requests failed")
+            return False
+        return True
+
     def yes_no_input(self, msg=""):  # pragma: no cover
         answer = input(  # nosec
             utils.colored_text(f'{msg}{"?" if not msg.endswith("?") else ""} [Y/n] :', utils.Colors.BLUE, True)
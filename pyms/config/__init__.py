@@ -1,4 +1,6 @@
 from .conf import create_conf_file, get_conf
 from .confile import ConfFile
+from .registry import ConfigRegistry, config_registry
+from .watcher import FileWatcher
 
-__all__ = ["get_conf", "create_conf_file", "ConfFile"]
+__all__ = ["get_conf", "create_conf_file", "ConfFile", "ConfigRegistry", "config_registry", "FileWatcher"]
@@ -4,7 +4,8 @@ from typing import Union
 
 import yaml
 
-from pyms.config.confile import ConfFile
+from pyms.config.confile import ConfFile  # noqa: F401 pylint: disable=unused-import
+from pyms.config.registry import config_registry
 from pyms.constants import (
     CONFIGMAP_FILE_ENVIRONMENT,
     CONFIGMAP_FILE_ENVIRONMENT_LEGACY,
@@ -23,7 +24,8 @@ logger = logging.getLogger(LOGGER_NAME)
 def get_conf(*args, **kwargs):
     """
     Returns an object with a set of attributes retrieved from the configuration file. Each subblock is a append of the
-    parent and this name, in example of the next yaml, tracer will be `pyms.tracer`. If we have got his config file:
+    parent and this name, in example of the next yaml, tracer will be `pyms.tracer`. The file is parsed once and
+    shared, see `pyms.config.registry`. If we have got his config file:
     See these docs:
     * https://python-microservices.github.io/configuration/
     * https://python-microservices.github.io/services/
@@ -35,13 +37,13 @@ def get_conf(*args, **kwargs):
     service = kwargs.pop("service", None)
     if not service:
         raise ServiceDoesNotExistException("Service not defined")
-    config = ConfFile(*args, **kwargs)
+    config = config_registry.get(*args, **kwargs)
     return getattr(config, service)
 
 
 def validate_conf(*args, **kwargs):
 
-    config = ConfFile(*args, **kwargs)
+    config = config_registry.get(*args, **kwargs)
     is_config_ok = True
     try:
         config.pyms
@@ -3,9 +3,7 @@
 import logging
 import os
 import re
-from typing import Dict, Iterable, Text, Tuple, Union
-
-import anyconfig
+from typing import Dict, Iterable, Optional, Text, Tuple, Union
 
 from pyms.constants import (
     CONFIGMAP_FILE_ENVIRONMENT,
@@ -13,12 +11,19 @@ from pyms.constants import (
     DEFAULT_CONFIGMAP_FILENAME,
     LOGGER_NAME,
 )
+from pyms.config.decrypt import decrypt, decrypt_many, find_encrypted
 from pyms.exceptions import AttrDoesNotExistException, ConfigDoesNotFoundException
 from pyms.utils.files import LoadFile
+from pyms.utils.utils import import_package
 
 logger = logging.getLogger(LOGGER_NAME)
 
 
+def load_file(path: Text) -> Dict:
+    """Parse a yaml or json file. anyconfig is imported with the first file, not with this module"""
+    return import_package("anyconfig").load(path)
+
+
 class ConfFile(dict):
     """Recursive get configuration from dictionary, a config file in JSON or YAML format from a path or
     `PYMS_CONFIGMAP_FILE` environment variable.
@@ -42,28 +47,35 @@ class ConfFile(dict):
             self[key] = getattr(obj, key)
         ```
         """
-        # TODO Remove temporally backward compatibility on future versions
-        configmap_file_env = self.__get_updated_configmap_file_env()  # Temporally backward compatibility
-
-        self._loader = LoadFile(kwargs.get("path"), configmap_file_env, DEFAULT_CONFIGMAP_FILENAME)
+        self._loader = self.get_loader(kwargs.get("path"))
         self._crypt_cls = kwargs.get("crypt")
         if self._crypt_cls:
             self._crypt = self._crypt_cls(path=kwargs.get("path"))
         self._empty_init = kwargs.get("empty_init", False)
         config = kwargs.get("config")
         if config is None:
-            config = self._loader.get_file(anyconfig.load)
+            config = self._loader.get_file(load_file)
         if not config:
             if self._empty_init:
                 config = {}
             else:
                 path = self._loader.path if self._loader.path else ""
                 raise ConfigDoesNotFoundException("Configuration file {}not found".format(path + " "))
+        elif self._crypt and kwargs.get("config") is None:
+            # Decrypt all the secrets of the file at once, the nested ConfFile get them from the cache
+            decrypt_many(self._crypt, find_encrypted(config))
 
         config = self.set_config(config)
 
         super().__init__(config)
 
+    @classmethod
+    def get_loader(cls, path: Optional[Text] = None) -> LoadFile:
+        """Loader of the config file from the `PYMS_CONFIGMAP_FILE` environment variable or from `path`"""
+        # TODO Remove temporally backward compatibility on future versions
+        configmap_file_env = cls.__get_updated_configmap_file_env()  # Temporally backward compatibility
+        return LoadFile(path, configmap_file_env, DEFAULT_CONFIGMAP_FILENAME)
+
     def to_flask(self) -> Dict:
         return ConfFile(config={k.upper(): v for k, v in self.items()}, crypt=self._crypt_cls)
 
@@ -81,7 +93,7 @@ class ConfFile(dict):
             if k.lower().startswith("enc_"):
                 k_not_crypt = re.compile(re.escape("enc_"), re.IGNORECASE)
                 decrypted_key = k_not_crypt.sub("", k)
-                decrypted_value = self._crypt.decrypt(v) if self._crypt else None
+                decrypted_value = decrypt(self._crypt, v) if self._crypt else None
                 setattr(self, decrypted_key, decrypted_value)
                 add_decripted_keys.append((decrypted_key, decrypted_value))
                 pop_encripted_keys.append(k)
@@ -131,7 +143,7 @@ class ConfFile(dict):
         Remove file from memoize variable, return again the content of the file and set the configuration again
         :return: None
         """
-        config_src = self._loader.reload(anyconfig.load)
+        config_src = self._loader.reload(load_file)
         self.set_config(config_src)
 
     def __setattr__(self, name, value, *args, **kwargs):
@@ -0,0 +1,109 @@
+"""Process-wide cache of the decrypted `enc_` values of the configuration. A secret is decrypted once, even if the
+config tree is built several times, and the secrets of a config file are decrypted concurrently with
+`decrypt_many`, so with `pyms.cloud.aws.kms` the startup waits one round trip to KMS instead of one per secret.
+The cache is cleared by `pyms.config.config_registry.reload` and `publish`, and a `stage` uses an empty one.
+"""
+
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+ENCRYPTED_PREFIX = "enc_"
+
+
+class DecryptCache:
+    """Decrypted values by crypt class and SHA-256 of the ciphertext. The plain ciphertexts aren't kept"""
+
+    def __init__(self):
+        self._values: Dict[Tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+        self._staging = threading.local()
+
+    def _get_values(self) -> Dict[Tuple[str, str], Any]:
+        staged = getattr(self._staging, "values", None)
+        return self._values if staged is None else staged
+
+    @contextmanager
+    def stage(self) -> Iterator[None]:
+        """Use an empty cache in the current thread inside the block, like `pyms.config.config_registry.stage`: the
+        staged config decrypts its secrets again, with the current keys, and doesn't add them to the shared cache
+        :return: None
+        """
+        previous = getattr(self._staging, "values", None)
+        self._staging.values = {}
+        try:
+            yield
+        finally:
+            self._staging.values = previous
+
+    @staticmethod
+    def get_key(crypt, encrypted: Any) -> Tuple[str, str]:
+        crypt_class = type(crypt)
+        digest = hashlib.sha256(str(encrypted).encode()).hexdigest()
+        return "{}.{}".format(crypt_class.__module__, crypt_class.__qualname__), digest
+
+    def get(self, key: Tuple[str, str], default: Any = None) -> Any:
+        return self._get_values().get(key, default)
+
+    def set(self, key: Tuple[str, str], value: Any) -> None:
+        with self._lock:
+            self._get_values()[key] = value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def __len__(self):
+        return len(self._get_values())
+
+
+decrypt_cache = DecryptCache()
+
+_MISSING = object()
+
+
+def decrypt(crypt, encrypted: Any) -> Any:
+    """Decrypt a value with `crypt`, or return it from the cache if it was already decrypted"""
+    return decrypt_many(crypt, [encrypted])[0]
+
+
+def decrypt_many(crypt, encrypted_values: Iterable[Any]) -> List[Any]:
+    """Decrypt several values with `crypt`. The values not in the cache are decrypted together with
+    `crypt.decrypt_many`, if the crypt has it, see `pyms.crypt.driver.CryptAbstract.decrypt_many`.
+
+    :param crypt: crypt object with a `decrypt` method
+    :param encrypted_values: ciphertexts
+    :return: list of decrypted values, in the same order
+    """
+    encrypted_values = list(encrypted_values)
+    keys = [decrypt_cache.get_key(crypt, encrypted) for encrypted in encrypted_values]
+    values = {}
+    missing = {}
+    for key, encrypted in zip(keys, encrypted_values):
+        value = decrypt_cache.get(key, _MISSING)
+        if value is _MISSING:
+            missing[key] = encrypted
+        else:
+            values[key] = value
+    if missing:
+        if hasattr(crypt, "decrypt_many"):
+            decrypted_values = crypt.decrypt_many(list(missing.values()))
+        else:
+            decrypted_values = [crypt.decrypt(encrypted) for encrypted in missing.values()]
+        for key, decrypted in zip(missing, decrypted_values):
+            decrypt_cache.set(key, decrypted)
+            values[key] = decrypted
+    return [values[key] for key in keys]
+
+
+def find_encrypted(config: Any) -> List[Any]:
+    """Values of the `enc_` keys of a configuration dictionary and its nested dictionaries"""
+    encrypted_values = []
+    if isinstance(config, dict):
+        for key, value in config.items():
+            if isinstance(key, str) and key.lower().startswith(ENCRYPTED_PREFIX):
+                encrypted_values.append(value)
+            else:
+                encrypted_values.extend(find_encrypted(value))
+    return encrypted_values
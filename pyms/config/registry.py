@@ -0,0 +1,166 @@
+"""Process-wide registry of the parsed configuration. The config file is parsed and normalized once in a `ConfFile`
+tree; `get_conf` and every `ConfigResource` (the `Microservice`, `CryptResource`, `ServicesResource` and each
+service) get shared sub-views of the same tree instead of building a new one.
+"""
+
+import logging
+import os
+import threading
+import types
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from pyms.config.confile import ConfFile
+from pyms.config.decrypt import decrypt_cache
+from pyms.constants import LOGGER_NAME
+from pyms.utils import files
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class ConfigRegistry:
+    """Cache of `ConfFile` trees by resolved config file, crypt, path and `empty_init`. A tree is built again if its file
+    changes (modification time, size or inode) and all of them after `reload`. The trees can also be built apart
+    with `stage` and replace the current ones at once with `publish`.
+    """
+
+    def __init__(self):
+        self._trees: Dict[Hashable, Tuple[Optional[str], Optional[Tuple[int, int, int]], ConfFile]] = {}
+        # Signature of each file when its content was read into `files.files_cached`
+        self._files: Dict[str, Optional[Tuple[int, int, int]]] = {}
+        self._subscribers: List[weakref.ref] = []
+        self._lock = threading.RLock()
+        self._staging = threading.local()
+
+    @staticmethod
+    def _get_signature(path: Optional[str]) -> Optional[Tuple[int, int, int]]:
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    @staticmethod
+    def _get_crypt_key(crypt) -> Hashable:
+        """Crypt classes and functions identify themselves. Instances, like the `CryptResource` of each
+        `Microservice`, are identified by their class and the class of the crypt they build, which depends on their
+        own, maybe outdated, configuration"""
+        if crypt is None or isinstance(crypt, (type, types.FunctionType)):
+            return crypt
+        get_crypt_class = getattr(crypt, "get_crypt_class", None)
+        return type(crypt), get_crypt_class() if get_crypt_class else None
+
+    def get(self, *args, **kwargs) -> ConfFile:
+        """Root `ConfFile` of the configuration, with the same arguments as `ConfFile`. A dictionary passed with
+        `config` isn't cached.
+        :return: ConfFile
+        """
+        if args or kwargs.get("config") is not None:
+            return ConfFile(*args, **kwargs)
+        path = ConfFile.get_loader(kwargs.get("path")).get_path()
+        key = (
+            os.path.abspath(path) if path else None,
+            self._get_crypt_key(kwargs.get("crypt")),
+            kwargs.get("path"),
+            kwargs.get("empty_init", False),
+        )
+        signature = self._get_signature(path)
+        staged = getattr(self._staging, "trees", None)
+        with self._lock:
+            if staged is not None:
+                return self._get_staged(staged, key, path, signature, kwargs)
+            cached = self._trees.get(key)
+            if cached is not None and cached[1] == signature:
+                return cached[2]
+            if path and self._files.get(path, signature) != signature:
+                logger.debug("Config file %s changed, parsing it again", path)
+                files.files_cached.pop(path, None)
+            if path:
+                self._files[path] = signature
+            tree = ConfFile(**kwargs)
+            self._trees[key] = (path, signature, tree)
+            return tree
+
+    @staticmethod
+    def _get_staged(staged: Dict, key: Hashable, path: Optional[str], signature, kwargs) -> ConfFile:
+        cached = staged.get(key)
+        if cached is not None:
+            return cached[2]
+        if path and path not in {staged_path for staged_path, _, _ in staged.values()}:
+            files.files_cached.pop(path, None)
+        tree = ConfFile(**kwargs)
+        staged[key] = (path, signature, tree)
+        return tree
+
+    @contextmanager
+    def stage(self) -> Iterator[Dict]:
+        """Parse the config files again in the current thread without replacing the current trees: inside the block,
+        `get` of this thread returns new trees and the other threads keep the current ones. The secrets are decrypted
+        again in a cache of the stage, see `pyms.config.decrypt.DecryptCache.stage`.
+        ```python
+        with config_registry.stage() as trees:
+            config = get_conf(service="pyms.config")
+        config_registry.publish(trees)
+        ```
+        :return: the staged trees, to pass to `publish`
+        """
+        trees: Dict = {}
+        previous = getattr(self._staging, "trees", None)
+        self._staging.trees = trees
+        try:
+            with decrypt_cache.stage():
+                yield trees
+        finally:
+            self._staging.trees = previous
+
+    def publish(self, trees: Dict) -> None:
+        """Replace the parsed trees with the ones built in `stage`, discard the decrypted secrets and notify the
+        subscribers
+        :param trees: trees of `stage`
+        :return: None
+        """
+        self._replace(trees)
+
+    def reload(self) -> None:
+        """Discard the parsed trees, the content of the config files and the decrypted secrets, and notify the
+        subscribers
+        :return: None
+        """
+        self._replace({})
+
+    def _replace(self, trees: Dict) -> None:
+        with self._lock:
+            staged_paths = {path for path, _, _ in trees.values() if path}
+            for path, _, _ in self._trees.values():
+                if path and path not in staged_paths:
+                    files.files_cached.pop(path, None)
+            self._trees = dict(trees)
+            self._files = {path: signature for path, signature, _ in trees.values() if path}
+            decrypt_cache.clear()
+            subscribers = [ref() for ref in self._subscribers]
+            self._subscribers = [ref for ref, callback in zip(self._subscribers, subscribers) if callback is not None]
+        for callback in subscribers:
+            if callback is not None:
+                callback()
+
+    def subscribe(self, callback: Callable[[], None]) -> None:
+        """Call `callback` after each `reload`, once even if it's subscribed again. The registry keeps a weak
+        reference, it doesn't keep alive the object of a bound method
+        :param callback: function or bound method without arguments
+        :return: None
+        """
+        ref = weakref.WeakMethod(callback) if hasattr(callback, "__self__") else weakref.ref(callback)
+        with self._lock:
+            if ref not in self._subscribers:
+                self._subscribers.append(ref)
+
+    def clear(self) -> None:
+        """Discard the parsed trees without notifying the subscribers"""
+        with self._lock:
+            self._trees.clear()
+
+
+config_registry = ConfigRegistry()
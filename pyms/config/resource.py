@@ -7,5 +7,25 @@ class ConfigResource:
 
     config_resource: Text = ""
 
+    _config_args: tuple = ()
+
+    _config_kwargs: dict = {}
+
     def __init__(self, *args, **kwargs):
-        self.config = get_conf(service=self.config_resource, empty_init=True, uppercase=False, *args, **kwargs)
+        self._config_args = args
+        self._config_kwargs = kwargs
+        self.set_config(self.get_config())
+
+    def get_config(self):
+        return get_conf(
+            service=self.config_resource, empty_init=True, uppercase=False, *self._config_args, **self._config_kwargs
+        )
+
+    def set_config(self, config) -> None:
+        self.config = config
+
+    def reload_config(self) -> None:
+        """Get the configuration again, subscribe it to `pyms.config.config_registry` to call it after a reload
+        :return: None
+        """
+        self.set_config(self.get_config())
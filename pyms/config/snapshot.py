@@ -0,0 +1,129 @@
+"""Read-only copy of a `ConfFile`, compiled once. Every dotted name (`services.requests.data`) is resolved when the
+snapshot is built, so a lookup is a single dictionary access and a missing key returns a shared sentinel instead of
+building a new empty `ConfFile`. A new snapshot is compiled when the configuration is reloaded; readers keep the
+one they have until the reference is replaced.
+"""
+
+from typing import Any, Dict, Mapping
+
+from pyms.exceptions import AttrDoesNotExistException
+
+
+class _Missing:
+    """Sentinel of the keys that don't exist in the configuration"""
+
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return "MISSING"
+
+
+MISSING = _Missing()
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError("{} is read-only".format(type(self).__name__))
+
+
+class ConfigSnapshot(dict):
+    """Immutable configuration node. It's a `dict`, so the code that receives a `ConfFile` works with it, but it
+    can't be modified.
+    **Atributes:**
+    * empty_init: Return an empty node instead of raising `AttrDoesNotExistException` if a key doesn't exist
+    """
+
+    __slots__ = ("_flat", "empty_init")
+
+    def __init__(self, config: Mapping, empty_init: bool = False):
+        super().__init__((key, compile_value(value, empty_init)) for key, value in config.items())
+        flat: Dict[str, Any] = {}
+        for key, value in dict.items(self):
+            flat[key] = value
+            if isinstance(value, ConfigSnapshot):
+                for name, item in value._flat.items():  # pylint: disable=protected-access
+                    flat[key + "." + name] = item
+        object.__setattr__(self, "_flat", flat)
+        object.__setattr__(self, "empty_init", empty_init)
+
+    def get_value(self, name: str) -> Any:
+        """Value of a key or a dotted path of keys, `MISSING` if it doesn't exist"""
+        value = self._flat.get(name, MISSING)
+        if value is MISSING and "-" in name:
+            value = self._flat.get(name.replace("-", "_"), MISSING)
+        return value
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        value = self.get_value(name)
+        if value is MISSING:
+            if self.empty_init:
+                return EMPTY
+            raise AttrDoesNotExistException("Variable {} not exist in the config file".format(name))
+        return value
+
+    def __reduce__(self):
+        return type(self), (dict(self), self.empty_init)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    __setattr__ = _read_only
+    __delattr__ = _read_only
+    __setitem__ = _read_only
+    __delitem__ = _read_only
+    clear = _read_only
+    pop = _read_only
+    popitem = _read_only
+    setdefault = _read_only
+    update = _read_only
+    __ior__ = _read_only
+
+
+class FrozenList(list):
+    """Immutable list of a `ConfigSnapshot`, equal to the list of the `ConfFile`"""
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return type(self), (list(self),)
+
+    __setitem__ = _read_only
+    __delitem__ = _read_only
+    __iadd__ = _read_only
+    __imul__ = _read_only
+    append = _read_only
+    clear = _read_only
+    extend = _read_only
+    insert = _read_only
+    pop = _read_only
+    remove = _read_only
+    reverse = _read_only
+    sort = _read_only
+
+
+# Value of the missing keys when `empty_init` is enabled. It's immutable, so all the lookups share it
+EMPTY = ConfigSnapshot({}, empty_init=True)
+
+
+def compile_value(value: Any, empty_init: bool = False) -> Any:
+    """Immutable copy of a configuration value: dictionaries are compiled to `ConfigSnapshot` and lists to
+    `FrozenList`"""
+    if isinstance(value, ConfigSnapshot):
+        return value
+    if isinstance(value, Mapping):
+        return ConfigSnapshot(value, empty_init=empty_init)
+    if isinstance(value, list):
+        return FrozenList(compile_value(item, empty_init) for item in value)
+    return value
+
+
+def compile_config(config: Mapping) -> ConfigSnapshot:
+    """Compile a `ConfFile`, or any dictionary, to a `ConfigSnapshot`"""
+    return ConfigSnapshot(config, empty_init=getattr(config, "_empty_init", False))
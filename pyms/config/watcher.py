@@ -0,0 +1,145 @@
+"""Watch the config file and the key file and call a function when they change, to reload the configuration without
+calling `/reload-config`. The files are polled every `interval` seconds; with
+[inotify_simple](https://github.com/chrisjbillington/inotify_simple) installed the watcher wakes up as soon as the
+directory of a file changes.
+
+A change is applied when the files have been stable for `debounce` seconds: Kubernetes updates a configmap volume
+writing a new directory and swapping the `..data` symlink, the watcher follows the symlinks and waits for the swap to
+finish instead of reloading a half updated configuration.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pyms.constants import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+DEFAULT_WATCH_INTERVAL = 2.0
+
+DEFAULT_WATCH_DEBOUNCE = 1.0
+
+Signature = Optional[Tuple[str, int, int, int]]
+
+
+def get_signature(path: str) -> Signature:
+    """Real path, modification time, size and inode of the file `path` points to, None if it doesn't exist"""
+    real_path = os.path.realpath(path)
+    try:
+        stat = os.stat(real_path)
+    except OSError:
+        return None
+    return real_path, stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class FileWatcher:
+    """Call `callback` in a daemon thread when any of `paths` changes and stays unchanged for `debounce` seconds.
+    An exception of `callback` is logged and the files are watched again.
+
+    **Atributes:**
+    * **paths:** files to watch, the symlinks are followed
+    * **callback:** function without arguments
+    * **interval:** seconds between two checks of the files
+    * **debounce:** seconds the files must be stable before calling `callback`
+    """
+
+    def __init__(
+        self,
+        paths: Iterable[str],
+        callback: Callable[[], None],
+        interval: float = DEFAULT_WATCH_INTERVAL,
+        debounce: float = DEFAULT_WATCH_DEBOUNCE,
+    ):
+        self.paths: List[str] = [os.path.abspath(path) for path in paths if path]
+        self.callback = callback
+        self.interval = interval
+        self.debounce = debounce
+        self._signatures = self.get_signatures()
+        self._pending: Optional[Dict[str, Signature]] = None
+        self._pending_since = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._inotify = None
+
+    def get_signatures(self) -> Dict[str, Signature]:
+        return {path: get_signature(path) for path in self.paths}
+
+    def check(self, now: Optional[float] = None) -> bool:
+        """Compare the files with the last time they were checked and call `callback` if they have changed and are
+        stable since `debounce` seconds ago
+        :param now: monotonic time, for testing
+        :return: True if `callback` was called
+        """
+        now = time.monotonic() if now is None else now
+        signatures = self.get_signatures()
+        if signatures == self._signatures:
+            self._pending = None
+            return False
+        if signatures != self._pending:
+            self._pending = signatures
+            self._pending_since = now
+            if self.debounce > 0:
+                return False
+        if now - self._pending_since < self.debounce:
+            return False
+        self._signatures = signatures
+        self._pending = None
+        logger.info("Config files changed: %s", [path for path in self.paths if signatures[path]])
+        try:
+            self.callback()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Error reloading the configuration")
+        return True
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.is_alive():
+            return
+        self._stop.clear()
+        self._inotify = self._init_inotify()
+        self._thread = threading.Thread(target=self._run, name="pyms-config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _init_inotify(self):
+        try:
+            import inotify_simple  # pylint: disable=import-outside-toplevel
+        except ModuleNotFoundError:  # pragma: no cover
+            return None
+        flags = inotify_simple.flags
+        watcher = inotify_simple.INotify()
+        mask = flags.CREATE | flags.DELETE | flags.MODIFY | flags.MOVED_TO | flags.CLOSE_WRITE
+        for directory in {os.path.dirname(path) for path in self.paths}:
+            try:
+                watcher.add_watch(directory, mask)
+            except OSError:  # pragma: no cover
+                logger.debug("Directory %s can't be watched with inotify, polling it", directory)
+        return watcher
+
+    def _wait(self) -> None:
+        """Wait `interval` seconds, or `debounce` seconds if there is a pending change, or until inotify reports a
+        change in the directories of the files"""
+        timeout = self.debounce if self._pending is not None else self.interval
+        if self._inotify is None:
+            self._stop.wait(timeout)
+        else:
+            self._inotify.read(timeout=int(timeout * 1000))
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wait()
+            if not self._stop.is_set():
+                self.check()
@@ -1,5 +1,7 @@
+import concurrent.futures
 import logging
 from abc import ABC, abstractmethod
+from typing import List
 
 from pyms.config.resource import ConfigResource
 from pyms.constants import CRYPT_BASE, LOGGER_NAME
@@ -9,11 +11,19 @@ logger = logging.getLogger(LOGGER_NAME)
 
 CRYPT_RESOURCES_CLASS = "Crypt"
 
+DEFAULT_DECRYPT_WORKERS = 10
+
 
 class CryptAbstract(ABC):
+    decrypt_workers = DEFAULT_DECRYPT_WORKERS
+
     def __init__(self, *args, **kwargs):
         self.config = kwargs.get("config")
 
+    def get_key_files(self) -> List[str]:
+        """Files the keys are read from, watched by `pyms.config.FileWatcher` to reload the configuration"""
+        return []
+
     @abstractmethod
     def encrypt(self, message):
         raise NotImplementedError
@@ -22,6 +32,18 @@ class CryptAbstract(ABC):
     def decrypt(self, encrypted):
         raise NotImplementedError
 
+    def decrypt_many(self, encrypted_values: List) -> List:
+        """Decrypt several values concurrently, with up to `decrypt_workers` threads. Override it if the backend
+        has a bulk operation.
+        :param encrypted_values: ciphertexts
+        :return: list of decrypted values, in the same order
+        """
+        if len(encrypted_values) <= 1:
+            return [self.decrypt(encrypted) for encrypted in encrypted_values]
+        workers = min(self.decrypt_workers, len(encrypted_values))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pyms-decrypt") as pool:
+            return list(pool.map(self.decrypt, encrypted_values))
+
 
 class CryptNone(CryptAbstract):
     def encrypt(self, message):
@@ -30,6 +52,9 @@ class CryptNone(CryptAbstract):
     def decrypt(self, encrypted):
         return encrypted
 
+    def decrypt_many(self, encrypted_values: List) -> List:
+        return list(encrypted_values)
+
 
 class CryptResource(ConfigResource):
     """This class works between `pyms.flask.create_app.Microservice` and `pyms.flask.services.[THESERVICE]`. Search
@@ -38,14 +63,17 @@ class CryptResource(ConfigResource):
 
     config_resource = CRYPT_BASE
 
-    def get_crypt(self, *args, **kwargs) -> CryptAbstract:
+    def get_crypt_class(self) -> type:
+        """Class of the crypt of `pyms.crypt.method`"""
         if self.config.method == "fernet":
-            crypt_object = import_from("pyms.crypt.fernet", CRYPT_RESOURCES_CLASS)
-        elif self.config.method == "aws_kms":
-            crypt_object = import_from("pyms.cloud.aws.kms", CRYPT_RESOURCES_CLASS)
-        else:
-            crypt_object = CryptNone
-        logger.debug("Init crypt {}".format(crypt_object))
+            return import_from("pyms.crypt.fernet", CRYPT_RESOURCES_CLASS)
+        if self.config.method == "aws_kms":
+            return import_from("pyms.cloud.aws.kms", CRYPT_RESOURCES_CLASS)
+        return CryptNone
+
+    def get_crypt(self, *args, **kwargs) -> CryptAbstract:
+        crypt_object = self.get_crypt_class()
+        logger.debug("Init crypt %s", crypt_object)
         return crypt_object(config=self.config, *args, **kwargs)
 
     def __call__(self, *args, **kwargs):
@@ -1,19 +1,41 @@
 import base64
 import os
-from typing import Text
+import threading
+from stat import S_ISDIR
+from typing import Dict, List, Optional, Text, Tuple, Union
 
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+from pyms.config import config_registry
 from pyms.constants import CRYPT_FILE_KEY_ENVIRONMENT, CRYPT_FILE_KEY_ENVIRONMENT_LEGACY, DEFAULT_KEY_FILENAME
 from pyms.crypt.driver import CryptAbstract
 from pyms.exceptions import FileDoesNotExistException
+from pyms.utils import files
 from pyms.utils.files import LoadFile
 
+# Fernet objects by key file, with the (mtime, inode, size) of the file when they were built
+_fernets: Dict[str, Tuple[Tuple[int, int, int], Union[Fernet, MultiFernet]]] = {}
+_fernets_lock = threading.Lock()
+
+
+def clear_fernets() -> None:
+    """Discard the cached Fernet objects, they're built again from the key files"""
+    with _fernets_lock:
+        _fernets.clear()
+
+
+config_registry.subscribe(clear_fernets)
+
 
 class Crypt(CryptAbstract):
+    """Encrypt and decrypt with [Fernet](https://cryptography.io/en/latest/fernet/). The key file could have several
+    keys, one per line, to rotate them: the messages are encrypted with the first one and decrypted with any of them.
+    The `Fernet` object is built once and again only if the key file changes or the configuration is reloaded.
+    """
+
     def __init__(self, *args, **kwargs):
         # TODO Remove temporally backward compatibility on future versions
         crypt_file_key_env = self.__get_updated_crypt_file_key_env()  # Temporally backward compatibility
@@ -42,20 +64,69 @@ class Crypt(CryptAbstract):
             )
         return key
 
+    def get_key_files(self) -> List[str]:
+        path = self._loader.get_path()
+        return [path] if path else []
+
+    def read_keys(self) -> List[bytes]:
+        """Keys of the key file, one per line. The first one is used to encrypt"""
+        keys = [key.strip() for key in self.read_key().splitlines() if key.strip()]
+        if not keys:
+            raise ValueError("Decrypt key {} is empty".format(self._loader.path))
+        return keys
+
+    def get_fernet(self) -> Union[Fernet, MultiFernet]:
+        """Fernet of the key file, or MultiFernet if it has several keys. Cached until the file changes"""
+        path, signature = self._stat_key_file()
+        if path is None:
+            self.read_key()  # Raise FileDoesNotExistException
+        cached = _fernets.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        with _fernets_lock:
+            files.files_cached.pop(path, None)
+            keys = self.read_keys()
+            fernet = MultiFernet([Fernet(key) for key in keys]) if len(keys) > 1 else Fernet(keys[0])
+            _fernets[path] = (signature, fernet)
+            return fernet
+
+    def _stat_key_file(self) -> Tuple[Optional[str], Optional[Tuple[int, int, int]]]:
+        """Path of the key file, searched like `LoadFile.get_path`, and its (mtime, inode, size)"""
+        for path in (os.environ.get(self._loader.file_env_location, self._loader.default_file), self._loader.path):
+            if not path:
+                continue
+            try:
+                stat = os.stat(path)
+                if S_ISDIR(stat.st_mode):
+                    path = os.path.join(path, self._loader.default_file)
+                    stat = os.stat(path)
+            except OSError:
+                continue
+            return path, (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+        return None, None
+
     def encrypt(self, message):
-        key = self.read_key()
         message = message.encode()
-        f = Fernet(key)
-        encrypted = f.encrypt(message)
+        encrypted = self.get_fernet().encrypt(message)
         return encrypted
 
     def decrypt(self, encrypted):
-        key = self.read_key()
         encrypted = encrypted.encode()
-        f = Fernet(key)
-        decrypted = f.decrypt(encrypted)
+        decrypted = self.get_fernet().decrypt(encrypted)
         return str(decrypted, encoding="utf-8")
 
+    def decrypt_many(self, encrypted_values: List) -> List:
+        """Fernet is local and CPU bound, the values are decrypted in sequence with the same Fernet object"""
+        fernet = self.get_fernet()
+        return [str(fernet.decrypt(encrypted.encode()), encoding="utf-8") for encrypted in encrypted_values]
+
+    def rotate(self, encrypted: Text) -> bytes:
+        """Encrypt again a message with the first key of the key file. It must be decryptable with any of them"""
+        fernet = self.get_fernet()
+        if isinstance(fernet, Fernet):
+            fernet = MultiFernet([fernet])
+        return fernet.rotate(encrypted.encode())
+
     def delete_key(self):
         os.remove(self._loader.get_path_from_env())
 
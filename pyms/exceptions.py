@@ -27,3 +27,11 @@ class PackageNotExists(Exception):
 
 class ServiceDiscoveryConnectionException(Exception):
     pass
+
+
+class CircuitBreakerOpenException(Exception):
+    pass
+
+
+class PathParamsException(Exception):
+    pass
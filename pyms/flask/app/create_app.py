@@ -1,19 +1,25 @@
+import atexit
+import functools
 import logging
 import os
-from typing import List, Optional
+import threading
+from typing import Dict, List, Optional, Set
 
-from flask import Flask
+from flask import Flask, g, has_request_context
 
+from pyms.config import ConfFile, config_registry
 from pyms.config.conf import validate_conf
 from pyms.config.resource import ConfigResource
+from pyms.config.watcher import DEFAULT_WATCH_DEBOUNCE, DEFAULT_WATCH_INTERVAL, FileWatcher
 from pyms.constants import CONFIG_BASE, LOGGER_NAME
 from pyms.crypt.driver import CryptResource
-from pyms.flask.app.utils import SingletonMeta
+from pyms.flask.app.utils import EpochTracker, LazyService, SingletonMeta
 from pyms.flask.configreload import configreload_blueprint
 from pyms.flask.healthcheck import healthcheck_blueprint
 from pyms.flask.services.driver import DriverService, ServicesResource
 from pyms.logger import CustomJsonFormatter
 from pyms.utils import check_package_exists
+from pyms.utils.json_backend import DEFAULT_JSON_BACKEND, STDLIB, get_json_backend, set_json_backend
 
 logger = logging.getLogger(LOGGER_NAME)
 
@@ -26,11 +32,19 @@ class Microservice(ConfigResource, metaclass=SingletonMeta):
     config_resource = CONFIG_BASE
     services: List[str] = []
     application = Flask
-    swagger: Optional[DriverService] = None
+    swagger: Optional[DriverService] = LazyService()
     request: Optional[DriverService] = None
-    tracer: Optional[DriverService] = None
-    metrics: Optional[DriverService] = None
+    tracer: Optional[DriverService] = LazyService()
+    metrics: Optional[DriverService] = LazyService()
     _singleton = True
+    _shutdown_registered = False
+    _watcher: Optional[FileWatcher] = None
+    _reload_lock = threading.RLock()
+    epochs: Optional[EpochTracker] = None
+    _services: Dict[str, Optional[DriverService]] = {}
+    _staged_services: Optional[threading.local] = None
+    _pending_services: Set[str] = frozenset()
+    _services_lock = threading.RLock()
 
     def __init__(self, *args, **kwargs):
         """
@@ -45,24 +59,83 @@ class Microservice(ConfigResource, metaclass=SingletonMeta):
             self.path = os.path.dirname(os.path.abspath(path))
 
         validate_conf()
+        if self.epochs is None:
+            self.epochs = EpochTracker()
+        if self._staged_services is None:
+            self._staged_services = threading.local()
         self.init_crypt(path=self.path, *args, **kwargs)
         super().__init__(path=self.path, crypt=self.crypt, *args, **kwargs)
+        config_registry.subscribe(self.reload_config)
         self.init_services()
 
     def init_services(self) -> None:
         """
-        Set the Attributes of all service defined in config.yml and exists in `pyms.flask.service` module
+        Set the Attributes of all service defined in config.yml and exists in `pyms.flask.service` module. The
+        services are imported and created on the first access, see `get_service`
         :return: None
         """
         services_resources = ServicesResource()
-        for service_name, service in services_resources.get_services():
-            if service_name not in self.services or not getattr(self, service_name, False):
-                self.services.append(service_name)
-                setattr(self, service_name, service)
+        pending_services = set(self._pending_services)
+        for service_name in services_resources.get_service_names():
+            if service_name not in self.services or not self._services.get(service_name):
+                if service_name not in self.services:
+                    self.services.append(service_name)
+                pending_services.add(service_name)
+        self._pending_services = pending_services
+
+    def get_services(self) -> Dict[str, Optional[DriverService]]:
+        """
+        Services created by name, None for the disabled ones. All the services are replaced at once by
+        `reload_changed_conf`, and a request uses the services of when it started, so it never mixes old and new ones
+        :return: the services
+        """
+        staged = getattr(self._staged_services, "services", None)
+        if staged is not None:
+            return staged
+        if has_request_context():
+            services = g.get("pyms_services")
+            if services is not None:
+                return services
+        return self._services
+
+    def get_service(self, name: str) -> Optional[DriverService]:
+        """
+        Service of the config, imported and created on the first access to `Microservice.[THESERVICE]` or in
+        `init_services_actions`
+        :param name: name of the service, e.g. `requests`
+        :return: the service, None if it isn't in the config
+        """
+        services = self.get_services()
+        if name in services:
+            return services[name]
+        if name in self._pending_services:
+            with self._services_lock:
+                if name in self._pending_services:
+                    service = ServicesResource.get_service(name)
+                    self._services = dict(self._services, **{name: service if service.is_enabled() else None})
+                    self._pending_services.discard(name)
+        return self._services.get(name)
+
+    def __getattr__(self, name):
+        if name in self._pending_services or name in self._services or name in self.get_services():
+            return self.get_service(name)
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
 
     def init_services_actions(self):
         for service_name in self.services:
-            srv_action = getattr(getattr(self, service_name), "init_action")
+            srv_action = getattr(getattr(self, service_name), "init_action", False)
+            if srv_action:
+                srv_action(self)
+
+    def shutdown_services_actions(self) -> None:
+        """
+        Release the resources of the services, like the pooled connections of `requests`. It's called when the
+        interpreter exits and before the services are recreated in `reload_conf`
+        :return: None
+        """
+        for service_name in self.services:
+            # The services never used aren't created to shut them down
+            srv_action = getattr(self._services.get(service_name), "shutdown_action", False)
             if srv_action:
                 srv_action(self)
 
@@ -79,11 +152,8 @@ class Microservice(ConfigResource, metaclass=SingletonMeta):
         Set the Attributes of all service defined in config.yml and exists in `pyms.flask.service` module
         :return: None
         """
-        for service_name in self.services:
-            try:
-                delattr(self, service_name)
-            except AttributeError:
-                pass
+        self._pending_services = set()
+        self._services = {}
 
     def init_libs(self) -> Flask:
         """This function exists to override if you need to set more libs such as SQLAlchemy, CORs, and any else
@@ -92,6 +162,25 @@ class Microservice(ConfigResource, metaclass=SingletonMeta):
         """
         return self.application
 
+    def init_json(self, config: Optional[ConfFile] = None) -> None:
+        """
+        Set the JSON backend of the configuration (`pyms.config.json_backend`: `orjson`, `ujson` or `stdlib`) used to
+        parse the responses of `requests`, serialize the JSON bodies, the responses of Flask and the logs. Flask < 2.2
+        has no JSON providers, so its responses are still serialized with `app.json_encoder`.
+        :param config: configuration of the microservice, `self.config` by default
+        :return: None
+        """
+        config = self.config if config is None else config
+        backend = set_json_backend(config.get("json_backend", DEFAULT_JSON_BACKEND))
+        if backend.name == STDLIB:
+            return
+        try:
+            from pyms.flask.app.json_provider import JSONProvider  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            logger.warning("json_backend %s isn't used by the responses of Flask, it needs Flask >= 2.2", backend.name)
+            return
+        self.application.json = JSONProvider(self.application)
+
     def init_logger(self) -> None:
         """
         Set a logger and return in JSON format.
@@ -135,14 +224,184 @@ class Microservice(ConfigResource, metaclass=SingletonMeta):
 
         return application
 
+    def reload_config(self) -> None:
+        """Reload the crypt before the configuration, which is decrypted with it
+        :return: None
+        """
+        self.crypt.reload_config()
+        super().reload_config()
+
     def reload_conf(self):
+        """Parse the config file again and recreate the services and the app. `config_registry` refreshes the
+        configuration of the microservice and the crypt
+        :return: None
+        """
+        self.shutdown_services_actions()
         self.delete_services()
-        self.config.reload()
+        config_registry.reload()
         self.services = []
         self.init_services()
-        self.crypt.config.reload()
         self.create_app()
 
+    def reload_changed_conf(self) -> List[str]:
+        """Parse the config file again and replace only the services whose configuration changed, without
+        rebuilding the Flask app. The new services are created and initialized apart and published at once, in a
+        new epoch of `epochs`; the replaced services are shut down when the requests started before have finished.
+        The new configuration is parsed apart too, see `ConfigRegistry.stage`, and only published when all the new
+        services are initialized inside the stage, so their `init_action` reads the new configuration: if the config
+        file isn't valid or the init of a new service raises, nothing changes. If a changed service modifies the app,
+        like `swagger` or `metrics`, a new app is created like in `create_app`, with the new configuration and
+        services, before publishing them.
+        It's called by the watcher of `init_watcher` and by `/reload-config` with `pyms.config.atomic_reload: true`
+        :return: names of the added, removed and changed services
+        """
+        with self._reload_lock:
+            validate_conf()
+            old_services = {name: self.get_service(name) for name in self.services}
+            with config_registry.stage() as trees:
+                config = self.get_config()
+                services_resources = ServicesResource()
+                new_services = {}
+                for name in services_resources.get_service_names():
+                    service = services_resources.get_service(name)
+                    new_services[name] = service if service.is_enabled() else None
+                kept = old_services.keys() & new_services.keys()
+                changed = [
+                    name
+                    for name in dict.fromkeys(list(old_services) + list(new_services))
+                    if name not in kept or not self.same_service(old_services[name], new_services[name])
+                ]
+                services = {
+                    name: old_services[name] if name not in changed else service
+                    for name, service in new_services.items()
+                }
+                replaced = [old_services.get(name) for name in changed] + [new_services.get(name) for name in changed]
+                self._staged_services.services = services
+                try:
+                    if any(getattr(service, "requires_app_reload", False) for service in replaced):
+                        logger.info("Config of services %s changed, creating the app again", changed)
+                        self.create_staged_app(services)
+                    else:
+                        self.init_changed_services(config, {name: new_services.get(name) for name in changed})
+                finally:
+                    self._staged_services.services = None
+            config_registry.publish(trees)
+            self._services = services
+            self._pending_services = set()
+            self.services = list(services)
+            retired = {name: old_services[name] for name in changed if old_services.get(name) is not None}
+            epoch = self.epochs.advance(functools.partial(self.release_services, retired))
+            logger.info("Config reloaded in epoch %s, changed services: %s", epoch, changed)
+            return changed
+
+    @staticmethod
+    def same_service(service: Optional[DriverService], other: Optional[DriverService]) -> bool:
+        """True if both services are disabled or have the same class and configuration"""
+        if service is None or other is None:
+            return service is other
+        return service.same_config(other)
+
+    def create_staged_app(self, services: Dict[str, Optional[DriverService]]) -> None:
+        """Create the app in `reload_changed_conf`, inside the stage of the new configuration and services, which are
+        visible only in the current thread until they are published. If it raises, the previous app and JSON backend
+        are restored
+        :param services: new services by name
+        :return: None
+        """
+        application, names, json_backend = self.application, self.services, get_json_backend()
+        self.services = list(services)
+        try:
+            self.create_app()
+        except Exception:
+            self.application, self.services = application, names
+            set_json_backend(json_backend.name)
+            raise
+
+    def init_changed_services(self, config: ConfFile, services: Dict[str, Optional[DriverService]]) -> None:
+        """Apply `config` to the Flask app and call `init_action` of the new `services` of `reload_changed_conf`. If
+        any of them raises, the config of the app and the JSON backend are restored
+        :param config: new configuration of the microservice
+        :param services: new services by name, None for the removed ones
+        :return: None
+        """
+        if not isinstance(self.application, Flask):
+            app_config, json_provider = None, None
+        else:
+            app_config, json_provider = dict(self.application.config), getattr(self.application, "json", None)
+        json_backend = get_json_backend()
+        try:
+            if app_config is not None:
+                self.application.config.from_object(config.to_flask())
+                self.init_json(config)
+            for service in services.values():
+                if service is not None and service.init_action:
+                    service.init_action(self)
+        except Exception:
+            if app_config is not None:
+                self.application.config.clear()
+                self.application.config.update(app_config)
+                if json_provider is not None:
+                    self.application.json = json_provider
+            set_json_backend(json_backend.name)
+            raise
+
+    def release_services(self, services: Dict[str, DriverService]) -> None:
+        """Shut down the services replaced or removed by `reload_changed_conf`. It's called when no request that
+        could use them is in flight
+        :param services: services by name
+        :return: None
+        """
+        for service in services.values():
+            if service.shutdown_action:
+                service.shutdown_action(self)
+
+    def init_epochs(self) -> None:
+        """Count the in-flight requests of the app in `epochs`, see `reload_changed_conf`
+        :return: None
+        """
+        epochs = self.epochs
+
+        def enter_epoch():
+            g.pyms_epoch = epochs.enter()
+            # Read after entering the epoch: the services of a published reload aren't released before the request ends
+            g.pyms_services = self._services
+
+        def exit_epoch(exception=None):  # pylint: disable=unused-argument
+            epoch = g.pop("pyms_epoch", None)
+            if epoch is not None:
+                epochs.exit(epoch)
+
+        self.application.before_request(enter_epoch)
+        self.application.teardown_request(exit_epoch)
+
+    def get_watched_files(self) -> List[str]:
+        """The config file and the key files of the crypt
+        :return: paths of the files
+        """
+        config_file = ConfFile.get_loader(self.path).get_path()
+        return [path for path in [config_file] + self.crypt(path=self.path).get_key_files() if path]
+
+    def init_watcher(self) -> None:
+        """Call `reload_changed_conf` when the config file or the key file change, if `pyms.config.watch_config`
+        is true. The files are checked every `watch_interval` seconds and must be stable for `watch_debounce`
+        seconds, see `pyms.config.watcher`
+        :return: None
+        """
+        if not self.config.get("watch_config", False):
+            if self._watcher is not None:
+                self._watcher.stop()
+                self._watcher = None
+            return
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._watcher = FileWatcher(
+            self.get_watched_files(),
+            self.reload_changed_conf,
+            interval=self.config.get("watch_interval", DEFAULT_WATCH_INTERVAL),
+            debounce=self.config.get("watch_debounce", DEFAULT_WATCH_DEBOUNCE),
+        )
+        self._watcher.start()
+
     def create_app(self) -> Flask:
         """Initialize the Flask app, register blueprints and initialize
         all libraries like Swagger, database,
@@ -167,16 +426,28 @@ class Microservice(ConfigResource, metaclass=SingletonMeta):
             self.application.register_blueprint(healthcheck_blueprint)
             self.application.register_blueprint(configreload_blueprint)
 
+        self.init_json()
+        self.init_epochs()
         self.init_libs()
         self.add_error_handlers()
         self.init_logger()
 
         self.init_services_actions()
+        self.register_shutdown()
+        self.init_watcher()
 
-        logger.debug("Started app with PyMS and this services: {}".format(self.services))
+        logger.debug("Started app with PyMS and this services: %s", self.services)
 
         return self.application
 
+    def register_shutdown(self) -> None:
+        """Call `shutdown_services_actions` when the interpreter exits. Only registered once per instance
+        :return: None
+        """
+        if not self._shutdown_registered:
+            atexit.register(self.shutdown_services_actions)
+            self._shutdown_registered = True
+
     def add_error_handlers(self) -> None:
         """Subclasses will override this method in order to add specific error handlers. This should be done with
         calls to add_error_handler method.
@@ -0,0 +1,28 @@
+"""Flask JSON provider of PyMS. JSON providers were added in Flask 2.2, with older versions the responses are
+serialized with `app.json_encoder`, see `pyms.flask.app.create_app.Microservice.init_json`.
+"""
+
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+from pyms.utils.json_backend import get_json_backend
+
+
+class JSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that serializes and parses with the JSON backend of PyMS, see `pyms.utils.json_backend`.
+    Indented responses (`DEBUG` mode) and calls with extra arguments use the default provider of Flask.
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs.get("indent") is not None or set(kwargs) - {"default", "sort_keys", "separators"}:
+            return super().dumps(obj, **kwargs)
+        return get_json_backend().dumps(
+            obj, default=kwargs.get("default", self.default), sort_keys=kwargs.get("sort_keys", self.sort_keys)
+        )
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return get_json_backend().loads(s)
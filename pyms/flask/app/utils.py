@@ -1,4 +1,5 @@
-from typing import Dict
+import threading
+from typing import Callable, Dict, List, Tuple
 
 
 class SingletonMeta(type):
@@ -20,6 +21,24 @@ class SingletonMeta(type):
         return cls._instances[cls]
 
 
+class LazyService:
+    """
+    Class attribute of a service of `Microservice`, e.g. `swagger`. The service is imported and created on the first
+    access with `Microservice.get_service`, and stored in the instance, which hides this attribute. It's None if the
+    service isn't in the config.
+    """
+
+    name = ""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return instance.get_service(self.name)
+
+
 class ReverseProxied:
     """
     Create a Proxy pattern https://microservices.io/patterns/apigateway.html.
@@ -64,3 +83,70 @@ class ReverseProxied:
         if scheme:
             environ["wsgi.url_scheme"] = scheme
         return self.app(environ, start_response)
+
+
+class EpochTracker:
+    """
+    Count the in-flight requests per epoch of the configuration, RCU style: a reload publishes the new services and
+    starts a new epoch with `advance`, and the old services are released by its `on_drained` callback once the
+    requests started in that epoch or before have finished.
+    """
+
+    def __init__(self):
+        self.epoch = 0
+        self._in_flight: Dict[int, int] = {}
+        self._retired: List[Tuple[int, Callable[[], None]]] = []
+        self._lock = threading.Lock()
+
+    def enter(self) -> int:
+        """Register a request in the current epoch
+        :return: the epoch, to pass to `exit`
+        """
+        with self._lock:
+            epoch = self.epoch
+            self._in_flight[epoch] = self._in_flight.get(epoch, 0) + 1
+            return epoch
+
+    def exit(self, epoch: int) -> None:
+        with self._lock:
+            count = self._in_flight.get(epoch, 0) - 1
+            if count > 0:
+                self._in_flight[epoch] = count
+            else:
+                self._in_flight.pop(epoch, None)
+            drained = self._pop_drained()
+        self._run(drained)
+
+    def advance(self, on_drained: Callable[[], None]) -> int:
+        """Start a new epoch. `on_drained` is called when no request of the previous epochs is in flight, at once
+        if there isn't any
+        :param on_drained: function without arguments, e.g. the release of the replaced services
+        :return: the new epoch
+        """
+        with self._lock:
+            self._retired.append((self.epoch, on_drained))
+            self.epoch += 1
+            epoch = self.epoch
+            drained = self._pop_drained()
+        self._run(drained)
+        return epoch
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return sum(self._in_flight.values())
+
+    def pending(self) -> int:
+        """Retired epochs whose `on_drained` hasn't been called yet"""
+        with self._lock:
+            return len(self._retired)
+
+    def _pop_drained(self) -> List[Callable[[], None]]:
+        oldest = min(self._in_flight, default=self.epoch)
+        drained = [callback for epoch, callback in self._retired if epoch < oldest]
+        self._retired = [(epoch, callback) for epoch, callback in self._retired if epoch >= oldest]
+        return drained
+
+    @staticmethod
+    def _run(callbacks: List[Callable[[], None]]) -> None:
+        for callback in callbacks:
+            callback()
@@ -8,8 +8,12 @@ configreload_blueprint = Blueprint("configreload", __name__, static_url_path="/s
 @configreload_blueprint.route("/reload-config", methods=["POST"])
 def reloadconfig():
     """
-    Reread configuration from file.
+    Reread configuration from file. With `pyms.config.atomic_reload: true` only the services whose configuration
+    changed are replaced, without stopping the requests in flight, see `Microservice.reload_changed_conf`
     :return:
     """
-    current_app.ms.reload_conf()
+    if current_app.ms.config.get("atomic_reload", False):
+        current_app.ms.reload_changed_conf()
+    else:
+        current_app.ms.reload_conf()
     return "OK"
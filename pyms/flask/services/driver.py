@@ -1,8 +1,9 @@
 import logging
-from typing import Iterator, Text, Tuple
+from typing import Iterator, Optional, Text, Tuple
 
 from pyms.config import ConfFile
 from pyms.config.resource import ConfigResource
+from pyms.config.snapshot import MISSING, ConfigSnapshot, compile_config
 from pyms.constants import LOGGER_NAME, SERVICE_BASE
 from pyms.utils import import_from
 
@@ -24,17 +25,52 @@ class DriverService(ConfigResource):
 
     init_action = False
 
+    shutdown_action = False
+
+    # The service changes the Flask app, a new configuration rebuilds the app instead of replacing only the service
+    requires_app_reload = False
+
+    _config_snapshot: Optional[ConfigSnapshot] = None
+
     def __init__(self, *args, **kwargs):
         self.config_resource = get_service_name(service=self.config_resource)
         super().__init__(*args, **kwargs)
 
+    def set_config(self, config) -> None:
+        """Replace the configuration of the service. The lookups of `__getattr__` are done in a read-only snapshot
+        compiled here, and replaced with a single assignment, so a concurrent lookup sees either the old or the new
+        configuration.
+        :param config: ConfFile of the service
+        :return: None
+        """
+        snapshot = compile_config(config) if isinstance(config, ConfFile) else None
+        self.config = config
+        self._config_snapshot = snapshot
+
+    @property
+    def config_snapshot(self) -> Optional[ConfigSnapshot]:
+        """Read-only snapshot of the configuration, None if the service has no config file"""
+        return self._config_snapshot
+
     def __getattr__(self, attr, *args, **kwargs):
-        config_attribute = getattr(self.config, attr)
-        return (
-            config_attribute
-            if config_attribute == "" or config_attribute != {}
-            else self.default_values.get(attr, None)
-        )
+        snapshot = self._config_snapshot
+        if snapshot is None:
+            config_attribute = getattr(self.config, attr)
+            return (
+                config_attribute
+                if config_attribute == "" or config_attribute != {}
+                else self.default_values.get(attr, None)
+            )
+        config_attribute = snapshot.get_value(attr)
+        if config_attribute is MISSING or (isinstance(config_attribute, ConfigSnapshot) and not config_attribute):
+            return self.default_values.get(attr, None)
+        return config_attribute
+
+    def same_config(self, other: Optional["DriverService"]) -> bool:
+        """True if `other` is a service of the same class with the same configuration"""
+        if type(other) is not type(self) or other.config_snapshot != self._config_snapshot:
+            return False
+        return self._config_snapshot is not None or other.config == self.config
 
     def is_enabled(self) -> bool:
         return self.enabled
@@ -53,15 +89,20 @@ class ServicesResource(ConfigResource):
 
     config_resource = SERVICE_BASE
 
-    def get_services(self) -> Iterator[Tuple[Text, DriverService]]:
+    def get_service_names(self) -> Iterator[Text]:
+        """Names of the services of the config, without importing them"""
         for k in self.config.__dict__.keys():
             if k.islower() and not k.startswith("_"):
-                service = self.get_service(k)
-                if service.is_enabled():
-                    yield k, service
+                yield k
+
+    def get_services(self) -> Iterator[Tuple[Text, DriverService]]:
+        for k in self.get_service_names():
+            service = self.get_service(k)
+            if service.is_enabled():
+                yield k, service
 
     @staticmethod
     def get_service(service: Text, *args, **kwargs) -> DriverService:
         service_object = import_from("pyms.flask.services.{}".format(service), "Service")
-        logger.debug("Init service {}".format(service))
+        logger.debug("Init service %s", service)
         return service_object(*args, **kwargs)
@@ -0,0 +1,29 @@
+"""Helpers used by `pyms.flask.services.requests` to talk with other services.
+"""
+
+from .cache import FileCache, MemoryCache, ResponseCache
+from .circuitbreaker import CircuitBreaker
+from .circuitstate import FileStateStore, MemoryStateStore
+from .headers import HeadersFilter
+from .pool import SessionPool
+from .retry import RetryBudget, RetryPolicy
+from .singleflight import RequestCoalescer, SingleFlight
+from .template import URILabels, URLTemplate, compile_template
+
+__all__ = [
+    "CircuitBreaker",
+    "FileCache",
+    "FileStateStore",
+    "HeadersFilter",
+    "MemoryCache",
+    "MemoryStateStore",
+    "RequestCoalescer",
+    "ResponseCache",
+    "SessionPool",
+    "RetryBudget",
+    "RetryPolicy",
+    "SingleFlight",
+    "URILabels",
+    "URLTemplate",
+    "compile_template",
+]
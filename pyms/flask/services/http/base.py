@@ -0,0 +1,420 @@
+"""Settings and helpers shared by the services `requests` and `requests_async`: the configuration read once per
+reload, the url templates, the headers, the parsing of the responses, the retry policy, the circuit breaker and the
+metrics of the outbound calls. Each service sends the requests with its own client.
+"""
+
+import concurrent.futures
+import functools
+import logging
+import time
+from typing import Any, Callable, Optional
+
+from requests.adapters import Response
+
+from pyms.config.conf import get_conf
+from pyms.constants import LOGGER_NAME
+from pyms.flask.services.driver import DriverService, get_service_name
+from pyms.flask.services.http.circuitbreaker import STATE_VALUES, CircuitBreaker
+from pyms.flask.services.http.headers import HeadersFilter, get_propagated_headers
+from pyms.flask.services.http.pool import DEFAULT_POOL_IDLE_TIMEOUT, DEFAULT_POOL_MAXSIZE
+from pyms.flask.services.http.retry import (
+    DEFAULT_BACKOFF_FACTOR,
+    DEFAULT_BACKOFF_MAX,
+    DEFAULT_RETRY_BUDGET_MIN_PER_SECOND,
+    DEFAULT_RETRY_BUDGET_RATIO,
+    RetryBudget,
+    RetryPolicy,
+)
+from pyms.flask.services.http.stream import MISSING, get_node, get_path
+from pyms.flask.services.http.template import DEFAULT_METRICS_MAX_URIS, URILabels, URLTemplate, compile_template
+from pyms.flask.services.tracer import inject_span_in_headers
+from pyms.logger.lazy import log_debug, log_fields
+from pyms.utils.json_backend import STDLIB, get_json_backend
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+
+    REQUESTS_COUNT = Counter(
+        "http_client_requests_count", "Python requests count", ["service", "method", "uri", "status"]
+    )
+    REQUESTS_LATENCY = Histogram(
+        "http_client_requests_seconds", "Python requests latency", ["service", "method", "uri", "status"]
+    )
+    REQUESTS_RETRIES = Counter("http_client_retries_count", "Python requests retries", ["service", "method", "uri"])
+    REQUESTS_RETRIES_DROPPED = Counter(
+        "http_client_retries_dropped_count",
+        "Python requests retries dropped by the retry budget",
+        ["service", "method", "uri"],
+    )
+    CIRCUIT_BREAKER_STATE = Gauge(
+        "http_client_circuit_breaker_state",
+        "State of the circuit breaker of the outbound calls: 0 closed, 1 open, 2 half-open",
+        ["service", "circuit"],
+    )
+except ModuleNotFoundError:  # pragma: no cover
+    pass
+
+logger = logging.getLogger(LOGGER_NAME)
+
+DEFAULT_RETRIES = 3
+
+DEFAULT_STATUS_RETRIES = (500, 502, 504)
+
+# Methods retried after a connection or read error, when the request could have been received by the server
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "PUT", "DELETE", "OPTIONS", "TRACE"])
+
+# Settings read on every outbound call. `BaseService.load_settings` stores them as instance attributes, so
+# `DriverService.__getattr__` doesn't search them in the configuration each time. The subclasses add theirs in
+# `cached_settings`
+CACHED_SETTINGS = (
+    "data",
+    "retries",
+    "status_retries",
+    "propagate_headers",
+    "pool_maxsize",
+    "max_concurrency",
+)
+
+DEFAULT_MAX_CONCURRENCY = 10
+
+GATHER_METHODS = (
+    "get",
+    "get_for_object",
+    "post",
+    "post_for_object",
+    "put",
+    "put_for_object",
+    "patch",
+    "patch_for_object",
+    "delete",
+)
+
+
+class BaseService(DriverService):
+    """
+    Base of `pyms.flask.services.requests.Service` and `pyms.flask.services.requests_async.Service`. The subclasses
+    implement the methods of the API (`get`, `post_for_object`...), `gather` and `is_retryable_error` with their
+    client.
+    All default values keys are created as class attributes in `DriverService`
+    """
+
+    default_values = {
+        "data": "",
+        "retries": DEFAULT_RETRIES,
+        "status_retries": DEFAULT_STATUS_RETRIES,
+        "propagate_headers": False,
+        "pool_maxsize": DEFAULT_POOL_MAXSIZE,
+        "pool_idle_timeout": DEFAULT_POOL_IDLE_TIMEOUT,
+        "max_concurrency": DEFAULT_MAX_CONCURRENCY,
+        "backoff_factor": DEFAULT_BACKOFF_FACTOR,
+        "backoff_max": DEFAULT_BACKOFF_MAX,
+        "retry_budget_ratio": DEFAULT_RETRY_BUDGET_RATIO,
+        "retry_budget_min_per_second": DEFAULT_RETRY_BUDGET_MIN_PER_SECOND,
+        "circuit_breaker": False,
+        "metrics_max_uris": DEFAULT_METRICS_MAX_URIS,
+    }
+    cached_settings = CACHED_SETTINGS
+    tracer = None
+    _metrics_enabled = False
+    _retry_policy = None
+    _data_path: tuple = ()
+    _circuit_breaker = None
+    _headers_filter = HeadersFilter()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._uri_labels = URILabels()
+
+    def init_action(self, microservice_instance):
+        self.app_name = microservice_instance.application.config["APP_NAME"]  # pylint: disable=W0201
+        self.load_settings()
+
+    def load_settings(self) -> None:
+        """Read the configuration used by all outbound calls only once. The services are recreated and this
+        method is called again when the configuration is reloaded with `/reload-config`.
+        :return: None
+        """
+        for setting in self.cached_settings:
+            setattr(self, setting, DriverService.__getattr__(self, setting))
+        self._data_path = get_path(self.data)
+        self._metrics_enabled = bool(get_conf(service=get_service_name(service="metrics"), empty_init=True))
+        self._uri_labels = URILabels(DriverService.__getattr__(self, "metrics_max_uris"))
+        self._retry_policy = self.get_retry_policy()
+        self._circuit_breaker = self.get_circuit_breaker()
+        self._headers_filter = self.get_headers_filter()
+
+    def get_retry_policy(self) -> RetryPolicy:
+        """
+        A call is done at most `retries` times. It's retried when the response status is in `status_retries` or
+        when the connection fails. The wait between attempts is a random value between 0 and
+        `backoff_factor * 2 ** (attempt - 1)` seconds, never longer than `backoff_max`, or the `Retry-After` header
+        if the response has it. The retries are limited by a budget of `retry_budget_ratio` retries per successful
+        call plus `retry_budget_min_per_second` retries per second.
+        :return: RetryPolicy
+        """
+        budget = RetryBudget(
+            ratio=DriverService.__getattr__(self, "retry_budget_ratio"),
+            min_per_second=DriverService.__getattr__(self, "retry_budget_min_per_second"),
+        )
+        return RetryPolicy(
+            attempts=self.retries,
+            status_retries=self.status_retries,
+            backoff_factor=DriverService.__getattr__(self, "backoff_factor"),
+            backoff_max=DriverService.__getattr__(self, "backoff_max"),
+            budget=budget,
+        )
+
+    def get_circuit_breaker(self) -> Optional[CircuitBreaker]:
+        """Circuit breaker of the outbound calls, disabled by default, see
+        `pyms.flask.services.http.circuitbreaker.CircuitBreaker.from_config`
+        :return: CircuitBreaker or None if disabled
+        """
+        return CircuitBreaker.from_config(
+            DriverService.__getattr__(self, "circuit_breaker"), on_state_change=self.observe_circuit_breaker
+        )
+
+    def get_headers_filter(self) -> HeadersFilter:
+        """
+        Propagate the headers of the inbound request with `propagate_headers: true` or choose them:
+        ```yaml
+        propagate_headers:
+          allow: ["Authorization", "Accept-Language"]  # (optional) Only these headers are propagated
+          deny: ["Cookie"]  # (optional) Headers never propagated, besides the hop-by-hop headers, Content-Length,
+                            # Content-Type and Host
+        ```
+        :return: HeadersFilter
+        """
+        config = self.propagate_headers
+        if not isinstance(config, dict):
+            config = {}
+        return HeadersFilter(allow=config.get("allow"), deny=config.get("deny"))
+
+    @staticmethod
+    def insert_trace_headers(headers: dict) -> dict:
+        """Inject trace headers if enabled.
+
+        :param headers: dictionary of HTTP Headers to send.
+
+        :rtype: dict
+        """
+
+        try:
+            headers = inject_span_in_headers(headers)
+        except Exception as ex:  # pragma: no cover
+            logger.debug("Tracer error %s", ex)
+        return headers
+
+    def set_propagate_headers(self, headers: dict) -> dict:
+        """Add the headers of the inbound request that aren't in `headers`. They are filtered once per inbound
+        request, see `pyms.flask.services.http.headers`.
+
+        :param headers: dictionary of HTTP Headers to send.
+
+        :rtype: dict
+        """
+        sent = {header.lower() for header in headers}
+        for header, value in get_propagated_headers(self._headers_filter):
+            if header.lower() not in sent:
+                headers[header] = value
+        return headers
+
+    def _get_headers(self, headers: dict, propagate_headers: bool = False) -> dict:
+        """If enabled appends trace headers to received ones.
+
+        :param headers: dictionary of HTTP Headers to send.
+
+        :rtype: dict
+        """
+
+        if not headers:
+            headers = {}
+
+        if self.propagate_headers or propagate_headers:
+            headers = self.set_propagate_headers(headers)
+        return headers
+
+    @staticmethod
+    def _build_url(url, path_params: dict = None) -> str:
+        """Compose full url replacing placeholders with path_params values. The template is parsed once and
+        cached, see `pyms.flask.services.http.template`. The values in the path are percent-encoded.
+
+        :param url: base url
+        :param path_params: (optional) Dictionary, list of tuples with path parameters values to compose url
+        :return: :class:`string`
+        :rtype: string
+        :raises PathParamsException: if a path parameter is missing
+        """
+
+        return compile_template(url).expand(path_params)
+
+    @staticmethod
+    def get_url_template(url: str) -> URLTemplate:
+        """Parsed template of a url, its `template` identifies the url in metrics and traces"""
+        return compile_template(url)
+
+    def _prepare(self, method: str, url: str, path_params: dict, headers: dict, propagate_headers: bool = False):
+        full_url = self._build_url(url, path_params)
+        headers = self._get_headers(headers=headers, propagate_headers=propagate_headers)
+        headers = self.insert_trace_headers(headers)
+        log_debug(logger, method.capitalize() + " with", url=full_url, headers=headers)
+        return full_url, headers
+
+    def parse_response(self, response: Response) -> dict:
+        """Parses response's json object. Checks configuration in order to parse a concrete node or the whole response.
+
+        :param response: request's response that contains a valid json
+
+        :rtype: dict
+        """
+
+        try:
+            backend = get_json_backend()
+            data = response.json() if backend.name == STDLIB else backend.loads(response.content)
+            data = get_node(data, self._data_path)
+            return {} if data is MISSING else data
+        except ValueError:
+            log_fields(logger, logging.WARNING, "Response.content is not a valid json", content=response.content)
+            return {}
+
+    @staticmethod
+    def is_retryable_error(method: str, error: Exception) -> bool:
+        """Connection errors are always retried because the request wasn't sent. Other network errors, like
+        timeouts reading the response, only for idempotent methods. Implemented for the exceptions of the client of
+        each service.
+
+        :param method: HTTP method of the request
+        :param error: exception raised by the request
+        """
+        raise NotImplementedError
+
+    def check_circuit(self, full_url: str, template: str = None) -> Optional[str]:
+        """Fail fast if the circuit of the call is open.
+
+        :param full_url: url of the request
+        :param template: (optional) url of the request before replacing the path parameters
+        :return: circuit of the call or None if the circuit breaker is disabled
+        :raises CircuitBreakerOpenException: if the circuit is open
+        """
+        if self._circuit_breaker is None:
+            return None
+        circuit = self._circuit_breaker.get_circuit(full_url, template)
+        self._circuit_breaker.before_call(circuit)
+        return circuit
+
+    def record_circuit(self, circuit: Optional[str], response: Any = None, error: Exception = None) -> None:
+        """Record the result of a call, after all its attempts, in its circuit.
+
+        :param circuit: circuit returned by `check_circuit`
+        :param response: (optional) last response of the call
+        :param error: (optional) exception raised by the call. Without response nor error the call ended without
+            a result and the circuit is only released
+        """
+        if circuit is None:
+            return
+        if error is None and response is None:
+            self._circuit_breaker.release(circuit)
+        elif error is not None or response.status_code >= 500:
+            self._circuit_breaker.record_failure(circuit)
+        else:
+            self._circuit_breaker.record_success(circuit)
+
+    @staticmethod
+    def encode_json_body(kwargs: dict) -> dict:
+        """Serialize the `json` argument of a call with the JSON backend, if it's not the standard library, and send
+        it as `data`.
+
+        :param kwargs: arguments of the call
+        :return: arguments of the call
+        """
+        backend = get_json_backend()
+        if kwargs.get("json") is None or backend.name == STDLIB:
+            return kwargs
+        kwargs = dict(kwargs)
+        kwargs["data"] = backend.dumps_bytes(kwargs.pop("json"))
+        headers = dict(kwargs.get("headers") or {})
+        if not any(k.lower() == "content-type" for k in headers):
+            headers["Content-Type"] = "application/json"
+        kwargs["headers"] = headers
+        return kwargs
+
+    def get_attempt_delay(
+        self, method: str, uri: Optional[str], attempt: int, response: Any, error: Optional[Exception]
+    ) -> Optional[float]:
+        """Observe the response of an attempt in the metrics and ask the retry policy if it must be retried. Used as
+        `get_delay` of `pyms.flask.services.http.retry.send_with_retries`.
+
+        :param method: HTTP method of the request
+        :param uri: `uri` label of the metrics, see `get_metric_uri`, None if the metrics are disabled
+        :param attempt: number of the attempt that just finished, starting from 1
+        :param response: response of the attempt, None if it raised
+        :param error: exception raised by the attempt, None if it has a response
+        :return: seconds to wait before the next attempt or None if the call is not retried
+        """
+        if response is not None and uri is not None:
+            self.observe_requests(response, uri)
+        policy = self._retry_policy
+        status_code = response.status_code if response is not None else None
+        retryable_error = error is not None and self.is_retryable_error(method, error)
+        if not policy.is_retryable(attempt, status_code, retryable_error):
+            if status_code is not None and status_code not in policy.status_retries:
+                policy.record_success()
+                logger.debug("Response %s", response)
+            else:
+                logger.warning("Response ERROR: %s", response if error is None else error)
+            return None
+        if not policy.try_acquire():
+            logger.warning("Retry budget exhausted, response ERROR: %s", response if error is None else error)
+            if uri is not None:
+                REQUESTS_RETRIES_DROPPED.labels(self.app_name, method, uri).inc()
+            return None
+        if uri is not None:
+            REQUESTS_RETRIES.labels(self.app_name, method, uri).inc()
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        return policy.get_backoff(attempt, retry_after)
+
+    def get_call(self, call: dict, deadline: Optional[float] = None) -> Callable[[], Any]:
+        """Transform a call definition of `gather` in a callable.
+
+        :param call: Dictionary with the key `method` (i.e: `get`, `post_for_object`. Default `get`) and the
+            arguments of this method.
+        :param deadline: (optional) `time.monotonic()` when `gather` stops waiting. If the call has no `timeout`,
+            the seconds left when it starts are its `timeout`
+        :return: callable without arguments
+        """
+        call = dict(call)
+        method = call.pop("method", "get").lower()
+        if method not in GATHER_METHODS:
+            raise ValueError("Method {} not allowed, use one of {}".format(method, ", ".join(GATHER_METHODS)))
+        func = functools.partial(getattr(self, method), **call)
+        if deadline is None or call.get("timeout") is not None:
+            return func
+
+        def with_deadline():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise concurrent.futures.TimeoutError("Call not started before the timeout of gather")
+            return func(timeout=remaining)
+
+        return with_deadline
+
+    def observe_circuit_breaker(self, circuit: str, state: str) -> None:
+        if self._metrics_enabled:
+            CIRCUIT_BREAKER_STATE.labels(self.app_name, circuit).set(STATE_VALUES[state])
+
+    def get_metric_uri(self, full_url: str, template: str = None) -> str:
+        """`uri` label of the metrics of a call, after `metrics_max_uris` different urls the new ones are labeled as
+        `other`, see `pyms.flask.services.http.template.URILabels`.
+
+        :param full_url: url of the request
+        :param template: (optional) url of the request before replacing the path parameters
+        :return: the `uri` label
+        """
+        return self._uri_labels.get(full_url, template)
+
+    def observe_requests(self, response, uri: str = None):
+        uri = uri or self.get_metric_uri(response.url)
+        method = response.request.method
+        REQUESTS_COUNT.labels(self.app_name, method, uri, response.status_code).inc()
+        REQUESTS_LATENCY.labels(self.app_name, method, uri, response.status_code).observe(
+            float(response.elapsed.total_seconds())
+        )
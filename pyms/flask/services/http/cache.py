@@ -0,0 +1,348 @@
+"""Cache of the parsed responses of `get_for_object`. The entries are stored with the expiration of the
+`Cache-Control` header of the response (or the TTL of the configuration) and its `ETag`, to revalidate expired
+entries with `If-None-Match`. `ResponseCache` is the cache of a service, configured with its `cache` setting.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+from urllib.parse import urlencode
+
+from pyms.exceptions import ConfigErrorException
+from pyms.utils.files import get_user_temp_dir, make_user_dir
+from pyms.utils.json_backend import get_json_backend
+
+try:
+    from prometheus_client import Counter
+
+    REQUESTS_CACHE_HITS = Counter("http_client_cache_hits_count", "Python requests cache hits", ["service"])
+    REQUESTS_CACHE_MISSES = Counter("http_client_cache_misses_count", "Python requests cache misses", ["service"])
+    REQUESTS_CACHE_EVICTIONS = Counter(
+        "http_client_cache_evictions_count", "Python requests cache evictions", ["service"]
+    )
+except ModuleNotFoundError:  # pragma: no cover
+    pass
+
+CACHE_BACKENDS = ("memory", "file")
+
+DEFAULT_CACHE_MAX_ENTRIES = 1000
+
+DEFAULT_CACHE_TTL = 0
+
+# Headers of the request that change the response, so they are part of the key of an entry
+DEFAULT_CACHE_VARY_HEADERS = ("Authorization", "Accept", "Accept-Language")
+
+# Headers of the request that don't change the parsed response, requests decodes the content
+IGNORED_VARY_HEADERS = ("accept-encoding",)
+
+# Arguments of requests with credentials, the calls with them aren't cached
+CREDENTIAL_ARGUMENTS = ("auth", "cookies", "cert")
+
+# Arguments of requests that don't change the response, so they aren't part of the key of a call
+IGNORED_ARGUMENTS = ("timeout",)
+
+
+class CacheEntry:
+    """Parsed response of a call.
+    **Atributes:**
+    * value: result of `parse_response`. It's shared by all hits, don't modify it
+    * etag: `ETag` header of the response, to revalidate the entry when it expires
+    * expires: timestamp when the entry expires
+    """
+
+    __slots__ = ("value", "etag", "expires")
+
+    def __init__(self, value: Any, etag: Optional[str], expires: float):
+        self.value = value
+        self.etag = etag
+        self.expires = expires
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires
+
+
+def make_key(
+    method: str,
+    url: str,
+    params: Any = None,
+    headers: Mapping = None,
+    vary: Iterable[str] = (),
+    arguments: Mapping = None,
+) -> str:
+    """Key of a call: the method, the url, the query string, the values of the `vary` headers and the other
+    arguments of requests but `IGNORED_ARGUMENTS`"""
+    query = urlencode(sorted(params.items()) if isinstance(params, dict) else params, doseq=True) if params else ""
+    headers = {k.lower(): v for k, v in (headers or {}).items()}
+    header_values = "|".join("{}={}".format(h, headers[h.lower()]) for h in vary if h.lower() in headers)
+    key = "{} {}?{} {}".format(method.upper(), url, query, header_values)
+    arguments = sorted(
+        (name, repr(value)) for name, value in (arguments or {}).items() if name not in IGNORED_ARGUMENTS
+    )
+    if arguments:
+        key += " {}".format(arguments)
+    return key
+
+
+def is_cacheable_call(arguments: Mapping) -> bool:
+    """The calls with credentials in the arguments of requests (`CREDENTIAL_ARGUMENTS`) aren't cached"""
+    return not any(arguments.get(name) for name in CREDENTIAL_ARGUMENTS)
+
+
+def is_cacheable_vary(headers: Mapping, vary: Iterable[str]) -> bool:
+    """Read the `Vary` header of a response: it can be stored if all the headers in `Vary` are part of the key of
+    the entry, the `vary` headers. `Vary: *` is never stored.
+
+    :param headers: headers of the response
+    :param vary: headers of the request in the key of the entry
+    """
+    keyed = {h.lower() for h in vary}.union(IGNORED_VARY_HEADERS)
+    varies = {h.strip().lower() for h in (headers.get("Vary") or "").split(",") if h.strip()}
+    return "*" not in varies and varies <= keyed
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    directives = {}
+    for directive in (value or "").split(","):
+        name, _, argument = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+def get_ttl(headers: Mapping, default_ttl: float) -> Tuple[bool, float]:
+    """Read the `Cache-Control` header of a response.
+
+    :param headers: headers of the response
+    :param default_ttl: seconds to cache the response if the header doesn't set `max-age`
+    :return: if the response can be stored and for how many seconds it's fresh
+    """
+    directives = parse_cache_control(headers.get("Cache-Control"))
+    if "no-store" in directives or "private" in directives:
+        return False, 0
+    if "no-cache" in directives:
+        return True, 0
+    max_age = directives.get("s-maxage") or directives.get("max-age")
+    if max_age is not None and max_age.isdigit():
+        return True, float(max_age)
+    return True, default_ttl
+
+
+class MemoryCache:
+    """LRU cache in memory, shared by all the threads of a worker.
+    **Atributes:**
+    * max_entries: when the cache is full, the least recently used entry is evicted
+    * on_evict: (optional) callable called when an entry is evicted
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_MAX_ENTRIES, on_evict=None):
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        evicted = 0
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted and self.on_evict:
+            self.on_evict(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class FileCache:
+    """Cache in a directory, shared by all the processes of a host (i.e: gunicorn workers). Each entry is a JSON
+    file written atomically. The directory must belong to the user of the service and not be writable by others,
+    else `ConfigErrorException` is raised.
+    **Atributes:**
+    * path: directory of the entries
+    * max_entries: when the cache is full, the least recently used entries are evicted
+    * on_evict: (optional) callable called when entries are evicted
+    """
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_CACHE_MAX_ENTRIES, on_evict=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        make_user_dir(path)
+
+    @staticmethod
+    def get_default_path() -> str:
+        """Directory of the user in the temporary directory, the workers of the service run with the same user"""
+        return get_user_temp_dir("pyms-requests-cache")
+
+    def _get_filename(self, key: str) -> str:
+        return os.path.join(self.path, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".cache")
+
+    def _get_filenames(self):
+        return [os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith(".cache")]
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        filename = self._get_filename(key)
+        try:
+            with open(filename, "rb") as entry_file:
+                value, etag, expires = get_json_backend().loads(entry_file.read())
+            os.utime(filename)
+        except (OSError, ValueError, TypeError):
+            return None
+        return CacheEntry(value, etag, expires)
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        fd, tmp_filename = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as entry_file:
+                entry_file.write(get_json_backend().dumps_bytes([entry.value, entry.etag, entry.expires]))
+            os.replace(tmp_filename, self._get_filename(key))
+        except BaseException:
+            os.unlink(tmp_filename)
+            raise
+        self._evict()
+
+    def _evict(self) -> None:
+        filenames = self._get_filenames()
+        if len(filenames) <= self.max_entries:
+            return
+        mtimes = []
+        for filename in filenames:
+            try:
+                mtimes.append((os.path.getmtime(filename), filename))
+            except OSError:
+                pass
+        evicted = 0
+        for _, filename in sorted(mtimes)[: len(mtimes) - self.max_entries]:
+            try:
+                os.unlink(filename)
+                evicted += 1
+            except OSError:
+                pass
+        if evicted and self.on_evict:
+            self.on_evict(evicted)
+
+    def clear(self) -> None:
+        for filename in self._get_filenames():
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
+
+    def __len__(self) -> int:
+        return len(self._get_filenames())
+
+
+class ResponseCache:
+    """Cache of the responses of a service, with the settings of its `cache`, see `from_config`.
+    **Atributes:**
+    * store: `MemoryCache` or `FileCache`, its evictions are counted in the metrics
+    * ttl: seconds to cache a response without `max-age` in its `Cache-Control` header
+    * vary_headers: request headers that change the response, part of the key of the entries
+    * routes: TTL by url template, it overrides the `Cache-Control` header
+    * service: (optional) `service` label of the metrics, None if the metrics are disabled
+    """
+
+    def __init__(
+        self,
+        store,
+        ttl: float = DEFAULT_CACHE_TTL,
+        vary_headers: Iterable[str] = DEFAULT_CACHE_VARY_HEADERS,
+        routes: Dict[str, float] = None,
+        service: Optional[str] = None,
+    ):
+        self.store = store
+        self.ttl = ttl
+        self.vary_headers = tuple(vary_headers)
+        self.routes = routes or {}
+        self.service = service
+        store.on_evict = self.observe_evictions
+
+    @classmethod
+    def from_config(cls, config, service: Optional[str] = None):
+        """
+        Disabled by default. Enable it with `cache: true` or configure it:
+        ```yaml
+        cache:
+          max_entries: 1000  # Least recently used entries are evicted
+          ttl: 0  # Seconds to cache a response without `max-age` in its `Cache-Control` header
+          vary_headers: ["Authorization", "Accept", "Accept-Language"]  # Request headers that change the response
+          routes:  # TTL of a url template, it overrides the `Cache-Control` header
+            - url: http://users/{id}
+              ttl: 300
+          backend: memory  # `memory` or `file` to share the cache between the workers of the host
+          path: /var/cache/my-service  # (optional) Directory of the file backend, owned by the user of the service.
+          # Default `pyms-requests-cache-<uid>` in the temporary directory
+        ```
+        :param config: value of the setting
+        :param service: (optional) `service` label of the metrics, None if the metrics are disabled
+        :return: ResponseCache or None if disabled
+        """
+        if not config:
+            return None
+        if not isinstance(config, dict):
+            config = {}
+        backend = config.get("backend", "memory")
+        if backend not in CACHE_BACKENDS:
+            raise ConfigErrorException(
+                "Cache backend {} not valid, use one of {}".format(backend, ", ".join(CACHE_BACKENDS))
+            )
+        max_entries = config.get("max_entries", DEFAULT_CACHE_MAX_ENTRIES)
+        if backend == "file":
+            store = FileCache(config.get("path") or FileCache.get_default_path(), max_entries=max_entries)
+        else:
+            store = MemoryCache(max_entries=max_entries)
+        return cls(
+            store,
+            ttl=config.get("ttl", DEFAULT_CACHE_TTL),
+            vary_headers=config.get("vary_headers", DEFAULT_CACHE_VARY_HEADERS),
+            routes={route["url"]: route["ttl"] for route in config.get("routes", [])},
+            service=service,
+        )
+
+    def make_key(self, url: str, params: Any, headers: Mapping, arguments: Mapping) -> str:
+        """Key of a GET call, see `make_key`"""
+        return make_key("GET", url, params, headers, self.vary_headers, arguments)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        return self.store.get(key)
+
+    def set(self, key: str, template: str, headers: Mapping, value: Any) -> None:
+        """Store the parsed response of a call if its headers allow it.
+
+        :param key: key of the call
+        :param template: url of the call before replacing the path parameters, to find its TTL in `routes`
+        :param headers: headers of the response
+        :param value: parsed response
+        """
+        cacheable, ttl = get_ttl(headers, self.ttl)
+        if not cacheable or not is_cacheable_vary(headers, self.vary_headers):
+            return
+        ttl = self.routes.get(template, ttl)
+        etag = headers.get("ETag")
+        if ttl > 0 or etag:
+            self.store.set(key, CacheEntry(value, etag, time.time() + ttl))
+
+    def observe(self, hit: bool) -> None:
+        if self.service is not None:
+            (REQUESTS_CACHE_HITS if hit else REQUESTS_CACHE_MISSES).labels(self.service).inc()
+
+    def observe_evictions(self, evicted: int) -> None:
+        if self.service is not None:
+            REQUESTS_CACHE_EVICTIONS.labels(self.service).inc(evicted)
@@ -0,0 +1,183 @@
+"""Circuit breaker of the outbound calls. When a downstream service fails `failure_threshold` times in a row, the
+circuit opens and the calls fail fast with `CircuitBreakerOpenException` for `recovery_timeout` seconds. Then, the
+circuit is half-open: `half_open_max_calls` calls are allowed and, if they succeed, the circuit is closed again. A
+half-open call without result after `recovery_timeout` seconds, i.e: it hangs or its worker was killed, is given up
+and another call can probe the circuit.
+"""
+
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional
+
+from pyms.constants import LOGGER_NAME
+from pyms.exceptions import CircuitBreakerOpenException, ConfigErrorException
+from pyms.flask.services.http.circuitstate import CLOSED, HALF_OPEN, OPEN, FileStateStore, MemoryStateStore
+from pyms.flask.services.http.pool import SessionPool
+from pyms.utils.files import get_user_temp_dir, make_user_dir
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Values of the Prometheus gauge for each state
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+DEFAULT_FAILURE_THRESHOLD = 5
+
+DEFAULT_RECOVERY_TIMEOUT = 30
+
+DEFAULT_HALF_OPEN_MAX_CALLS = 1
+
+# Circuits of the circuit breaker: one per downstream host (`scheme://host:port`) or one per url template
+# (`http://users/{id}`), before replacing the path parameters
+CIRCUIT_BREAKER_KEYS = ("host", "template")
+
+
+class CircuitBreaker:
+    """Track the calls of each circuit (a host or a url template) in a store.
+    **Atributes:**
+    * failure_threshold: consecutive failures that open the circuit
+    * recovery_timeout: seconds the circuit stays open before allowing calls again
+    * half_open_max_calls: calls allowed when the circuit is half-open
+    * store: `MemoryStateStore` or `FileStateStore`
+    * on_state_change: (optional) callable called with the circuit and its new state
+    * circuit_key: `host` or `template`, see `CIRCUIT_BREAKER_KEYS`
+    """
+
+    circuit_key = "host"
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        recovery_timeout: float = DEFAULT_RECOVERY_TIMEOUT,
+        half_open_max_calls: int = DEFAULT_HALF_OPEN_MAX_CALLS,
+        store=None,
+        on_state_change: Optional[Callable[[str, str], None]] = None,
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.store = store or MemoryStateStore()
+        self.on_state_change = on_state_change
+
+    @classmethod
+    def from_config(cls, config, on_state_change: Optional[Callable[[str, str], None]] = None):
+        """
+        Circuit breaker of the `circuit_breaker` setting of a service. Disabled by default. Enable it with
+        `circuit_breaker: true` or configure it:
+        ```yaml
+        circuit_breaker:
+          failure_threshold: 5  # Consecutive failed calls (connection errors or status >= 500) that open a circuit
+          recovery_timeout: 30  # Seconds the circuit is open before allowing calls again
+          half_open_max_calls: 1  # Calls allowed to test if the downstream service is up again
+          key: host  # `host` or `template`: a circuit per downstream host or per url template
+          multiprocess: false  # Share the circuits between the workers of the host with a file
+          state_file: /var/run/my-service/circuit-breaker.json  # (optional) File used if multiprocess is true, in
+          # a directory of the user of the service. Default `pyms-circuit-breaker-<uid>` in the temporary directory
+        ```
+        :param config: value of the setting
+        :param on_state_change: (optional) callable called with the circuit and its new state
+        :return: CircuitBreaker or None if disabled
+        """
+        if not config:
+            return None
+        if not isinstance(config, dict):
+            config = {}
+        key = config.get("key", "host")
+        if key not in CIRCUIT_BREAKER_KEYS:
+            raise ConfigErrorException(
+                "Circuit breaker key {} not valid, use one of {}".format(key, ", ".join(CIRCUIT_BREAKER_KEYS))
+            )
+        store = MemoryStateStore()
+        if config.get("multiprocess", False):
+            store = FileStateStore(config.get("state_file") or cls.get_default_state_path())
+        breaker = cls(
+            failure_threshold=config.get("failure_threshold", DEFAULT_FAILURE_THRESHOLD),
+            recovery_timeout=config.get("recovery_timeout", DEFAULT_RECOVERY_TIMEOUT),
+            half_open_max_calls=config.get("half_open_max_calls", DEFAULT_HALF_OPEN_MAX_CALLS),
+            store=store,
+            on_state_change=on_state_change,
+        )
+        breaker.circuit_key = key
+        return breaker
+
+    def get_circuit(self, full_url: str, template: str = None) -> str:
+        """Circuit of a call, see `circuit_key`.
+
+        :param full_url: url of the request
+        :param template: (optional) url of the request before replacing the path parameters
+        :return: the circuit
+        """
+        if self.circuit_key == "template" and template:
+            return template
+        return SessionPool.get_pool_key(str(full_url))
+
+    def _set_state(self, key: str, state: Dict, new: str) -> None:
+        state["state"] = new
+        if new == OPEN:
+            state["opened_at"] = time.time()
+            logger.warning("Circuit breaker of %s opened after %s failures", key, state["failures"])
+        state["failures"] = 0
+        state["half_open_calls"] = 0
+        if self.on_state_change:
+            self.on_state_change(key, new)
+
+    def before_call(self, key: str) -> None:
+        """Check the circuit before a call.
+
+        :param key: circuit of the call
+        :raises CircuitBreakerOpenException: if the circuit is open
+        """
+        allowed = True
+        with self.store.transaction(key) as state:
+            if state["state"] == OPEN and time.time() - state["opened_at"] >= self.recovery_timeout:
+                self._set_state(key, state, HALF_OPEN)
+            if state["state"] == OPEN:
+                allowed = False
+            elif state["state"] == HALF_OPEN:
+                if time.time() - state.get("half_open_at", 0.0) >= self.recovery_timeout:
+                    # The calls that took the slots haven't finished: hung or lost with their worker
+                    state["half_open_calls"] = 0
+                allowed = state["half_open_calls"] < self.half_open_max_calls
+                if allowed:
+                    state["half_open_calls"] += 1
+                    state["half_open_at"] = time.time()
+        if not allowed:
+            raise CircuitBreakerOpenException("Circuit breaker of {} is open".format(key))
+
+    def release(self, key: str) -> None:
+        """Give back the half-open call taken by `before_call` when the call ended without a result, i.e: it was
+        cancelled or failed before reaching the downstream service, so another call can probe the circuit.
+
+        :param key: circuit of the call
+        """
+        with self.store.transaction(key) as state:
+            if state["state"] == HALF_OPEN and state["half_open_calls"] > 0:
+                state["half_open_calls"] -= 1
+
+    def record_success(self, key: str) -> None:
+        with self.store.transaction(key) as state:
+            if state["state"] == HALF_OPEN:
+                self._set_state(key, state, CLOSED)
+            elif state["failures"]:
+                state["failures"] = 0
+
+    def record_failure(self, key: str) -> None:
+        with self.store.transaction(key) as state:
+            if state["state"] == HALF_OPEN:
+                self._set_state(key, state, OPEN)
+            elif state["state"] == CLOSED:
+                state["failures"] += 1
+                if state["failures"] >= self.failure_threshold:
+                    self._set_state(key, state, OPEN)
+
+    def get_state(self, key: str) -> str:
+        with self.store.transaction(key) as state:
+            return state["state"]
+
+    @staticmethod
+    def get_default_state_path() -> str:
+        """File shared by the workers of the same master process (i.e: gunicorn), which is their parent process, in
+        a directory of the user in the temporary directory"""
+        path = get_user_temp_dir("pyms-circuit-breaker")
+        make_user_dir(path)
+        return os.path.join(path, "{}.json".format(os.getppid()))
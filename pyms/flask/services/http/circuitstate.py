@@ -0,0 +1,83 @@
+"""Stores of the state of the circuits of `pyms.flask.services.http.circuitbreaker`: in memory, shared by the threads
+of a worker, or in a file, shared by the workers of a host.
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+try:
+    import fcntl
+except ModuleNotFoundError:  # pragma: no cover
+    fcntl = None
+
+from pyms.exceptions import ConfigErrorException
+from pyms.utils.files import check_user_dir
+
+CLOSED = "closed"
+
+OPEN = "open"
+
+HALF_OPEN = "half_open"
+
+
+def new_state() -> Dict:
+    return {"state": CLOSED, "failures": 0, "opened_at": 0.0, "half_open_calls": 0, "half_open_at": 0.0}
+
+
+class MemoryStateStore:
+    """Keep the state of the circuits in memory, shared by all the threads of a worker."""
+
+    def __init__(self):
+        self._states: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self, key: str) -> Iterator[Dict]:
+        with self._lock:
+            yield self._states.setdefault(key, new_state())
+
+
+class FileStateStore:
+    """Keep the state of the circuits in a JSON file, shared by all the processes of a host (i.e: gunicorn workers).
+    Each transaction locks the file with `fcntl.flock`, so it only works in Unix. The directory of the file must
+    belong to the user of the service and not be writable by others, and the file can't be a symbolic link, else
+    `ConfigErrorException` is raised.
+    """
+
+    def __init__(self, path: str):
+        if fcntl is None:  # pragma: no cover
+            raise ConfigErrorException("Multiprocess circuit breaker needs fcntl, only available in Unix")
+        self.path = path
+        self._lock = threading.Lock()
+        check_user_dir(os.path.dirname(os.path.abspath(path)))
+
+    def _open(self):
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+        except OSError as ex:
+            raise ConfigErrorException(
+                "Circuit breaker state file {} can't be opened: {}".format(self.path, ex)
+            ) from ex
+        return os.fdopen(fd, "r+", encoding="utf-8")
+
+    @contextmanager
+    def transaction(self, key: str) -> Iterator[Dict]:
+        with self._lock, self._open() as state_file:
+            fcntl.flock(state_file, fcntl.LOCK_EX)
+            try:
+                state_file.seek(0)
+                content = state_file.read()
+                states = json.loads(content) if content else {}
+                state = states.setdefault(key, new_state())
+                previous = dict(state)
+                yield state
+                if state != previous:
+                    state_file.seek(0)
+                    state_file.truncate()
+                    state_file.write(json.dumps(states))
+                    state_file.flush()
+            finally:
+                fcntl.flock(state_file, fcntl.LOCK_UN)
@@ -0,0 +1,74 @@
+"""Headers of the inbound request propagated to the outbound calls. They are filtered once per inbound request and
+stored in the WSGI environ of the request, so all the calls done while handling a request share them, also the calls
+of `gather` that run in other threads with a copy of the request context and their own `flask.g`.
+"""
+
+from typing import Iterable, Optional, Tuple
+
+from flask import has_request_context, request
+
+# Headers meaningful only for a single connection, see https://tools.ietf.org/html/rfc7230#section-6.1
+HOP_BY_HOP_HEADERS = (
+    "Connection",
+    "Keep-Alive",
+    "Proxy-Authenticate",
+    "Proxy-Authorization",
+    "Proxy-Connection",
+    "TE",
+    "Trailer",
+    "Transfer-Encoding",
+    "Upgrade",
+)
+
+# Headers that describe the body or the destination of the inbound request, not of the outbound one
+DEFAULT_PROPAGATE_DENY_HEADERS = HOP_BY_HOP_HEADERS + ("Content-Length", "Content-Type", "Host")
+
+_ENVIRON_KEY = "pyms.propagate_headers"
+
+
+class HeadersFilter:
+    """Select the inbound headers to propagate.
+    **Atributes:**
+    * allow: lowercase names of the propagated headers, all the headers if empty
+    * deny: lowercase names of the headers never propagated, `DEFAULT_PROPAGATE_DENY_HEADERS` plus the given ones.
+    It has priority over `allow`
+    """
+
+    __slots__ = ("allow", "deny")
+
+    def __init__(self, allow: Optional[Iterable[str]] = None, deny: Optional[Iterable[str]] = None):
+        self.allow = frozenset(header.lower() for header in allow or ())
+        self.deny = frozenset(header.lower() for header in DEFAULT_PROPAGATE_DENY_HEADERS + tuple(deny or ()))
+
+    def is_propagated(self, header: str) -> bool:
+        header = header.lower()
+        return header not in self.deny and (not self.allow or header in self.allow)
+
+    def filter(self, headers: Iterable[Tuple[str, str]]) -> Tuple[Tuple[str, str], ...]:
+        """Filter a list of headers, keeping the first value of the repeated ones"""
+        selected = {}
+        for header, value in headers:
+            if header.lower() not in selected and self.is_propagated(header):
+                selected[header.lower()] = (header, value)
+        return tuple(selected.values())
+
+    def __hash__(self):
+        return hash((self.allow, self.deny))
+
+    def __eq__(self, other):
+        return isinstance(other, HeadersFilter) and (self.allow, self.deny) == (other.allow, other.deny)
+
+
+def get_propagated_headers(headers_filter: HeadersFilter) -> Tuple[Tuple[str, str], ...]:
+    """Filtered headers of the current request. They are computed the first time and stored in `request.environ`.
+
+    :param headers_filter: filter of the headers
+    :return: tuple of (header, value), empty outside of a request
+    """
+    if not has_request_context():
+        return ()
+    cache = request.environ.setdefault(_ENVIRON_KEY, {})
+    propagated = cache.get(headers_filter)
+    if propagated is None:
+        propagated = cache[headers_filter] = headers_filter.filter(request.headers.items())
+    return propagated
@@ -0,0 +1,132 @@
+"""Keep long-lived `requests.Session` objects to reuse TCP/TLS connections between outbound calls.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.cookiejar import DefaultCookiePolicy
+from typing import Callable, Dict, Iterator, List
+from urllib.parse import urlsplit
+
+import requests
+
+from pyms.constants import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+DEFAULT_POOL_CONNECTIONS = 10
+
+DEFAULT_POOL_MAXSIZE = 10
+
+DEFAULT_POOL_IDLE_TIMEOUT = 60
+
+
+class _PooledSession:
+    __slots__ = ("session", "last_used", "in_use")
+
+    def __init__(self, session: requests.Session):
+        self.session = session
+        self.last_used = time.monotonic()
+        self.in_use = 0
+
+
+class SessionPool:
+    """Share one `requests.Session` per target host (scheme + host + port) between all the threads of a worker.
+    The connection pool of each session is handled by urllib3, which is thread-safe. Sessions don't persist
+    cookies, so sharing them between calls behaves like the old "one session per request" approach.
+    If the process is forked (i.e: gunicorn with `preload_app`), the child process starts with an empty pool.
+    **Atributes:**
+    * session_factory: callable that returns a new configured `requests.Session`
+    * idle_timeout: seconds without use after which a session is closed. 0 or None disables the eviction
+    """
+
+    def __init__(
+        self, session_factory: Callable[[], requests.Session], idle_timeout: float = DEFAULT_POOL_IDLE_TIMEOUT
+    ):
+        self._session_factory = session_factory
+        self._idle_timeout = idle_timeout
+        self._sessions: Dict[str, _PooledSession] = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @staticmethod
+    def get_pool_key(url: str) -> str:
+        """Sessions are shared by all the urls of the same scheme, host and port.
+
+        :param url: full url of the request
+        :return: :class:`string`
+        """
+        parts = urlsplit(url)
+        return "{}://{}".format(parts.scheme.lower(), parts.netloc.lower())
+
+    @contextmanager
+    def session(self, url: str) -> Iterator[requests.Session]:
+        """Check out the session of the host of `url`. While the context is open, the session is not evicted.
+
+        :param url: full url of the request
+        """
+        pooled = self._checkout(self.get_pool_key(url))
+        try:
+            yield pooled.session
+        finally:
+            with self._lock:
+                pooled.in_use -= 1
+                pooled.last_used = time.monotonic()
+
+    def _checkout(self, key: str) -> _PooledSession:
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked process: the sockets of the parent can't be shared
+                self._sessions = {}
+                self._pid = os.getpid()
+            expired = self._pop_idle(time.monotonic())
+            pooled = self._sessions.get(key)
+            if pooled is None:
+                logger.debug("Creating pooled session for %s", key)
+                pooled = _PooledSession(self._new_session())
+                self._sessions[key] = pooled
+            pooled.in_use += 1
+        self._close_sessions(expired)
+        return pooled
+
+    def _new_session(self) -> requests.Session:
+        session = self._session_factory()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    def _pop_idle(self, now: float) -> List[requests.Session]:
+        if not self._idle_timeout:
+            return []
+        expired = [
+            key
+            for key, pooled in self._sessions.items()
+            if not pooled.in_use and now - pooled.last_used > self._idle_timeout
+        ]
+        return [self._sessions.pop(key).session for key in expired]
+
+    @staticmethod
+    def _close_sessions(sessions: List[requests.Session]) -> None:
+        for session in sessions:
+            session.close()
+
+    def evict_idle(self) -> int:
+        """Close the sessions that haven't been used in `idle_timeout` seconds.
+
+        :return: number of closed sessions
+        """
+        with self._lock:
+            expired = self._pop_idle(time.monotonic())
+        self._close_sessions(expired)
+        return len(expired)
+
+    def close(self) -> None:
+        """Close all the sessions of the pool, i.e: when the microservice shuts down."""
+        with self._lock:
+            sessions = [pooled.session for pooled in self._sessions.values()]
+            self._sessions = {}
+        self._close_sessions(sessions)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -0,0 +1,212 @@
+"""Retry policy of the outbound calls: exponential backoff with full jitter, `Retry-After` header and a retry budget
+that stops retrying when most of the calls are failing, i.e: a downstream service is down. `send_with_retries` and
+`send_with_retries_async` repeat a call while the policy allows it, for `requests` and `requests_async`.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Iterable, Optional, Tuple, Type
+
+DEFAULT_BACKOFF_FACTOR = 0.3
+
+DEFAULT_BACKOFF_MAX = 10
+
+DEFAULT_RETRY_BUDGET_RATIO = 0.2
+
+DEFAULT_RETRY_BUDGET_MIN_PER_SECOND = 10
+
+DEFAULT_RETRY_BUDGET_MAX_TOKENS = 100
+
+
+class RetryBudget:
+    """Token bucket shared by all the calls of a service in the process. Each successful call deposits `ratio`
+    tokens, each retry withdraws one token and, to allow retries with low traffic, the bucket is refilled with
+    `min_per_second` tokens per second. With a ratio of 0.2, retries are at most a 20% of the successful calls
+    plus `min_per_second`.
+    **Atributes:**
+    * ratio: tokens deposited by each successful call
+    * min_per_second: tokens deposited per second
+    * max_tokens: capacity of the bucket
+    """
+
+    def __init__(
+        self,
+        ratio: float = DEFAULT_RETRY_BUDGET_RATIO,
+        min_per_second: float = DEFAULT_RETRY_BUDGET_MIN_PER_SECOND,
+        max_tokens: float = DEFAULT_RETRY_BUDGET_MAX_TOKENS,
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max(max_tokens, min_per_second)
+        self._tokens = float(min_per_second)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._last_refill) * self.min_per_second)
+        self._last_refill = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        """Take a token to retry a call.
+
+        :return: False if the budget is exhausted and the call must not be retried
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+class RetryPolicy:
+    """Decide if a call is retried and how long to wait. It replaces both the retries of `urllib3` and the loop
+    that repeated the whole call, so a call is done at most `attempts` times.
+    **Atributes:**
+    * attempts: max number of times a call is done, including the first one
+    * status_retries: status codes that are retried
+    * backoff_factor: the wait before the attempt `n + 1` is a random value between 0 and
+      `backoff_factor * 2 ** (n - 1)` seconds (full jitter)
+    * backoff_max: max seconds to wait between attempts, also for `Retry-After` values
+    * budget: a `RetryBudget` or None to retry without limit
+    """
+
+    def __init__(
+        self,
+        attempts: int,
+        status_retries: Iterable[int],
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+        backoff_max: float = DEFAULT_BACKOFF_MAX,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self.attempts = max(int(attempts), 1)
+        self.status_retries = frozenset(status_retries or ())
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.budget = budget
+
+    def is_retryable(self, attempt: int, status_code: Optional[int] = None, retryable_error: bool = False) -> bool:
+        """Check if the call can be retried, without taking budget.
+
+        :param attempt: number of the attempt that just finished, starting from 1
+        :param status_code: status code of the response or None if the call raised an exception
+        :param retryable_error: the call raised an exception that can be retried
+        """
+        if attempt >= self.attempts:
+            return False
+        if status_code is None:
+            return retryable_error
+        return status_code in self.status_retries
+
+    def get_backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Seconds to wait before the next attempt.
+
+        :param attempt: number of the attempt that just finished, starting from 1
+        :param retry_after: value of the `Retry-After` header of the response, if any
+        """
+        retry_after_seconds = self.parse_retry_after(retry_after)
+        if retry_after_seconds is not None:
+            return min(retry_after_seconds, self.backoff_max)
+        backoff = min(self.backoff_max, self.backoff_factor * 2 ** (attempt - 1))
+        return random.uniform(0, backoff)  # nosec
+
+    def record_success(self) -> None:
+        if self.budget:
+            self.budget.deposit()
+
+    def try_acquire(self) -> bool:
+        """Take budget to retry a call. Returns False if the budget is exhausted"""
+        return self.budget.try_withdraw() if self.budget else True
+
+    @staticmethod
+    def parse_retry_after(retry_after: Optional[str]) -> Optional[float]:
+        """Parse the `Retry-After` header, in seconds or as a HTTP date.
+
+        :return: seconds to wait or None if the header is not valid
+        """
+        if not retry_after:
+            return None
+        retry_after = retry_after.strip()
+        if retry_after.isdigit():
+            return float(retry_after)
+        try:
+            retry_date = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError, IndexError):
+            return None
+        if retry_date is None:  # pragma: no cover
+            return None
+        return max(retry_date.timestamp() - time.time(), 0.0)
+
+
+# Seconds to wait before the next attempt, or None to stop, from the number of the attempt that just finished and its
+# response or its exception
+GetRetryDelay = Callable[[int, Any, Optional[Exception]], Optional[float]]
+
+
+def send_with_retries(
+    send: Callable[[], Any],
+    get_delay: GetRetryDelay,
+    errors: Tuple[Type[Exception], ...],
+    close: Callable[[Any], None],
+) -> Any:
+    """Call `send` until `get_delay` returns None.
+
+    :param send: function that does an attempt and returns its response
+    :param get_delay: see `GetRetryDelay`
+    :param errors: exceptions of `send` passed to `get_delay`, the others are raised
+    :param close: function to release a response that is retried
+    :return: the response of the last attempt
+    """
+    attempt = 1
+    while True:
+        try:
+            response = send()
+        except errors as ex:
+            delay = get_delay(attempt, None, ex)
+            if delay is None:
+                raise
+        else:
+            delay = get_delay(attempt, response, None)
+            if delay is None:
+                return response
+            close(response)
+        time.sleep(delay)
+        attempt += 1
+
+
+async def send_with_retries_async(
+    send: Callable[[], Awaitable],
+    get_delay: GetRetryDelay,
+    errors: Tuple[Type[Exception], ...],
+    close: Callable[[Any], Awaitable],
+) -> Any:
+    """Same as `send_with_retries` with a coroutine function `send` and an awaitable `close`"""
+    attempt = 1
+    while True:
+        try:
+            response = await send()
+        except errors as ex:
+            delay = get_delay(attempt, None, ex)
+            if delay is None:
+                raise
+        else:
+            delay = get_delay(attempt, response, None)
+            if delay is None:
+                return response
+            await close(response)
+        await asyncio.sleep(delay)
+        attempt += 1
@@ -0,0 +1,96 @@
+"""Coalesce identical concurrent calls: the first call (the leader) is sent and the calls with the same key that
+arrive while it's in flight wait for it and share its result, instead of sending the same request again.
+`RequestCoalescer` coalesces the GET calls of a service, configured with its `coalesce` setting.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional, Tuple
+
+from pyms.flask.services.http.cache import DEFAULT_CACHE_VARY_HEADERS, make_key
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Calls in flight of a worker, shared by all its threads."""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """Run `fn` or wait for the call in flight with the same key.
+
+        :param key: key of the call, see `pyms.flask.services.http.cache.make_key`
+        :param fn: callable without arguments that sends the call
+        :param timeout: (optional) seconds to wait for the call in flight. The call that runs `fn` isn't limited
+        :return: the result of the call and if it was shared with other call in flight. If the call raises an
+            exception, it's raised in all the calls that share it
+        :raises TimeoutError: if the call in flight doesn't finish in `timeout` seconds
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError("Call in flight not finished in {} seconds".format(timeout))
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+class RequestCoalescer(SingleFlight):
+    """Calls in flight of the GET requests of a service, with the settings of its `coalesce`, see `from_config`.
+    **Atributes:**
+    * vary_headers: request headers that change the response, part of the key of the calls
+    """
+
+    def __init__(self, vary_headers: Iterable[str] = DEFAULT_CACHE_VARY_HEADERS):
+        super().__init__()
+        self.vary_headers = tuple(vary_headers) + ("If-None-Match",)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Disabled by default. Enable it with `coalesce: true` or configure it:
+        ```yaml
+        coalesce:
+          vary_headers: ["Authorization", "Accept", "Accept-Language"]  # Request headers that change the response
+        ```
+        When enabled, concurrent GET calls with the same url, params and `vary_headers` share one request.
+        :param config: value of the setting
+        :return: RequestCoalescer or None if disabled
+        """
+        if not config:
+            return None
+        if not isinstance(config, dict):
+            config = {}
+        return cls(vary_headers=config.get("vary_headers", DEFAULT_CACHE_VARY_HEADERS))
+
+    def make_key(self, url: str, params: Any, headers: Mapping, arguments: Mapping) -> str:
+        """Key of a GET call, see `pyms.flask.services.http.cache.make_key`: the calls with different `timeout`
+        share the request, each one waits for it with its own timeout. The revalidations of the response cache
+        (`If-None-Match`) aren't shared with the plain calls"""
+        return make_key("GET", url, params, headers, self.vary_headers, arguments)
@@ -0,0 +1,59 @@
+"""Extract the `data` node of a JSON response while it's read from the socket, with
+[ijson](https://github.com/ICRAR/ijson). Only the selected node is built in memory, the sibling nodes are skipped.
+"""
+
+from typing import Any, Iterator, Optional, Sequence
+
+try:
+    import ijson
+except ModuleNotFoundError:  # pragma: no cover
+    ijson = None
+
+MISSING = object()
+
+JSONError = ijson.JSONError if ijson else ValueError
+
+
+def stream_available() -> bool:
+    return ijson is not None
+
+
+def get_path(data: Optional[str]) -> Sequence[str]:
+    """Split a dotted path like `results.items` in its keys"""
+    return tuple(key for key in (data or "").split(".") if key)
+
+
+def get_prefix(path: Sequence[str], items: bool = False) -> str:
+    """ijson prefix of a node or, if `items` is True, of the items of the array in the node"""
+    return ".".join(list(path) + (["item"] if items else []))
+
+
+def get_node(data: Any, path: Sequence[str]) -> Any:
+    """Select a node of a decoded JSON document. Returns `MISSING` if it doesn't exist"""
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return MISSING
+        data = data[key]
+    return data
+
+
+def stream_node(raw, path: Sequence[str]) -> Any:
+    """Parse the node of a JSON document from a file-like object, stopping once the node is complete.
+
+    :param raw: file-like object with the JSON document, i.e: `response.raw`
+    :param path: keys of the node
+    :return: the node or `MISSING` if it doesn't exist
+    """
+    for node in ijson.items(raw, get_prefix(path), use_float=True):
+        return node
+    return MISSING
+
+
+def stream_items(raw, path: Sequence[str]) -> Iterator[Any]:
+    """Parse the items of the array of a JSON document from a file-like object, one by one.
+
+    :param raw: file-like object with the JSON document, i.e: `response.raw`
+    :param path: keys of the array
+    :return: iterator of the items
+    """
+    return ijson.items(raw, get_prefix(path, items=True), use_float=True)
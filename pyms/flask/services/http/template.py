@@ -0,0 +1,146 @@
+"""URL templates like `http://users/{id}/posts`, parsed once and cached. The path parameters in the path and the
+query string are percent-encoded; the ones in the scheme, the host or at the start of the template (i.e:
+`{base_url}/users/{id}`) are inserted as they are. The template identifies the url in the `uri` label of the metrics,
+see `URILabels`.
+"""
+
+import functools
+import re
+import string
+import threading
+from typing import Any, List, Mapping, Optional, Tuple
+from urllib.parse import quote, urlsplit, urlunsplit
+
+from pyms.exceptions import PathParamsException
+
+DEFAULT_URL_TEMPLATES_CACHE_SIZE = 1024
+
+DEFAULT_METRICS_MAX_URIS = 500
+
+# `uri` label of the metrics of the calls when the service has called more than `metrics_max_uris` different urls
+METRICS_OTHER_URI = "other"
+
+_FORMATTER = string.Formatter()
+
+# Placeholder of the fields while the position of the path is searched
+_FIELD = "\0"
+
+# Values that don't change when they are percent-encoded
+_is_safe = re.compile(r"[A-Za-z0-9_.~-]*").fullmatch
+
+
+class URLTemplate:
+    """A parsed URL template.
+    **Atributes:**
+    * template: the template, used as identity of the url in the metrics
+    * fields: names of the path parameters
+    """
+
+    __slots__ = ("template", "fields", "_parts", "_url")
+
+    def __init__(self, template: str):
+        self.template = template
+        self._parts: List[Tuple[str, Optional[str], str, Optional[str], bool]] = []
+        parsed = list(_FORMATTER.parse(template))
+        skeleton = "".join(literal + (_FIELD if field is not None else "") for literal, field, _, _ in parsed)
+        path_start = self._get_path_start(skeleton)
+        position = 0
+        for literal, field, format_spec, conversion in parsed:
+            position += len(literal)
+            if field is not None:
+                if not field or field.isdigit():
+                    raise PathParamsException("Positional path parameters not allowed in {}".format(template))
+                self._parts.append((literal, field, format_spec, conversion, position >= path_start))
+                position += 1
+            else:
+                self._parts.append((literal, None, "", None, False))
+        self.fields = tuple(field for _, field, _, _, _ in self._parts if field is not None)
+        # Without fields the url is the unescaped literal, i.e: `{{` is `{`
+        self._url = "".join(literal for literal, _, _, _, _ in self._parts) if not self.fields else None
+
+    @staticmethod
+    def _get_path_start(skeleton: str) -> int:
+        """Position of the path in the template, the fields before it aren't encoded"""
+        scheme_end = skeleton.find("://")
+        if scheme_end != -1:
+            authority_start = scheme_end + 3
+            ends = [skeleton.find(c, authority_start) for c in "/?#"]
+            ends = [end for end in ends if end != -1]
+            return min(ends) if ends else len(skeleton)
+        if skeleton.startswith(_FIELD):
+            return 1
+        return 0
+
+    def expand(self, path_params: Optional[Mapping[str, Any]] = None) -> str:
+        """Build the url replacing the placeholders with the path parameters.
+
+        :param path_params: (optional) Dictionary with path parameters values
+        :return: the url
+        :raises PathParamsException: if a path parameter is missing
+        """
+        if self._url is not None:
+            return self._url
+        path_params = path_params or {}
+        url = []
+        for literal, field, format_spec, conversion, encode in self._parts:
+            url.append(literal)
+            if field is None:
+                continue
+            try:
+                value = path_params[field] if field in path_params else _FORMATTER.get_field(field, (), path_params)[0]
+            except (KeyError, AttributeError, IndexError, TypeError) as ex:
+                raise PathParamsException(
+                    "Path parameters {} missing to build {}".format(self._get_missing(path_params), self.template)
+                ) from ex
+            if conversion:
+                value = _FORMATTER.convert_field(value, conversion)
+            value = format(value, format_spec) if format_spec else str(value)
+            if encode and not _is_safe(value):
+                value = quote(value, safe="")
+            url.append(value)
+        return "".join(url)
+
+    def _get_missing(self, path_params: Mapping[str, Any]) -> str:
+        return ", ".join(field for field in self.fields if re.split(r"[.\[]", field)[0] not in path_params)
+
+    def __repr__(self):
+        return "URLTemplate({!r})".format(self.template)
+
+
+@functools.lru_cache(maxsize=DEFAULT_URL_TEMPLATES_CACHE_SIZE)
+def compile_template(template: str) -> URLTemplate:
+    """Parse a URL template, or return it from the cache if it was already parsed"""
+    return URLTemplate(template)
+
+
+class URILabels:
+    """`uri` labels of the metrics of the calls of a service. To bound the number of series, after `max_uris`
+    different urls the new ones are labeled as `other`.
+    **Atributes:**
+    * max_uris: max number of different labels
+    """
+
+    def __init__(self, max_uris: int = DEFAULT_METRICS_MAX_URIS):
+        self.max_uris = max_uris
+        self._uris: set = set()
+        self._lock = threading.Lock()
+
+    def get(self, full_url: str, template: str = None) -> str:
+        """Label of a call: the url before replacing the path parameters (i.e: `http://users/{id}`), or the url
+        without query string if the template is unknown.
+
+        :param full_url: url of the request
+        :param template: (optional) url of the request before replacing the path parameters
+        :return: the `uri` label
+        """
+        uri = template
+        if not uri:
+            parts = urlsplit(str(full_url))
+            uri = urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+        if uri in self._uris:
+            return uri
+        with self._lock:
+            if len(self._uris) >= self.max_uris:
+                return METRICS_OTHER_URI
+            self._uris.add(uri)
+        return uri
@@ -4,14 +4,11 @@ import time
 from flask import Blueprint, Flask, Response, request
 from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
 
-from pyms.config.conf import get_conf
-from pyms.flask.services.driver import DriverService, get_service_name
+from pyms.flask.services.driver import DriverService
 
 # Based on https://github.com/sbarratt/flask-prometheus
 # and https://github.com/korfuri/python-logging-prometheus/
 
-METRICS_CONFIG = get_conf(service=get_service_name(service="metrics"), empty_init=True)
-
 FLASK_REQUEST_COUNT = Counter(
     "http_server_requests_count", "Flask Request Count", ["service", "method", "uri", "status"]
 )
@@ -51,6 +48,8 @@ class Service(DriverService):
     Adds [Prometheus](https://prometheus.io/) metrics using the [Prometheus Client Library](https://github.com/prometheus/client_python).
     """
 
+    requires_app_reload = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.metrics_blueprint = Blueprint("metrics", __name__)
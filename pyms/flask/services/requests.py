@@ -1,59 +1,55 @@
 """Encapsulate common rest operations between business services propagating trace headers if configured.
 """
 
+import concurrent.futures
+import functools
 import logging
-from typing import Any
+import time
+from typing import Any, Callable, Iterable, Iterator, List, Optional
 
 import requests
-from flask import request
+from flask import copy_current_request_context, current_app, has_app_context, has_request_context
 from requests.adapters import HTTPAdapter, Response
-from urllib3.util.retry import Retry
+from urllib3.exceptions import NewConnectionError
 
-from pyms.config.conf import get_conf
 from pyms.constants import LOGGER_NAME
-from pyms.flask.services.driver import DriverService, get_service_name
-from pyms.flask.services.tracer import inject_span_in_headers
+from pyms.flask.services.driver import DriverService
+from pyms.flask.services.http import RequestCoalescer, ResponseCache, SessionPool
+from pyms.flask.services.http.base import (  # noqa: F401 pylint: disable=unused-import
+    CACHED_SETTINGS,
+    DEFAULT_RETRIES,
+    DEFAULT_STATUS_RETRIES,
+    IDEMPOTENT_METHODS,
+    BaseService,
+)
+from pyms.flask.services.http.cache import is_cacheable_call
+from pyms.flask.services.http.headers import get_propagated_headers
+from pyms.flask.services.http.pool import DEFAULT_POOL_CONNECTIONS
+from pyms.flask.services.http.retry import send_with_retries
+from pyms.flask.services.http.stream import (
+    MISSING,
+    JSONError,
+    stream_available,
+    stream_items,
+    stream_node,
+)
+from pyms.logger.lazy import log_debug
 
 try:
-    from prometheus_client import Counter, Histogram
+    from prometheus_client import Counter
 
-    REQUESTS_COUNT = Counter(
-        "http_client_requests_count", "Python requests count", ["service", "method", "uri", "status"]
-    )
-    REQUESTS_LATENCY = Histogram(
-        "http_client_requests_seconds", "Python requests latency", ["service", "method", "uri", "status"]
+    REQUESTS_COALESCED = Counter(
+        "http_client_coalesced_count",
+        "Python requests calls that shared the response of an identical call in flight",
+        ["service", "method", "uri"],
     )
 except ModuleNotFoundError:  # pragma: no cover
     pass
 
 logger = logging.getLogger(LOGGER_NAME)
 
-DEFAULT_RETRIES = 3
-
-DEFAULT_STATUS_RETRIES = (500, 502, 504)
-
-
-def retry(f) -> Any:
-    def wrapper(*args, **kwargs) -> Any:
-        response = False
-        i = 0
-        response_ok = False
-        retries = args[0].retries
-        status_retries = args[0].status_retries
-        while i < retries and response_ok is False:
-            response = f(*args, **kwargs)
-            i += 1
-            if response.status_code not in status_retries:
-                response_ok = True
-                logger.debug("Response {}".format(response))
-        if not response_ok:
-            logger.warning("Response ERROR: {}".format(response))
-        return response
-
-    return wrapper
 
-
-class Service(DriverService):
+class Service(BaseService):
     """
     Extend the [requests library](http://docs.python-requests.org/en/master/) with trace headers and parsing JSON objects.
     Encapsulate common rest operations between business services propagating trace headers if set up.
@@ -61,110 +57,98 @@ class Service(DriverService):
     """
 
     config_resource = "requests"
-    default_values = {
-        "data": "",
-        "retries": DEFAULT_RETRIES,
-        "status_retries": DEFAULT_STATUS_RETRIES,
-        "propagate_headers": False,
-    }
-    tracer = None
+    cached_settings = CACHED_SETTINGS + ("stream_data", "pool_connections")
+    default_values = dict(
+        BaseService.default_values,
+        stream_data=False,
+        pool_connections=DEFAULT_POOL_CONNECTIONS,
+        cache=False,
+        coalesce=False,
+    )
+    _cache: Optional[ResponseCache] = None
+    _single_flight: Optional[RequestCoalescer] = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = SessionPool(lambda: self.requests(session=requests.Session()), idle_timeout=self.pool_idle_timeout)
 
     def init_action(self, microservice_instance):
-        self.app_name = microservice_instance.application.config["APP_NAME"]  # pylint: disable=W0201
+        super().init_action(microservice_instance)
+        # Sessions created with the previous settings are discarded
+        self._pool.close()
+
+    def load_settings(self) -> None:
+        """Same as `pyms.flask.services.http.base.BaseService.load_settings`, plus the settings of the streamed
+        parsing, the sessions, the response cache and the coalescing of calls, see
+        `pyms.flask.services.http.cache.ResponseCache.from_config` and
+        `pyms.flask.services.http.singleflight.RequestCoalescer.from_config`.
+        :return: None
+        """
+        super().load_settings()
+        if self.stream_data and not stream_available():
+            logger.warning("stream_data needs ijson, try with pip install -U ijson. The responses are fully parsed")
+        self._cache = ResponseCache.from_config(
+            DriverService.__getattr__(self, "cache"), service=self.app_name if self._metrics_enabled else None
+        )
+        self._single_flight = RequestCoalescer.from_config(DriverService.__getattr__(self, "coalesce"))
+
+    def shutdown_action(self, _microservice_instance):
+        self._pool.close()
 
     def requests(self, session: requests.Session) -> requests.Session:
-        """
-        A backoff factor to apply between attempts after the second try (most errors are resolved immediately by a
-        second try without a delay). urllib3 will sleep for: {backoff factor} * (2 ^ ({number of total retries} - 1))
-        seconds. If the backoff_factor is 0.1, then sleep() will sleep for [0.0s, 0.2s, 0.4s, ...] between retries.
-        It will never be longer than Retry.BACKOFF_MAX. By default, backoff is disabled (set to 0).
+        """Mount the adapters with the pool settings in a session.
         :param session:
         :return:
         """
+        if self._retry_policy is None:
+            self.load_settings()
         session_r = session or requests.Session()
-        max_retries = Retry(
-            total=self.retries,
-            read=self.retries,
-            connect=self.retries,
-            backoff_factor=0.3,
-            status_forcelist=self.status_retries,
-        )
-        adapter = HTTPAdapter(max_retries=max_retries)
+        # Retries are handled by `_send` with the retry policy of the service, not by urllib3
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
         session_r.mount("http://", adapter)
         session_r.mount("https://", adapter)
-
-        metrics_enabled = get_conf(service=get_service_name(service="metrics"), empty_init=True)
-        if metrics_enabled:
-            session_r.hooks["response"] = [self.observe_requests]
         return session_r
 
-    @staticmethod
-    def insert_trace_headers(headers: dict) -> dict:
-        """Inject trace headers if enabled.
+    def parse_stream(self, response: Response) -> Any:
+        """Same as `parse_response` for a response requested with `stream=True`: the data node, that could be a
+        dotted path like `results.items`, is parsed while the body is read, without building the sibling nodes.
+        Falls back to `parse_response` if ijson is not installed.
 
-        :param headers: dictionary of HTTP Headers to send.
-
-        :rtype: dict
+        :param response: request's response requested with `stream=True`
+        :return: the data node
         """
-
+        if not stream_available():
+            return self.parse_response(response)
         try:
-            headers = inject_span_in_headers(headers)
-        except Exception as ex:  # pragma: no cover
-            logger.debug("Tracer error {}".format(ex))
-        return headers
-
-    @staticmethod
-    def set_propagate_headers(headers: dict) -> dict:
-        for k, v in request.headers:
-            if not headers.get(k):
-                headers.update({k: v})
-        return headers
-
-    def _get_headers(self, headers: dict, propagate_headers: bool = False) -> dict:
-        """If enabled appends trace headers to received ones.
-
-        :param headers: dictionary of HTTP Headers to send.
-
-        :rtype: dict
-        """
-
-        if not headers:
-            headers = {}
-
-        if self._propagate_headers or propagate_headers:
-            headers = self.set_propagate_headers(headers)
-        return headers
-
-    @staticmethod
-    def _build_url(url, path_params: dict = None) -> str:
-        """Compose full url replacing placeholders with path_params values.
-
-        :param url: base url
-        :param path_params: (optional) Dictionary, list of tuples with path parameters values to compose url
-        :return: :class:`string`
-        :rtype: string
-        """
-
-        return url.format_map(path_params)
-
-    def parse_response(self, response: Response) -> dict:
-        """Parses response's json object. Checks configuration in order to parse a concrete node or the whole response.
+            response.raw.decode_content = True
+            data = stream_node(response.raw, self._data_path)
+        except JSONError:
+            logger.warning("Response of %s is not a valid json", response.url)
+            return {}
+        finally:
+            response.close()
+        return {} if data is MISSING else data
 
-        :param response: request's response that contains a valid json
+    def iter_response(self, response: Response) -> Iterator[Any]:
+        """Iterate the items of the array found in the data node of a response requested with `stream=True`. With
+        ijson installed, each item is parsed while the body is read, so the whole list is never in memory.
 
-        :rtype: dict
+        :param response: request's response requested with `stream=True`
+        :return: iterator of the items
         """
-
         try:
-            data = response.json()
-            if self.data:
-                data = data.get(self.data, {})
-            return data
-        except ValueError:
-            logger.warning("Response.content is not a valid json {}".format(response.content))
-            return {}
+            if stream_available():
+                response.raw.decode_content = True
+                yield from stream_items(response.raw, self._data_path)
+            else:
+                data = self.parse_response(response)
+                if isinstance(data, list):
+                    yield from data
+        except JSONError:
+            logger.warning("Response of %s is not a valid json", response.url)
+        finally:
+            response.close()
 
-    @retry
     def get(
         self,
         url: str,
@@ -190,11 +174,33 @@ class Service(DriverService):
         full_url = self._build_url(url, path_params)
         headers = self._get_headers(headers=headers, propagate_headers=propagate_headers)
         headers = self.insert_trace_headers(headers)
-        logger.debug("Get with url {}, params {}, headers {}, kwargs {}".format(full_url, params, headers, kwargs))
+        log_debug(logger, "Get with", url=full_url, params=params, headers=headers, kwargs=kwargs)
 
-        session = requests.Session()
-        response = self.requests(session=session).get(full_url, params=params, headers=headers, **kwargs)
+        response = self._send_get(full_url, url, params, headers, **kwargs)
+
+        return response
 
+    def _send_get(self, full_url: str, template: str, params: dict, headers: dict, **kwargs) -> Response:
+        """Send a GET request, sharing the response with the identical calls in flight if `coalesce` is enabled.
+        The calls that share a response wait for it with their own `timeout`"""
+        send = functools.partial(self._send, "GET", full_url, template=template, params=params, headers=headers)
+        if self._single_flight is None or kwargs.get("stream"):
+            return send(**kwargs)
+        key = self._single_flight.make_key(full_url, params, headers, kwargs)
+        timeout = kwargs.get("timeout")
+        if isinstance(timeout, (tuple, list)):
+            # (connect, read) timeout of requests: wait for the call in flight at most both of them
+            timeout = None if None in timeout else sum(timeout)
+        try:
+            response, coalesced = self._single_flight.do(key, functools.partial(send, **kwargs), timeout=timeout)
+        except TimeoutError as ex:
+            raise requests.exceptions.ReadTimeout(
+                "Timeout waiting for the identical call in flight to {}".format(full_url)
+            ) from ex
+        if coalesced:
+            logger.debug("Response of %s shared with a call in flight", full_url)
+            if self._metrics_enabled:
+                REQUESTS_COALESCED.labels(self.app_name, "GET", self.get_metric_uri(full_url, template)).inc()
         return response
 
     def get_for_object(
@@ -212,10 +218,85 @@ class Service(DriverService):
         :rtype: requests.Response
         """
 
+        if self._cache is not None:
+            return self.get_cached_object(url, path_params=path_params, params=params, headers=headers, **kwargs)
+        if self.stream_data:
+            kwargs["stream"] = True
+            response = self.get(url, path_params=path_params, params=params, headers=headers, **kwargs)
+            return self.parse_stream(response)
         response = self.get(url, path_params=path_params, params=params, headers=headers, **kwargs)
         return self.parse_response(response)
 
-    @retry
+    def get_for_iterator(
+        self, url: str, path_params: dict = None, params: dict = None, headers: dict = None, **kwargs
+    ) -> Iterator[Any]:
+        """Sends a GET request and iterates the items of the array found in response's content data node. The
+        request is sent when this method is called, the items are parsed while they are iterated, so a view can
+        stream them:
+        ```python
+        users = current_app.ms.requests.get_for_iterator("http://users")
+        return Response(stream_with_context(json.dumps(user) + "\\n" for user in users))
+        ```
+
+        :param url: URL for the new :class:`Request` object. Could contain path parameters
+        :param path_params: (optional) Dictionary, list of tuples with path parameters values to compose url
+        :param params: (optional) Dictionary, list of tuples or bytes to send in the body of the :class:`Request` (as query
+                    string parameters)
+        :param headers: (optional) Dictionary of HTTP Headers to send with the :class:`Request`.
+        :param kwargs: Optional arguments that ``request`` takes.
+        :return: iterator of the items
+        """
+        kwargs["stream"] = True
+        response = self.get(url, path_params=path_params, params=params, headers=headers, **kwargs)
+        return self.iter_response(response)
+
+    def get_cached_object(
+        self,
+        url: str,
+        path_params: dict = None,
+        params: dict = None,
+        headers: dict = None,
+        propagate_headers: bool = False,
+        **kwargs
+    ) -> dict:
+        """`get_for_object` with the response cache. A fresh entry is returned without calling the service, an
+        expired entry with `ETag` is revalidated with `If-None-Match`. The entries are the result of
+        `parse_response`, shared by all the calls: don't modify them. The calls with credentials in `kwargs`
+        (`auth`, `cookies` or `cert`) aren't cached, and the responses whose `Vary` header has headers out of
+        `vary_headers`, or is `*`, aren't stored.
+
+        :param url: URL for the new :class:`Request` object. Could contain path parameters
+        :param path_params: (optional) Dictionary, list of tuples with path parameters values to compose url
+        :param params: (optional) Dictionary, list of tuples or bytes to send in the body of the :class:`Request` (as query
+                    string parameters)
+        :param headers: (optional) Dictionary of HTTP Headers to send with the :class:`Request`.
+        :param propagate_headers: Optional arguments that ``request`` takes.
+        :param kwargs: Optional arguments that ``request`` takes.
+        :return: dict
+        """
+        full_url, headers = self._prepare("GET", url, path_params, headers, propagate_headers)
+        if not is_cacheable_call(kwargs):
+            return self.parse_response(self._send_get(full_url, url, params, headers, **kwargs))
+        cache = self._cache
+        key = cache.make_key(full_url, params, headers, kwargs)
+        entry = cache.get(key)
+        if entry is not None and entry.is_fresh():
+            cache.observe(hit=True)
+            return entry.value
+        if entry is not None and entry.etag:
+            headers = dict(headers, **{"If-None-Match": entry.etag})
+
+        response = self._send_get(full_url, url, params, headers, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            cache.observe(hit=True)
+            cache.set(key, url, response.headers, entry.value)
+            return entry.value
+        cache.observe(hit=False)
+        value = self.parse_response(response)
+        if response.status_code == 200:
+            cache.set(key, url, response.headers, value)
+        return value
+
     def post(
         self, url: str, path_params: dict = None, data: dict = None, json: dict = None, headers: dict = None, **kwargs
     ) -> Response:
@@ -235,13 +316,9 @@ class Service(DriverService):
         full_url = self._build_url(url, path_params)
         headers = self._get_headers(headers)
         headers = self.insert_trace_headers(headers)
-        logger.debug(
-            "Post with url {}, data {}, json {}, headers {}, kwargs {}".format(full_url, data, json, headers, kwargs)
-        )
+        log_debug(logger, "Post with", url=full_url, data=data, json=json, headers=headers, kwargs=kwargs)
 
-        session = requests.Session()
-        response = self.requests(session=session).post(full_url, data=data, json=json, headers=headers, **kwargs)
-        logger.debug("Response {}".format(response))
+        response = self._send("POST", full_url, template=url, data=data, json=json, headers=headers, **kwargs)
 
         return response
 
@@ -264,7 +341,6 @@ class Service(DriverService):
         response = self.post(url, path_params=path_params, data=data, json=json, headers=headers, **kwargs)
         return self.parse_response(response)
 
-    @retry
     def put(self, url: str, path_params: dict = None, data: dict = None, headers: dict = None, **kwargs) -> Response:
         """Sends a PUT request.
 
@@ -282,11 +358,9 @@ class Service(DriverService):
         full_url = self._build_url(url, path_params)
         headers = self._get_headers(headers)
         headers = self.insert_trace_headers(headers)
-        logger.debug("Put with url {}, data {}, headers {}, kwargs {}".format(full_url, data, headers, kwargs))
+        log_debug(logger, "Put with", url=full_url, data=data, headers=headers, kwargs=kwargs)
 
-        session = requests.Session()
-        response = self.requests(session=session).put(full_url, data, headers=headers, **kwargs)
-        logger.debug("Response {}".format(response))
+        response = self._send("PUT", full_url, template=url, data=data, headers=headers, **kwargs)
 
         return response
 
@@ -309,7 +383,6 @@ class Service(DriverService):
         response = self.put(url, path_params=path_params, data=data, headers=headers, **kwargs)
         return self.parse_response(response)
 
-    @retry
     def patch(self, url: str, path_params: dict = None, data: dict = None, headers: dict = None, **kwargs) -> Response:
         """Sends a PATCH request.
 
@@ -327,11 +400,9 @@ class Service(DriverService):
         full_url = self._build_url(url, path_params)
         headers = self._get_headers(headers)
         headers = self.insert_trace_headers(headers)
-        logger.debug("Patch with url {}, data {}, headers {}, kwargs {}".format(full_url, data, headers, kwargs))
+        log_debug(logger, "Patch with", url=full_url, data=data, headers=headers, kwargs=kwargs)
 
-        session = requests.Session()
-        response = self.requests(session=session).patch(full_url, data, headers=headers, **kwargs)
-        logger.debug("Response {}".format(response))
+        response = self._send("PATCH", full_url, template=url, data=data, headers=headers, **kwargs)
 
         return response
 
@@ -354,7 +425,6 @@ class Service(DriverService):
         response = self.patch(url, path_params=path_params, data=data, headers=headers, **kwargs)
         return self.parse_response(response)
 
-    @retry
     def delete(self, url: str, path_params: dict = None, headers: dict = None, **kwargs) -> Response:
         """Sends a DELETE request.
 
@@ -369,16 +439,119 @@ class Service(DriverService):
         full_url = self._build_url(url, path_params)
         headers = self._get_headers(headers)
         headers = self.insert_trace_headers(headers)
-        logger.debug("Delete with url {}, headers {}, kwargs {}".format(full_url, headers, kwargs))
+        log_debug(logger, "Delete with", url=full_url, headers=headers, kwargs=kwargs)
 
-        session = requests.Session()
-        response = self.requests(session=session).delete(full_url, headers=headers, **kwargs)
-        logger.debug("Response {}".format(response))
+        response = self._send("DELETE", full_url, template=url, headers=headers, **kwargs)
 
         return response
 
-    def observe_requests(self, response, *args, **kwargs):
-        REQUESTS_COUNT.labels(self.app_name, response.request.method, response.url, response.status_code).inc()
-        REQUESTS_LATENCY.labels(self.app_name, response.request.method, response.url, response.status_code).observe(
-            float(response.elapsed.total_seconds())
-        )
+    @staticmethod
+    def is_retryable_error(method: str, error: Exception) -> bool:
+        """Connection errors are always retried because the request wasn't sent. Other network errors, like
+        timeouts reading the response, only for idempotent methods.
+
+        :param method: HTTP method of the request
+        :param error: exception raised by the request
+        """
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        if isinstance(error, requests.exceptions.ConnectTimeout) or isinstance(reason, NewConnectionError):
+            return True
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return method.upper() in IDEMPOTENT_METHODS
+        return False
+
+    def _send(self, method: str, full_url: str, template: str = None, **kwargs) -> Response:
+        """Send a request with the pooled session of the host, following the retry policy and the circuit breaker
+        of the service.
+
+        :param method: HTTP method of the request
+        :param full_url: url of the request
+        :param template: (optional) url of the request before replacing the path parameters
+        :param kwargs: Optional arguments that ``request`` takes.
+        :return: :class:`Response <Response>` object
+        """
+        if self._retry_policy is None:
+            self.load_settings()
+        kwargs = self.encode_json_body(kwargs)
+        uri = self.get_metric_uri(full_url, template) if self._metrics_enabled else None
+        circuit = self.check_circuit(full_url, template)
+        response, error = None, None
+        try:
+            response = self._send_with_retries(method, full_url, uri, **kwargs)
+        except requests.exceptions.RequestException as ex:
+            error = ex
+            raise
+        finally:
+            # Any other exception releases the circuit, so a half-open circuit isn't blocked forever
+            self.record_circuit(circuit, response=response, error=error)
+        return response
+
+    def _send_with_retries(self, method: str, full_url: str, uri: Optional[str], **kwargs) -> Response:
+        with self._pool.session(full_url) as session:
+            return send_with_retries(
+                functools.partial(session.request, method, full_url, **kwargs),
+                functools.partial(self.get_attempt_delay, method, uri),
+                (requests.exceptions.RequestException,),
+                Response.close,
+            )
+
+    @staticmethod
+    def with_flask_context(fn: Callable[[], Any]) -> Callable[[], Any]:
+        """Run `fn` with a copy of the current Flask request context (or app context) in other thread, so
+        `propagate_headers` and `inject_span_in_headers` works in the workers of `gather`.
+        """
+        if has_request_context():
+            return copy_current_request_context(fn)
+        if has_app_context():
+            app = current_app._get_current_object()  # pylint: disable=protected-access
+
+            def wrapper():
+                with app.app_context():
+                    return fn()
+
+            return wrapper
+        return fn
+
+    def gather(self, calls: Iterable[dict], max_concurrency: int = None, timeout: float = None) -> List[Any]:
+        """Run a list of calls in a pool of threads that share the pooled sessions. The total latency is the
+        latency of the slowest call instead of the sum of all of them.
+        ```python
+        users, posts = current_app.ms.requests.gather([
+            {"method": "get_for_object", "url": "http://users/{id}", "path_params": {"id": 1}},
+            {"method": "get_for_object", "url": "http://posts", "params": {"user": 1}},
+        ])
+        ```
+
+        :param calls: list of dictionaries with the key `method` (`get`, `post`, `get_for_object`...) and the
+            arguments of this method.
+        :param max_concurrency: (optional) max number of calls running at the same time. Default `max_concurrency`
+            of the configuration
+        :param timeout: (optional) seconds to wait for all calls. The calls not started yet are cancelled and the
+            calls without their own `timeout` get the seconds left as `timeout` of `requests`, so their workers stop
+            too. A call in flight keeps running until its attempt times out, and it may be retried
+        :return: list with the result of each call in the same order. If a call fails or doesn't finish before
+            the timeout, its result is the exception.
+        """
+        calls = list(calls)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        funcs = [self.with_flask_context(self.get_call(call, deadline)) for call in calls]
+        if not funcs:
+            return []
+        if self.propagate_headers or any(call.get("propagate_headers") for call in calls):
+            # Filtered before starting the workers, so they don't filter them at the same time
+            get_propagated_headers(self._headers_filter)
+        max_workers = min(max_concurrency or self.max_concurrency, len(funcs))
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pyms-requests")
+        futures = [executor.submit(fn) for fn in funcs]
+        _, not_done = concurrent.futures.wait(futures, timeout=timeout)
+        for future in not_done:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+        results = []
+        for future in futures:
+            if future in not_done:
+                results.append(concurrent.futures.TimeoutError("Call not finished in {} seconds".format(timeout)))
+            else:
+                results.append(future.exception() or future.result())
+        return results
@@ -0,0 +1,403 @@
+"""Asynchronous version of `pyms.flask.services.requests`. Encapsulate common rest operations between business
+services with [HTTPX](https://www.python-httpx.org/), propagating trace headers if configured.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import os
+import threading
+import weakref
+from typing import Any, Awaitable, Iterable, Iterator, List
+
+try:
+    import httpx
+except ModuleNotFoundError:  # pragma: no cover
+    httpx = None
+
+from pyms.constants import LOGGER_NAME
+from pyms.exceptions import ConfigErrorException
+from pyms.flask.services.driver import DriverService
+from pyms.flask.services.http.base import IDEMPOTENT_METHODS, BaseService
+from pyms.flask.services.http.retry import send_with_retries_async
+from pyms.utils import check_package_exists
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Settings of `requests` that need sync calls: the response cache, the coalescing of calls and the streamed parsing.
+# They are rejected, so a configuration copied from `requests` doesn't silently lose them
+UNSUPPORTED_SETTINGS = ("cache", "coalesce", "stream_data")
+
+
+class EventLoopThread:
+    """Run an asyncio event loop in a daemon thread. Sync code, like a Flask view, submits coroutines to it and
+    waits for the result, while the coroutines share the loop and its pooled connections.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="pyms-requests-async", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine: Awaitable) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+class Service(BaseService):
+    """
+    Same API as `pyms.flask.services.requests.Service`, but `get`, `post`, `put`, `patch`, `delete` and their
+    `*_for_object` versions return awaitables. The headers (trace headers and `propagate_headers`) are computed
+    when the method is called, so the Flask request context is only needed in the caller.
+    Use `run` to execute a batch of calls concurrently from a sync Flask view:
+    ```python
+    users, posts = current_app.ms.requests_async.run(
+        current_app.ms.requests_async.get_for_object("http://users/{id}", path_params={"id": 1}),
+        current_app.ms.requests_async.get_for_object("http://posts", params={"user": 1}),
+    )
+    ```
+    The settings `cache`, `coalesce` and `stream_data` aren't supported, see `load_settings`.
+    All default values keys are created as class attributes in `DriverService`
+    """
+
+    config_resource = "requests_async"
+
+    def __init__(self, *args, **kwargs):
+        check_package_exists("httpx")
+        super().__init__(*args, **kwargs)
+        self._loop_thread = None
+        self._loop_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._clients = weakref.WeakKeyDictionary()
+
+    def shutdown_action(self, _microservice_instance):
+        with self._loop_lock:
+            loop_thread, self._loop_thread = self._loop_thread, None
+        if loop_thread:
+            client = self._clients.pop(loop_thread.loop, None)
+            if client:
+                loop_thread.submit(client.aclose()).result()
+            loop_thread.stop()
+
+    def load_settings(self) -> None:
+        """Same as `pyms.flask.services.http.base.BaseService.load_settings`
+        :raises ConfigErrorException: if a setting of `UNSUPPORTED_SETTINGS` is enabled
+        """
+        for setting in UNSUPPORTED_SETTINGS:
+            if DriverService.__getattr__(self, setting):
+                raise ConfigErrorException("{} is not supported by requests_async, use requests".format(setting))
+        super().load_settings()
+
+    def _get_loop_thread(self) -> EventLoopThread:
+        with self._loop_lock:
+            if self._pid != os.getpid():
+                # Forked process: the thread of the event loop only exists in the parent
+                self._loop_thread = None
+                self._clients = weakref.WeakKeyDictionary()
+                self._pid = os.getpid()
+            if self._loop_thread is None:
+                self._loop_thread = EventLoopThread()
+            return self._loop_thread
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        """Return the pooled client of the running event loop. A client can't be shared between loops"""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            if self._retry_policy is None:
+                self.load_settings()
+            limits = httpx.Limits(
+                max_connections=None,
+                max_keepalive_connections=self.pool_maxsize,
+                keepalive_expiry=self.pool_idle_timeout or None,
+            )
+            # Retries are handled by `_send_async` with the retry policy of the service
+            transport = httpx.AsyncHTTPTransport(limits=limits)
+            client = httpx.AsyncClient(transport=transport, timeout=None)
+            self._clients[loop] = client
+        return client
+
+    def run(self, *calls: Awaitable, return_exceptions: bool = False, timeout: float = None) -> List[Any]:
+        """Run a batch of calls concurrently and wait for all of them. Results are returned in the same order.
+
+        :param calls: awaitables returned by the methods of this service
+        :param return_exceptions: (optional) return the exceptions as results instead of raising the first one
+        :param timeout: (optional) seconds to wait for the whole batch
+        :return: list with the results of each call
+        """
+
+        async def gather():
+            return await asyncio.gather(*calls, return_exceptions=return_exceptions)
+
+        return self._get_loop_thread().submit(gather()).result(timeout)
+
+    def gather(self, calls: Iterable[dict], max_concurrency: int = None, timeout: float = None) -> List[Any]:
+        """Same as `pyms.flask.services.requests.Service.gather`, but the calls run in the event loop of the
+        service instead of a pool of threads.
+
+        :param calls: list of dictionaries with the key `method` (`get`, `post`, `get_for_object`...) and the
+            arguments of this method.
+        :param max_concurrency: (optional) max number of calls running at the same time. Default `max_concurrency`
+            of the configuration
+        :param timeout: (optional) seconds to wait for all calls
+        :return: list with the result of each call in the same order. If a call fails or doesn't finish before
+            the timeout, its result is the exception.
+        """
+        awaitables = [self.get_call(call)() for call in calls]
+        if not awaitables:
+            return []
+        max_concurrency = max_concurrency or self.max_concurrency
+
+        async def gather():
+            semaphore = asyncio.Semaphore(max_concurrency)
+
+            async def bounded(awaitable):
+                async with semaphore:
+                    return await awaitable
+
+            tasks = [asyncio.ensure_future(bounded(awaitable)) for awaitable in awaitables]
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            results = []
+            for task in tasks:
+                if task in pending:
+                    results.append(concurrent.futures.TimeoutError("Call not finished in {} seconds".format(timeout)))
+                else:
+                    results.append(task.exception() or task.result())
+            return results
+
+        return self._get_loop_thread().submit(gather()).result()
+
+    @staticmethod
+    def is_retryable_error(method: str, error: Exception) -> bool:
+        """Same rules as `pyms.flask.services.requests.Service.is_retryable_error` for HTTPX exceptions"""
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+            return True
+        if isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+            return method.upper() in IDEMPOTENT_METHODS
+        return False
+
+    async def _send_async(self, method: str, url: str, template: str = None, **kwargs) -> "httpx.Response":
+        """Send a request with the pooled client of the event loop, following the retry policy and the circuit
+        breaker of the service.
+
+        :param method: HTTP method of the request
+        :param url: url of the request
+        :param template: (optional) url of the request before replacing the path parameters
+        :param kwargs: Optional arguments that ``httpx.AsyncClient.request`` takes.
+        :return: :class:`httpx.Response` object
+        """
+        kwargs = self.encode_json_body(kwargs)
+        data = kwargs.pop("data", None)
+        if isinstance(data, (bytes, str)):
+            kwargs["content"] = data
+        elif data is not None:
+            kwargs["data"] = data
+
+        client = self._get_client()
+        uri = self.get_metric_uri(url, template) if self._metrics_enabled else None
+        circuit = self.check_circuit(url, template)
+        try:
+            response = await send_with_retries_async(
+                functools.partial(client.request, method, url, **kwargs),
+                functools.partial(self.get_attempt_delay, method, uri),
+                (httpx.HTTPError,),
+                httpx.Response.aclose,
+            )
+        except httpx.HTTPError as ex:
+            self.record_circuit(circuit, error=ex)
+            raise
+        except BaseException:
+            # A cancelled call, i.e: by the timeout of `gather`, releases the circuit
+            self.record_circuit(circuit)
+            raise
+        self.record_circuit(circuit, response=response)
+        return response
+
+    async def _parse(self, response: Awaitable) -> dict:
+        return self.parse_response(await response)
+
+    async def _parse_items(self, response: Awaitable) -> Iterator[Any]:
+        data = self.parse_response(await response)
+        return iter(data if isinstance(data, list) else [])
+
+    def get(
+        self,
+        url: str,
+        path_params: dict = None,
+        params: dict = None,
+        headers: dict = None,
+        propagate_headers: bool = False,
+        **kwargs
+    ) -> Awaitable["httpx.Response"]:
+        """Sends a GET request.
+
+        :param url: URL for the new :class:`Request` object. Could contain path parameters
+        :param path_params: (optional) Dictionary, list of tuples with path parameters values to compose url
+        :param params: (optional) Dictionary, list of tuples or bytes to send in the body of the :class:`Request` (as query
+                    string parameters)
+        :param headers: (optional) Dictionary of HTTP Headers to send with the :class:`Request`.
+        :param propagate_headers: Optional arguments that ``request`` takes.
+        :param kwargs: Optional arguments that ``httpx.AsyncClient.request`` takes.
+        :return: awaitable of :class:`httpx.Response` object
+        """
+
+        full_url, headers = self._prepare("GET", url, path_params, headers, propagate_headers)
+        return self._send_async("GET", full_url, template=url, params=params, headers=headers, **kwargs)
+
+    def get_for_object(
+        self, url: str, path_params: dict = None, params: dict = None, headers: dict = None, **kwargs
+    ) -> Awaitable[dict]:
+        """Sends a GET request and returns the json representation found in response's content data node.
+
+        :param url: URL for the new :class:`Request` object. Could contain path parameters
+        :param path_params: (optional) Dictionary, list of tuples with path parameters values to compose url
+        :param params: (optional) Dictionary, list of tuples or bytes to send in the body of the :class:`Request` (as query
+                    string parameters)
+        :param headers: (optional) Dictionary of HTTP Headers to send with the :class:`Request`.
+        :param kwargs: Optional arguments that ``httpx.AsyncClient.request`` takes.
+        :return: awaitable of dict
+        """
+
+        return self._parse(self.get(url, path_params=path_params, params=params, headers=headers, **kwargs))
+
+    def get_for_iterator(
+        self, url: str, path_params: dict = None, params: dict = None, headers: dict = None, **kwargs
+    ) -> Awaitable[Iterator[Any]]:
+        """Sends a GET request and returns an iterator of the items of the array found in response's content data
+        node. Unlike `pyms.flask.services.requests.Service.get_for_iterator`, the response is fully read and parsed.
+
+        :param url: URL for the new :class:`Request` object. Could contain path parameters
+        :param path_params: (optional) Dictionary, list of tuples with path parameters values to compose url
+        :param params: (optional) Dictionary, list of tuples or bytes to send in the body of the :class:`Request` (as query
+                    string parameters)
+        :param headers: (optional) Dictionary of HTTP Headers to send with the :class:`Request`.
+        :param kwargs: Optional arguments that ``httpx.AsyncClient.request`` takes.
+        :return: awaitable of the iterator of the items
+        """
+
+        return self._parse_items(self.get(url, path_params=path_params, params=params, headers=headers, **kwargs))
+
+    def post(
+        self, url: str, path_params: dict = None, data: dict = None, json: dict = None, headers: dict = None, **kwargs
+    ) -> Awaitable["httpx.Response"]:
+        """Sends a POST request.
+
+        :param url: URL for the new :class:`Request` object. Could contain path parameters
+        :param path_params: (optional) Dictionary, list of tuples with path parameters values to compose url
+        :param data: (optional) Dictionary, list of tuples, bytes, or file-like object to send in the body of the
+                    :class:`Request`.
+        :param json: (optional) json data to send in the body of the :class:`Request`.
+        :param headers: (optional) Dictionary of HTTP Headers to send with the :class:`Request`.
+        :param kwargs: Optional arguments that ``httpx.AsyncClient.request`` takes.
+        :return: awaitable of :class:`httpx.Response` object
+        """
+
+        full_url, headers = self._prepare("POST", url, path_params, headers)
+        return self._send_async("POST", full_url, template=url, data=data, json=json, headers=headers, **kwargs)
+
+    def post_for_object(
+        self, url: str, path_params: dict = None, data: dict = None, json: dict = None, headers: dict = None, **kwargs
+    ) -> Awaitable[dict]:
+        """Sends a POST request and returns the json representation found in response's content data node.
+
+        :param url: URL for the new :class:`Request` object. Could contain path parameters
+        :param path_params: (optional) Dictionary, list of tuples with path parameters values to compose url
+        :param data: (optional) Dictionary, list of tuples, bytes, or file-like object to send in the body of the
+                    :class:`Request`.
+        :param json: (optional) json data to send in the body of the :class:`Request`.
+        :param headers: (optional) Dictionary of HTTP Headers to send with the :class:`Request`.
+        :param kwargs: Optional arguments that ``httpx.AsyncClient.request`` takes.
+        :return: awaitable of dict
+        """
+
+        return self._parse(self.post(url, path_params=path_params, data=data, json=json, headers=headers, **kwargs))
+
+    def put(
+        self, url: str, path_params: dict = None, data: dict = None, headers: dict = None, **kwargs
+    ) -> Awaitable["httpx.Response"]:
+        """Sends a PUT request.
+
+        :param url: URL for the new :class:`Request` object. Could contain path parameters
+        :param path_params: (optional) Dictionary, list of tuples with path parameters values to compose url
+        :param data: (optional) Dictionary, list of tuples, bytes, or file-like
+            object to send in the body of the :class:`Request`.
+        :param headers: (optional) Dictionary of HTTP Headers to send with the :class:`Request`.
+        :param kwargs: Optional arguments that ``httpx.AsyncClient.request`` takes.
+        :return: awaitable of :class:`httpx.Response` object
+        """
+
+        full_url, headers = self._prepare("PUT", url, path_params, headers)
+        return self._send_async("PUT", full_url, template=url, data=data, headers=headers, **kwargs)
+
+    def put_for_object(
+        self, url: str, path_params: dict = None, data: dict = None, headers: dict = None, **kwargs
+    ) -> Awaitable[dict]:
+        """Sends a PUT request and returns the json representation found in response's content data node.
+
+        :param url: URL for the new :class:`Request` object. Could contain path parameters
+        :param path_params: (optional) Dictionary, list of tuples with path parameters values to compose url
+        :param data: (optional) Dictionary, list of tuples, bytes, or file-like
+            object to send in the body of the :class:`Request`.
+        :param headers: (optional) Dictionary of HTTP Headers to send with the :class:`Request`.
+        :param kwargs: Optional arguments that ``httpx.AsyncClient.request`` takes.
+        :return: awaitable of dict
+        """
+
+        return self._parse(self.put(url, path_params=path_params, data=data, headers=headers, **kwargs))
+
+    def patch(
+        self, url: str, path_params: dict = None, data: dict = None, headers: dict = None, **kwargs
+    ) -> Awaitable["httpx.Response"]:
+        """Sends a PATCH request.
+
+        :param url: URL for the new :class:`Request` object. Could contain path parameters
+        :param path_params: (optional) Dictionary, list of tuples with path parameters values to compose url
+        :param data: (optional) Dictionary, list of tuples, bytes, or file-like
+            object to send in the body of the :class:`Request`.
+        :param headers: (optional) Dictionary of HTTP Headers to send with the :class:`Request`.
+        :param kwargs: Optional arguments that ``httpx.AsyncClient.request`` takes.
+        :return: awaitable of :class:`httpx.Response` object
+        """
+
+        full_url, headers = self._prepare("PATCH", url, path_params, headers)
+        return self._send_async("PATCH", full_url, template=url, data=data, headers=headers, **kwargs)
+
+    def patch_for_object(
+        self, url: str, path_params: dict = None, data: dict = None, headers: dict = None, **kwargs
+    ) -> Awaitable[dict]:
+        """Sends a PATCH request and returns the json representation found in response's content data node.
+
+        :param url: URL for the new :class:`Request` object. Could contain path parameters
+        :param path_params: (optional) Dictionary, list of tuples with path parameters values to compose url
+        :param data: (optional) Dictionary, list of tuples, bytes, or file-like
+            object to send in the body of the :class:`Request`.
+        :param headers: (optional) Dictionary of HTTP Headers to send with the :class:`Request`.
+        :param kwargs: Optional arguments that ``httpx.AsyncClient.request`` takes.
+        :return: awaitable of dict
+        """
+
+        return self._parse(self.patch(url, path_params=path_params, data=data, headers=headers, **kwargs))
+
+    def delete(self, url: str, path_params: dict = None, headers: dict = None, **kwargs) -> Awaitable["httpx.Response"]:
+        """Sends a DELETE request.
+
+        :param url: URL for the new :class:`Request` object. Could contain path parameters
+        :param path_params: (optional) Dictionary, list of tuples with path parameters values to compose url
+        :param headers: (optional) Dictionary of HTTP Headers to send with the :class:`Request`.
+        :param kwargs: Optional arguments that ``httpx.AsyncClient.request`` takes.
+        :return: awaitable of :class:`httpx.Response` object
+        """
+
+        full_url, headers = self._prepare("DELETE", url, path_params, headers)
+        return self._send_async("DELETE", full_url, template=url, headers=headers, **kwargs)
@@ -1,13 +1,8 @@
 import logging
 
-try:
-    import consulate
-except ModuleNotFoundError:  # pragma: no cover
-    consulate = None
-
 from pyms.constants import LOGGER_NAME
 from pyms.flask.services.driver import DriverService
-from pyms.utils.utils import import_class
+from pyms.utils.utils import check_package_exists, import_class, import_package
 
 logger = logging.getLogger(LOGGER_NAME)
 
@@ -29,6 +24,8 @@ class ServiceDiscoveryBase:
 class ServiceDiscoveryConsul(ServiceDiscoveryBase):
     def __init__(self, config):
         super().__init__(config)
+        check_package_exists("consulate")
+        consulate = import_package("consulate")
         self.client = consulate.Consul(
             host=config.host, port=config.port, token=config.token, scheme=config.scheme, adapter=config.adapter
         )
@@ -1,26 +1,43 @@
+"""Swagger service, built with [Connexion](https://github.com/spec-first/connexion). connexion and prance are
+imported when the app is created, not when this module is imported.
+
+With `spec_cache: true`, the spec resolved and validated by prance is cached in a JSON file of a cache directory of
+the user, `~/.cache/pyms` by default. The cache is used while the hash of the spec file and of the files of its
+`$ref`s doesn't change; `pyms merge-swagger --cache` builds it, e.g. when the image is built. A spec with a `$ref` to
+a URL isn't cached, its content can change without changing the files.
+"""
+
+import hashlib
+import importlib.metadata
+import importlib.util
+import logging
 import os
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import unquote, urlsplit
 
-import connexion
-from connexion.options import SwaggerUIOptions
-from connexion.resolver import RestyResolver
+import yaml
 from flask import Flask
 
-try:
-    import prance
-    from prance.util import formats, fs
-except ModuleNotFoundError:  # pragma: no cover
-    prance = None
-
+from pyms.constants import LOGGER_NAME
 from pyms.exceptions import AttrDoesNotExistException
 from pyms.flask.services.driver import DriverService
-from pyms.utils.utils import check_package_exists, import_class
+from pyms.utils.files import check_user_dir
+from pyms.utils.json_backend import get_json_backend
+from pyms.utils.utils import check_package_exists, import_class, import_from, import_package
 
 SWAGGER_PATH = "swagger"
 SWAGGER_FILE = "swagger.yaml"
 SWAGGER_URL = "ui/"
 PROJECT_DIR = "project"
+MERGED_SWAGGER_FILE = "swagger-complete.yaml"
+
+SPEC_CACHE_VERSION = 2
+
+# The C loader of libyaml, if PyYAML was built with it, parses the files of the spec several times faster
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+logger = logging.getLogger(LOGGER_NAME)
 
 
 def get_bundled_specs(main_file: Path) -> Dict[str, Any]:
@@ -29,22 +46,165 @@ def get_bundled_specs(main_file: Path) -> Dict[str, Any]:
     :param main_file: Swagger file path
     :return:
     """
+    prance = import_package("prance")
     parser = prance.ResolvingParser(str(main_file.absolute()), lazy=True, backend="openapi-spec-validator")
     parser.parse()
     return parser.specification
 
 
-def merge_swagger_file(main_file: str) -> None:
+def get_default_spec_cache_dir() -> str:
+    """`pyms` in the cache directory of the user: `$XDG_CACHE_HOME/pyms` or `~/.cache/pyms`"""
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "pyms")
+
+
+def get_spec_cache_path(main_file: Path, cache_dir: Optional[str] = None) -> Path:
+    """Cache file of `main_file`, named after the hash of its absolute path
+    :param main_file: Swagger file path
+    :param cache_dir: (optional) directory of the cache, `get_default_spec_cache_dir` by default
+    :return:
+    """
+    name = hashlib.sha256(str(main_file.resolve()).encode()).hexdigest()[:32]
+    return Path(cache_dir or get_default_spec_cache_dir(), "swagger-{}.json".format(name))
+
+
+def iter_refs(spec: Any) -> Iterator[str]:
+    """Values of the `$ref` keys of a spec, at any depth"""
+    if isinstance(spec, dict):
+        for key, value in spec.items():
+            if key == "$ref" and isinstance(value, str):
+                yield value
+            else:
+                yield from iter_refs(value)
+    elif isinstance(spec, list):
+        for value in spec:
+            yield from iter_refs(value)
+
+
+def get_spec_files(main_file: Path) -> Optional[List[Path]]:
+    """
+    Files loaded by the resolver: `main_file` and the files of its `$ref`s, recursively
+    :param main_file: Swagger file path
+    :return: sorted absolute paths, None if a `$ref` is a URL or a file can't be read
+    """
+    files, pending = set(), [main_file.resolve()]
+    while pending:
+        path = pending.pop()
+        if path in files:
+            continue
+        files.add(path)
+        try:
+            with open(path, encoding="utf-8") as spec_file:
+                spec = yaml.load(spec_file, Loader=YAML_LOADER)  # nosec - A safe loader
+        except (OSError, UnicodeDecodeError, yaml.YAMLError):
+            return None
+        for ref in iter_refs(spec):
+            url = urlsplit(ref)
+            if url.scheme not in ("", "file") or url.netloc:
+                logger.debug("Swagger spec %s not cached, it has a $ref to %s", main_file, ref)
+                return None
+            if url.path:
+                pending.append(Path(path.parent, unquote(url.path)).resolve())
+    return sorted(files)
+
+
+def get_spec_hash(main_file: Path) -> Optional[str]:
+    """
+    SHA-256 of the files of the spec, see `get_spec_files`, and of the versions of the parser and the validator
+    :param main_file: Swagger file path
+    :return: hex digest, None if the spec can't be cached
+    """
+    files = get_spec_files(main_file)
+    if files is None:
+        return None
+    digest = hashlib.sha256(str(SPEC_CACHE_VERSION).encode())
+    for package in ("prance", "openapi-spec-validator"):
+        try:
+            digest.update(importlib.metadata.version(package).encode())
+        except importlib.metadata.PackageNotFoundError:  # pragma: no cover
+            pass
+    for path in files:
+        try:
+            digest.update(str(path).encode() + b"\0")
+            digest.update(path.read_bytes() + b"\0")
+        except OSError:
+            return None
+    return digest.hexdigest()
+
+
+def load_spec_cache(cache_path: Path, spec_hash: str) -> Optional[Dict[str, Any]]:
+    """Specs of the cache file if it was built for `spec_hash`, None if it doesn't exist, is stale or unreadable"""
+    try:
+        with open(cache_path, "rb") as cache_file:
+            cached = get_json_backend().loads(cache_file.read())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get("hash") != spec_hash:
+        return None
+    return cached.get("specs")
+
+
+def save_spec_cache(cache_path: Path, spec_hash: str, specs: Dict[str, Any]) -> None:
+    """Write the cache file atomically. If the directory can't be created or written, or the specs have values that
+    JSON doesn't keep, like dates or numeric keys, the specs aren't cached"""
+    backend = get_json_backend()
+    try:
+        content = backend.dumps_bytes({"hash": spec_hash, "specs": specs})
+    except (TypeError, ValueError, OverflowError) as ex:
+        logger.debug("Swagger spec cache %s not written: %s", cache_path, ex)
+        return
+    if backend.loads(content)["specs"] != specs:
+        logger.debug("Swagger spec cache %s not written: the spec changes when it's serialized to JSON", cache_path)
+        return
+    temp_path = Path(cache_path.parent, "{}.{}.tmp".format(cache_path.name, os.getpid()))
+    try:
+        os.makedirs(cache_path.parent, mode=0o700, exist_ok=True)
+        with open(temp_path, "wb") as cache_file:
+            cache_file.write(content)
+        os.replace(temp_path, cache_path)
+    except OSError as ex:
+        logger.debug("Swagger spec cache %s not written: %s", cache_path, ex)
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def get_cached_specs(main_file: Path, cache_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Bundled specs from the cache, or from `get_bundled_specs` if the files of the spec have changed
+    :param main_file: Swagger file path
+    :param cache_dir: (optional) directory of the cache, `get_default_spec_cache_dir` by default. It must be owned by
+    the user and not writable by others, else `ConfigErrorException` is raised
+    :return:
+    """
+    spec_hash = get_spec_hash(main_file)
+    if spec_hash is None:
+        return get_bundled_specs(main_file)
+    cache_path = get_spec_cache_path(main_file, cache_dir)
+    if cache_path.parent.exists():
+        check_user_dir(str(cache_path.parent))
+    specs = load_spec_cache(cache_path, spec_hash)
+    if specs is None:
+        specs = get_bundled_specs(main_file)
+        save_spec_cache(cache_path, spec_hash, specs)
+    return specs
+
+
+def merge_swagger_file(main_file: str, build_cache: bool = False, cache_dir: Optional[str] = None) -> None:
     """
     Generate swagger into a single file
     :param main_file: Swagger file path
+    :param build_cache: build the cache of the resolved spec too, see `get_cached_specs`
+    :param cache_dir: (optional) directory of the cache, `get_default_spec_cache_dir` by default
     :return:
     """
+    formats = import_package("prance.util.formats")
+    fs = import_package("prance.util.fs")
     input_file = Path(main_file)
-    output_file = Path(input_file.parent, "swagger-complete.yaml")
+    output_file = Path(input_file.parent, MERGED_SWAGGER_FILE)
 
     contents = formats.serialize_spec(
-        specs=get_bundled_specs(input_file),
+        specs=get_cached_specs(input_file, cache_dir) if build_cache else get_bundled_specs(input_file),
         filename=output_file,
     )
     fs.write_file(filename=output_file, contents=contents, encoding="utf-8")
@@ -58,11 +218,16 @@ class Service(DriverService):
     * **project_dir:** Relative path of the project folder to automatic routing,
       see [this link for more info](https://github.com/spec-first/connexion#automatic-routing).
       The default value is `project`
+    * **spec_cache:** Cache the spec resolved and validated by prance, see `get_cached_specs`. The default value
+      is `false`
+    * **spec_cache_dir:** Directory of the cache, owned by the user of the service. The default value is
+      `$XDG_CACHE_HOME/pyms` or `~/.cache/pyms`
 
     All default values keys are created as class attributes in `DriverService`
     """
 
     config_resource = "swagger"
+    requires_app_reload = True
     default_values = {
         "path": SWAGGER_PATH,
         "file": SWAGGER_FILE,
@@ -70,6 +235,8 @@ class Service(DriverService):
         "project_dir": PROJECT_DIR,
         "validator_map": {},
         "validate_responses": True,
+        "spec_cache": False,
+        "spec_cache_dir": None,
     }
 
     @staticmethod
@@ -105,6 +272,9 @@ class Service(DriverService):
         :return: Flask
         """
         check_package_exists("connexion")
+        connexion = import_package("connexion")
+        SwaggerUIOptions = import_from("connexion.options", "SwaggerUIOptions")  # pylint: disable=invalid-name
+        RestyResolver = import_from("connexion.resolver", "RestyResolver")  # pylint: disable=invalid-name
 
         # Set paths
         specification_dir = self.path
@@ -115,10 +285,15 @@ class Service(DriverService):
         # Prepare params
         validator_map = {k: import_class(v) for k, v in self.validator_map.items()}
         options = SwaggerUIOptions(swagger_ui_path=self.url)
+        spec_file = Path(os.path.join(specification_dir, self.file))
+        if not importlib.util.find_spec("prance"):
+            specification = self.file
+        elif self.spec_cache:
+            specification = get_cached_specs(spec_file, self.spec_cache_dir)
+        else:
+            specification = get_bundled_specs(spec_file)
         params = {
-            "specification": (
-                get_bundled_specs(Path(os.path.join(specification_dir, self.file))) if prance else self.file
-            ),
+            "specification": specification,
             "arguments": {"title": config.APP_NAME},
             "base_path": application_root,
             "swagger_ui_options": options,
@@ -0,0 +1,97 @@
+"""Log messages with fields, like the url, the headers or the body of a request, formatted only if the record is
+emitted. The long values are truncated and the sensitive ones, like the `Authorization` header, are redacted:
+```python
+log_debug(logger, "Get with", url=full_url, headers=headers)
+# DEBUG Get with url http://users/1, headers {'Authorization': '***'}
+```
+"""
+
+import itertools
+import logging
+from typing import Any, Dict
+
+# Keys of dictionaries (headers, bodies, params) whose values are never logged
+SENSITIVE_KEYS = frozenset(
+    [
+        "authorization",
+        "proxy-authorization",
+        "cookie",
+        "set-cookie",
+        "x-api-key",
+        "api_key",
+        "password",
+        "secret",
+        "token",
+        "access_token",
+        "refresh_token",
+    ]
+)
+
+REDACTED = "***"
+
+DEFAULT_MAX_LENGTH = 1000
+
+DEFAULT_MAX_ITEMS = 20
+
+_SCALARS = frozenset([str, bytes, int, float, bool, type(None)])
+
+
+def redact(value: Any, max_items: int = DEFAULT_MAX_ITEMS) -> Any:
+    """Copy of dictionaries and lists replacing the values of the `SENSITIVE_KEYS`. Only the first `max_items` of
+    each one are kept, the rest are never shown once the message is truncated"""
+    if type(value) in _SCALARS:
+        return value
+    if isinstance(value, dict):
+        redacted = {
+            key: REDACTED if isinstance(key, str) and key.lower() in SENSITIVE_KEYS else redact(item, max_items)
+            for key, item in itertools.islice(value.items(), max_items)
+        }
+        if len(value) > max_items:
+            redacted["..."] = "{} items".format(len(value))
+        return redacted
+    if isinstance(value, (list, tuple)):
+        redacted = [redact(item, max_items) for item in value[:max_items]]
+        if len(value) > max_items:
+            redacted.append("... {} items".format(len(value)))
+        return type(value)(redacted)
+    return value
+
+
+def truncate(text: str, max_length: int = DEFAULT_MAX_LENGTH) -> str:
+    if len(text) <= max_length:
+        return text
+    return "{}... ({} chars)".format(text[:max_length], len(text))
+
+
+class LazyFields:
+    """Fields of a message, formatted as `name value, name value` when the record is emitted"""
+
+    __slots__ = ("fields", "max_length")
+
+    def __init__(self, fields: Dict[str, Any], max_length: int = DEFAULT_MAX_LENGTH):
+        self.fields = fields
+        self.max_length = max_length
+
+    def __str__(self):
+        return ", ".join(
+            "{} {}".format(name, truncate(str(redact(value)), self.max_length)) for name, value in self.fields.items()
+        )
+
+
+def log_fields(logger: logging.Logger, level: int, message: str, /, **fields) -> None:
+    """Log `message` followed by the fields, doing nothing if the level is disabled.
+
+    :param logger: logger of the message
+    :param level: level of the message, i.e: `logging.DEBUG`
+    :param message: text before the fields
+    :param fields: values to log, truncated and redacted
+    :return: None
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, "%s %s", message, LazyFields(fields))
+
+
+def log_debug(logger: logging.Logger, message: str, /, **fields) -> None:
+    """`log_fields` with level DEBUG"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s %s", message, LazyFields(fields))
@@ -7,7 +7,7 @@ import logging
 from pythonjsonlogger import jsonlogger
 
 from pyms.constants import LOGGER_NAME
-from pyms.flask.services.tracer import inject_span_in_headers
+from pyms.utils.json_backend import STDLIB, get_json_backend
 
 logger = logging.getLogger(LOGGER_NAME + "-tracer")
 
@@ -15,26 +15,38 @@ logger = logging.getLogger(LOGGER_NAME + "-tracer")
 class CustomJsonFormatter(jsonlogger.JsonFormatter):
     service_name = ""
     tracer = ""
+    _json_default = None
 
-    def add_fields(self, log_record, record, message_dict):
-        super().add_fields(log_record, record, message_dict)
-        if not log_record.get("timestamp"):
+    def add_fields(self, log_data, record, message_dict):
+        super().add_fields(log_data, record, message_dict)
+        if not log_data.get("timestamp"):
             # this doesn't use record.created, so it is slightly off
             now = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-            log_record["timestamp"] = now
-        if log_record.get("level"):
-            log_record["severity"] = log_record["level"].upper()
+            log_data["timestamp"] = now
+        if log_data.get("level"):
+            log_data["severity"] = log_data["level"].upper()
         else:
-            log_record["severity"] = record.levelname
-        log_record["service"] = self.service_name
+            log_data["severity"] = record.levelname
+        log_data["service"] = self.service_name
 
         try:
+            # The tracer service is imported with the first record, not with the logger
+            from pyms.flask.services.tracer import inject_span_in_headers  # pylint: disable=import-outside-toplevel
+
             headers = inject_span_in_headers({})
-            log_record["trace"] = headers.get("X-B3-TraceId", "")
-            log_record["span"] = headers.get("X-B3-SpanId", "")
-            log_record["parent"] = headers.get("X-B3-ParentSpanId", "")
+            log_data["trace"] = headers.get("X-B3-TraceId", "")
+            log_data["span"] = headers.get("X-B3-SpanId", "")
+            log_data["parent"] = headers.get("X-B3-ParentSpanId", "")
         except Exception as ex:  # pragma: no cover
-            logger.error("Tracer error: {}".format(ex))
+            logger.error("Tracer error: %s", ex)
+
+    def jsonify_log_record(self, log_data):
+        backend = get_json_backend()
+        if backend.name == STDLIB:
+            return super().jsonify_log_record(log_data)
+        if self._json_default is None:
+            self._json_default = self.json_default or self.json_encoder().default
+        return backend.dumps(log_data, default=self._json_default)
 
     def add_service_name(self, project_name):
         self.service_name = project_name.lower()
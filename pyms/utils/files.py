@@ -1,7 +1,10 @@
 import logging
 import os
+import stat
+import tempfile
 
 from pyms.constants import LOGGER_NAME
+from pyms.exceptions import ConfigErrorException
 
 files_cached = {}
 
@@ -28,9 +31,18 @@ class LoadFile:
 
     def get_path_from_env(self):
         config_file = os.environ.get(self.file_env_location, self.default_file)
-        logger.debug("Searching file in ENV[{}]: {}...".format(self.file_env_location, config_file))
+        logger.debug("Searching file in ENV[%s]: %s...", self.file_env_location, config_file)
         return config_file
 
+    def get_path(self):
+        """Path of the file read by `get_file`, None if it doesn't exist"""
+        for path in (os.environ.get(self.file_env_location, self.default_file), self.path):
+            if path and os.path.isdir(path):
+                path = os.path.join(path, self.default_file)
+            if path and os.path.isfile(path):
+                return path
+        return None
+
     def _get_conf_from_env(self, fn=None):
         path = self.get_path_from_env()
         return self._get_conf_from_file(path, fn)
@@ -40,10 +52,10 @@ class LoadFile:
             path = os.path.join(path, self.default_file)
 
         if not path or not os.path.isfile(path):
-            logger.debug("File {} NOT FOUND".format(path))
+            logger.debug("File %s NOT FOUND", path)
             return {}
         if path not in files_cached:
-            logger.debug("[CONF] Configmap {} found".format(path))
+            logger.debug("[CONF] Configmap %s found", path)
             self.path = path
             if fn:
                 files_cached[path] = fn(path)
@@ -57,3 +69,29 @@ class LoadFile:
         path = self.path or self.get_path_from_env()
         files_cached.pop(path, None)
         return self.get_file(fn)
+
+
+def get_user_temp_dir(name: str) -> str:
+    """Directory `<name>-<uid>` in the temporary directory, one per user, i.e: shared by the workers of a service"""
+    user = os.getuid() if hasattr(os, "getuid") else os.getpid()
+    return os.path.join(tempfile.gettempdir(), "{}-{}".format(name, user))
+
+
+def make_user_dir(path: str) -> None:
+    """Create the directory `path` if it doesn't exist, only accessible by the user, and check it with
+    `check_user_dir`"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    check_user_dir(path)
+
+
+def check_user_dir(path: str) -> None:
+    """Other users must not be able to write in the directory `path`, i.e: if they created it before the service
+    :raises ConfigErrorException: if it's not a directory, it's owned by other user or others can write in it
+    """
+    path_stat = os.lstat(path)
+    if not stat.S_ISDIR(path_stat.st_mode):
+        raise ConfigErrorException("Path {} is not a directory".format(path))
+    if hasattr(os, "getuid") and path_stat.st_uid != os.getuid():
+        raise ConfigErrorException("Directory {} is not owned by the user of the service".format(path))
+    if path_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise ConfigErrorException("Directory {} is writable by other users".format(path))
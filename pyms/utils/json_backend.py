@@ -0,0 +1,126 @@
+"""JSON codec used by PyMS to parse the responses of `pyms.flask.services.requests`, serialize their `json=` bodies,
+the responses of Flask (`app.json`) and the logs. Select it in the configuration:
+```yaml
+pyms:
+  config:
+    json_backend: orjson  # orjson, ujson or stdlib (default)
+```
+If the package of the backend is not installed, PyMS falls back to the `json` module of the standard library. The
+packages are imported when their backend is selected.
+"""
+
+import json
+import logging
+from typing import Any, Callable, Optional, Union
+
+from pyms.constants import LOGGER_NAME
+from pyms.exceptions import ConfigErrorException
+
+logger = logging.getLogger(LOGGER_NAME)
+
+STDLIB = "stdlib"
+
+JSON_BACKENDS = ("orjson", "ujson", STDLIB)
+
+DEFAULT_JSON_BACKEND = STDLIB
+
+
+class StdlibBackend:
+    """Each backend implements `dumps` or `dumps_bytes` and `loads`, with the same signatures"""
+
+    name = STDLIB
+
+    def dumps(self, obj: Any, default: Optional[Callable] = None, sort_keys: bool = False) -> str:
+        return json.dumps(obj, default=default, sort_keys=sort_keys)
+
+    def dumps_bytes(self, obj: Any, default: Optional[Callable] = None, sort_keys: bool = False) -> bytes:
+        return self.dumps(obj, default=default, sort_keys=sort_keys).encode("utf-8")
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonBackend(StdlibBackend):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson  # pylint: disable=import-outside-toplevel
+
+        self.orjson = orjson
+
+    def dumps(self, obj: Any, default: Optional[Callable] = None, sort_keys: bool = False) -> str:
+        return self.dumps_bytes(obj, default=default, sort_keys=sort_keys).decode("utf-8")
+
+    def dumps_bytes(self, obj: Any, default: Optional[Callable] = None, sort_keys: bool = False) -> bytes:
+        # Datetimes and dataclasses are serialized by `default`, like the `json` module does
+        orjson = self.orjson
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=default, option=option)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return self.orjson.loads(data)
+
+
+class UjsonBackend(StdlibBackend):
+    name = "ujson"
+
+    def __init__(self):
+        import ujson  # pylint: disable=import-outside-toplevel
+
+        self.ujson = ujson
+
+    def dumps(self, obj: Any, default: Optional[Callable] = None, sort_keys: bool = False) -> str:
+        return self.ujson.dumps(obj, default=default, sort_keys=sort_keys, ensure_ascii=False)
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return self.ujson.loads(data)
+
+
+BACKEND_CLASSES = {"orjson": OrjsonBackend, "ujson": UjsonBackend, STDLIB: StdlibBackend}
+
+_backend = StdlibBackend()
+
+
+def get_json_backend() -> StdlibBackend:
+    return _backend
+
+
+def get_backend(name: str) -> Optional[StdlibBackend]:
+    """New backend `name`, importing its package.
+
+    :param name: orjson, ujson or stdlib
+    :return: the backend, None if its package is not installed
+    """
+    if name not in BACKEND_CLASSES:
+        raise ConfigErrorException("JSON backend {} not valid, use one of {}".format(name, ", ".join(JSON_BACKENDS)))
+    try:
+        return BACKEND_CLASSES[name]()
+    except ModuleNotFoundError:
+        return None
+
+
+def set_json_backend(name: str = DEFAULT_JSON_BACKEND) -> StdlibBackend:
+    """Select the JSON backend of the process.
+
+    :param name: orjson, ujson or stdlib
+    :return: the backend selected, stdlib if the package of `name` is not installed
+    """
+    global _backend  # pylint: disable=global-statement
+    if _backend.name == name:
+        return _backend
+    backend = get_backend(name)
+    if backend is None:
+        logger.warning("JSON backend %s is not installed, using %s", name, STDLIB)
+        backend = _backend if _backend.name == STDLIB else StdlibBackend()
+    _backend = backend
+    return _backend
+
+
+def dumps(obj: Any, default: Optional[Callable] = None, sort_keys: bool = False) -> str:
+    return _backend.dumps(obj, default=default, sort_keys=sort_keys)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    return _backend.loads(data)
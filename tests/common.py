@@ -1,4 +1,6 @@
 import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 from pyms.constants import CONFIGMAP_FILE_ENVIRONMENT, DEFAULT_CONFIGMAP_FILENAME
 from pyms.flask.app import Microservice
@@ -22,3 +24,62 @@ def remove_conf_file():
     # Dlete file, if exists
     if os.path.exists(CONFIG_FILE):
         os.remove(CONFIG_FILE)
+
+
+class StubServer:
+    """Local HTTP server for the tests of the requests services. `routes` maps a path to a tuple of
+    `(status_code, body)` or to a callable that receives the handler and returns it. Received requests are stored in
+    `requests` as `(method, path, headers, body)`.
+    ```python
+    with StubServer({"/users": (200, '{"data": []}')}) as server:
+        requests.get(server.url + "/users")
+    ```
+    """
+
+    def __init__(self, routes=None):
+        self.routes = routes or {}
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def _reply(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else b""
+                server.requests.append((self.command, self.path, dict(self.headers), body))
+                route = server.routes.get(self.path.split("?")[0], (404, ""))
+                status_code, content = route(self) if callable(route) else route
+                content = content.encode() if isinstance(content, str) else content
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = _reply
+            do_POST = _reply
+            do_PUT = _reply
+            do_PATCH = _reply
+            do_DELETE = _reply
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -1,7 +1,10 @@
 """Test common rest operations wrapper.
 """
 
+import json
 import os
+import tempfile
+import tracemalloc
 import unittest
 from pathlib import Path
 from unittest.mock import patch
@@ -10,10 +13,12 @@ import pytest
 from prance.util.url import ResolutionError
 
 from pyms.cmd import Command
+from pyms.cmd.bench import load_app, measure_allocations, percentile, run_bench
+from pyms.constants import CONFIGMAP_FILE_ENVIRONMENT
 from pyms.crypt.fernet import Crypt
 from pyms.exceptions import FileDoesNotExistException, PackageNotExists
 from pyms.flask.services.swagger import get_bundled_specs
-from tests.common import remove_conf_file
+from tests.common import MyMicroserviceNoSingleton, remove_conf_file
 
 
 class TestCmd(unittest.TestCase):
@@ -99,3 +104,113 @@ class TestCmd(unittest.TestCase):
         assert cmd.run()
         assert not cmd.run()
         remove_conf_file()
+
+
+class TestBench(unittest.TestCase):
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+    def setUp(self):
+        self.config = os.path.join(self.BASE_DIR, "config-tests-metrics.yml")
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = self.config
+        ms = MyMicroserviceNoSingleton(path=__file__)
+        ms.reload_conf()
+        self.app = ms.create_app()
+
+    def tearDown(self):
+        del os.environ[CONFIGMAP_FILE_ENVIRONMENT]
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(95, percentile(values, 95))
+        self.assertEqual(100, percentile(values, 100))
+        self.assertEqual(1, percentile(values, 0))
+        self.assertEqual(0.0, percentile([], 50))
+
+    def test_wsgi(self):
+        results = run_bench(self.app, routes=["/healthcheck", "/metrics"], requests=20, workers=3, warmup=2)
+
+        self.assertEqual("wsgi", results["mode"])
+        self.assertEqual(["/healthcheck", "/metrics"], [result["route"] for result in results["routes"]])
+        for result in results["routes"]:
+            self.assertEqual(20, result["requests"])
+            self.assertEqual(0, result["errors"])
+            self.assertGreater(result["throughput"], 0)
+            latency = result["latency_ms"]
+            self.assertLessEqual(latency["p50"], latency["p95"])
+            self.assertLessEqual(latency["p95"], latency["p99"])
+            self.assertLessEqual(latency["p99"], latency["max"])
+            self.assertGreater(result["alloc_peak_bytes"], 0)
+
+    def test_allocations(self):
+        with patch("tracemalloc.reset_peak", side_effect=AttributeError, create=True):
+            result = measure_allocations(self.app, "/healthcheck", 5)
+
+        self.assertGreater(result["alloc_peak_bytes"], 0)
+        self.assertGreaterEqual(result["alloc_peak_bytes"], result["alloc_retained_bytes"])
+
+    def test_allocations_with_tracing_started(self):
+        tracemalloc.start()
+        try:
+            result = measure_allocations(self.app, "/healthcheck", 5)
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+
+        self.assertGreater(result["alloc_peak_bytes"], 0)
+
+    def test_socket(self):
+        results = run_bench(self.app, requests=10, workers=2, mode="socket", warmup=0, alloc_requests=0)
+
+        result = results["routes"][0]
+        self.assertEqual("/healthcheck", result["route"])
+        self.assertEqual(0, result["errors"])
+        self.assertNotIn("alloc_peak_bytes", result)
+
+    def test_errors(self):
+        results = run_bench(self.app, routes=["/not-found"], requests=5, warmup=0, alloc_requests=0)
+
+        self.assertEqual(5, results["routes"][0]["errors"])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            run_bench(self.app, mode="udp")
+
+    def test_load_app(self):
+        app = load_app(config=self.config, app="tests.common:MyMicroserviceNoSingleton")
+
+        self.assertEqual("Python Microservice with Jaeger", app.config["APP_NAME"])
+        self.assertEqual(200, app.test_client().get("/healthcheck").status_code)
+
+    def test_load_app_created_once(self):
+        with patch.object(
+            MyMicroserviceNoSingleton, "create_app", autospec=True, side_effect=MyMicroserviceNoSingleton.create_app
+        ) as create_app:
+            app = load_app(config=self.config, app="tests.common:MyMicroserviceNoSingleton")
+
+        self.assertEqual(1, create_app.call_count)
+        self.assertEqual(200, app.test_client().get("/healthcheck").status_code)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output = os.path.join(temp_dir, "bench.json")
+            arguments = [
+                "bench",
+                "--config",
+                self.config,
+                "--app",
+                "tests.common:MyMicroserviceNoSingleton",
+                "--route",
+                "/healthcheck",
+                "--requests",
+                "10",
+                "--output",
+                output,
+            ]
+            cmd = Command(arguments=arguments, autorun=False)
+            assert cmd.run()
+            with open(output, encoding="utf-8") as output_file:
+                results = json.load(output_file)
+
+        self.assertEqual(10, results["routes"][0]["requests"])
+        self.assertEqual(0, results["routes"][0]["errors"])
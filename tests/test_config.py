@@ -1,10 +1,13 @@
 import logging
 import os
+import tempfile
+import time
 import unittest
 from unittest import mock
 
-from pyms.config import ConfFile, create_conf_file, get_conf
+from pyms.config import ConfFile, ConfigRegistry, FileWatcher, create_conf_file, get_conf
 from pyms.config.conf import validate_conf
+from pyms.config.snapshot import EMPTY, MISSING, compile_config
 from pyms.constants import (
     CONFIG_BASE,
     CONFIGMAP_FILE_ENVIRONMENT,
@@ -13,6 +16,8 @@ from pyms.constants import (
     CRYPT_FILE_KEY_ENVIRONMENT_LEGACY,
     LOGGER_NAME,
 )
+from pyms.crypt.driver import CryptNone
+from pyms.crypt.fernet import Crypt as CryptFernet
 from pyms.exceptions import (
     AttrDoesNotExistException,
     ConfigDoesNotFoundException,
@@ -110,6 +115,239 @@ class ConfTests(unittest.TestCase):
         self.assertEqual(config.pyms.config.test_var, "general")
 
 
+class ConfigSnapshotTests(unittest.TestCase):
+    def setUp(self):
+        self.config = ConfFile(config={"test-1": {"test-1-1": "a", "test_1-2": ["b", {"c": "d"}]}, "test_2": "c"})
+        self.snapshot = compile_config(self.config)
+
+    def test_equal_to_conf_file(self):
+        self.assertEqual(self.config, self.snapshot)
+        self.assertIsInstance(self.snapshot, dict)
+
+    def test_dotted_names(self):
+        self.assertEqual("a", self.snapshot.test_1.test_1_1)
+        self.assertEqual("a", getattr(self.snapshot, "test_1.test_1_1"))
+        self.assertEqual("a", self.snapshot.get_value("test-1.test-1-1"))
+        self.assertEqual(["b", {"c": "d"}], self.snapshot.test_1.test_1_2)
+
+    def test_missing(self):
+        self.assertIs(MISSING, self.snapshot.get_value("test_3"))
+        with self.assertRaises(AttrDoesNotExistException):
+            self.snapshot.test_3
+
+    def test_missing_empty_init(self):
+        snapshot = compile_config(ConfFile(config={"test_1": "a"}, empty_init=True))
+
+        self.assertIs(EMPTY, snapshot.test_2)
+        self.assertIs(snapshot.test_2, snapshot.test_3)
+
+    def test_read_only(self):
+        with self.assertRaises(TypeError):
+            self.snapshot["test_2"] = "d"
+        with self.assertRaises(TypeError):
+            self.snapshot.test_2 = "d"
+        with self.assertRaises(TypeError):
+            self.snapshot.test_1.update({"test_1_1": "e"})
+        with self.assertRaises(TypeError):
+            self.snapshot.test_1.test_1_2.append("e")
+
+
+class ConfigRegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "config.yml")
+        self.write_config("a")
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = self.path
+        self.registry = ConfigRegistry()
+
+    def tearDown(self):
+        del os.environ[CONFIGMAP_FILE_ENVIRONMENT]
+        self.registry.reload()
+        self.temp_dir.cleanup()
+
+    def write_config(self, app_name, mtime=None):
+        with open(self.path, "w", encoding="utf-8") as config_file:
+            config_file.write("pyms:\n  config:\n    APP_NAME: {}\n".format(app_name))
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_tree_built_once(self):
+        original_init = ConfFile.__init__
+        with mock.patch.object(ConfFile, "__init__", autospec=True, side_effect=original_init) as init:
+            config = self.registry.get(empty_init=True)
+            self.registry.get(empty_init=True)
+            roots = init.call_count
+
+        self.assertIs(config, self.registry.get(empty_init=True))
+        self.assertEqual(3, roots)  # The root, `pyms` and `pyms.config`
+        self.assertIsNot(config, self.registry.get(empty_init=False))
+
+    def test_tree_built_again_if_file_changes(self):
+        config = self.registry.get(empty_init=True)
+        self.write_config("b", mtime=1)
+
+        new_config = self.registry.get(empty_init=True)
+
+        self.assertEqual("a", config.pyms.config.APP_NAME)
+        self.assertEqual("b", new_config.pyms.config.APP_NAME)
+
+    def test_new_tree_reads_changed_file(self):
+        self.registry.get(empty_init=True)
+        self.write_config("b", mtime=1)
+
+        self.assertEqual("b", self.registry.get(empty_init=False).pyms.config.APP_NAME)
+
+    def test_reload_notifies_subscribers(self):
+        callback = mock.Mock()
+        self.registry.subscribe(callback)
+        config = self.registry.get(empty_init=True)
+
+        self.registry.reload()
+
+        callback.assert_called_once_with()
+        self.assertIsNot(config, self.registry.get(empty_init=True))
+
+    def test_stage_and_publish(self):
+        callback = mock.Mock()
+        self.registry.subscribe(callback)
+        config = self.registry.get(empty_init=True)
+        self.write_config("b", mtime=1)
+
+        with self.registry.stage() as trees:
+            staged = self.registry.get(empty_init=True)
+            self.assertIs(staged, self.registry.get(empty_init=True))
+        callback.assert_not_called()
+        self.assertEqual("a", config.pyms.config.APP_NAME)
+        self.assertEqual("b", staged.pyms.config.APP_NAME)
+
+        self.registry.publish(trees)
+
+        callback.assert_called_once_with()
+        self.assertIs(staged, self.registry.get(empty_init=True))
+
+    def test_subscribed_once(self):
+        class Subscriber:
+            calls = 0
+
+            def reload_config(self):
+                self.calls += 1
+
+        subscriber = Subscriber()
+        self.registry.subscribe(subscriber.reload_config)
+        self.registry.subscribe(subscriber.reload_config)
+
+        self.registry.reload()
+
+        self.assertEqual(1, subscriber.calls)
+
+    def test_crypt_resources_with_different_crypts(self):
+        class Resource:
+            def __init__(self, crypt_class):
+                self.crypt_class = crypt_class
+
+            def get_crypt_class(self):
+                return self.crypt_class
+
+            def __call__(self, *args, **kwargs):
+                return CryptNone()
+
+        none_crypt, fernet_crypt = Resource(CryptNone), Resource(CryptFernet)
+
+        self.assertIsNot(
+            self.registry.get(empty_init=True, crypt=none_crypt), self.registry.get(empty_init=True, crypt=fernet_crypt)
+        )
+        self.assertIs(
+            self.registry.get(empty_init=True, crypt=none_crypt), self.registry.get(empty_init=True, crypt=none_crypt)
+        )
+
+    def test_subscribers_not_kept_alive(self):
+        class Subscriber:
+            calls = 0
+
+            def reload_config(self):
+                Subscriber.calls += 1
+
+        subscriber = Subscriber()
+        self.registry.subscribe(subscriber.reload_config)
+        del subscriber
+
+        self.registry.reload()
+
+        self.assertEqual(0, Subscriber.calls)
+
+
+class FileWatcherTests(unittest.TestCase):
+    """The files are mounted like a Kubernetes configmap: `config.yml -> ..data/config.yml`, `..data -> ..version`"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "config.yml")
+        self.write_version("1", "APP_NAME: a")
+        os.symlink(os.path.join("..data", "config.yml"), self.path)
+        self.callback = mock.Mock()
+        self.watcher = FileWatcher([self.path], self.callback, interval=0.01, debounce=1)
+
+    def tearDown(self):
+        self.watcher.stop()
+        self.temp_dir.cleanup()
+
+    def write_version(self, version, content):
+        version_dir = os.path.join(self.temp_dir.name, "..{}".format(version))
+        os.mkdir(version_dir)
+        with open(os.path.join(version_dir, "config.yml"), "w", encoding="utf-8") as config_file:
+            config_file.write(content)
+        data_dir = os.path.join(self.temp_dir.name, "..data")
+        tmp_link = os.path.join(self.temp_dir.name, "..data_tmp")
+        os.symlink("..{}".format(version), tmp_link)
+        os.replace(tmp_link, data_dir)
+
+    def test_symlink_swap_debounced(self):
+        self.write_version("2", "APP_NAME: b")
+
+        self.assertFalse(self.watcher.check(now=10))
+        self.assertFalse(self.watcher.check(now=10.5))
+        self.assertTrue(self.watcher.check(now=11))
+        self.assertFalse(self.watcher.check(now=12))
+        self.callback.assert_called_once_with()
+
+    def test_changes_during_debounce_wait(self):
+        self.write_version("2", "APP_NAME: b")
+        self.assertFalse(self.watcher.check(now=10))
+        self.write_version("3", "APP_NAME: c")
+
+        self.assertFalse(self.watcher.check(now=10.5))
+        self.assertFalse(self.watcher.check(now=11))
+        self.assertTrue(self.watcher.check(now=11.5))
+        self.callback.assert_called_once_with()
+
+    def test_no_changes(self):
+        self.assertFalse(self.watcher.check(now=10))
+        self.assertFalse(self.watcher.check(now=20))
+        self.callback.assert_not_called()
+
+    def test_callback_errors_logged(self):
+        self.callback.side_effect = ValueError("bad config")
+        self.watcher.debounce = 0
+        self.write_version("2", "APP_NAME: b")
+
+        with self.assertLogs(LOGGER_NAME, level=logging.ERROR):
+            self.assertTrue(self.watcher.check())
+
+    def test_thread(self):
+        self.watcher.debounce = 0
+        self.watcher.start()
+        self.write_version("2", "APP_NAME: b")
+
+        for _ in range(500):
+            if self.callback.called:
+                break
+            time.sleep(0.01)
+        self.watcher.stop()
+
+        self.callback.assert_called_once_with()
+        self.assertFalse(self.watcher.is_alive())
+
+
 class ConfNotExistTests(unittest.TestCase):
     def test_empty_conf(self):
         config = ConfFile(empty_init=True)
@@ -1,13 +1,20 @@
 import logging
 import os
 import sys
+import tempfile
+import threading
 import unittest
 from unittest.mock import patch
 
+import boto3
 import pytest
+from botocore.stub import Stubber
+from cryptography.fernet import Fernet, InvalidToken
 
 from pyms.cloud.aws.kms import Crypt as CryptAws
-from pyms.config import get_conf
+from pyms.cloud.aws.kms import data_key_cache
+from pyms.config import ConfFile, config_registry, get_conf
+from pyms.config.decrypt import decrypt_many
 from pyms.constants import (
     CONFIG_BASE,
     CONFIGMAP_FILE_ENVIRONMENT,
@@ -180,3 +187,218 @@ class FlaskWithEncryptedNoneTests(unittest.TestCase):
     def test_fask_none_sqlalchemy(self):
         assert self.app.ms.config.SQLALCHEMY_DATABASE_URI == "http://database-url"
         assert self.app.config["SQLALCHEMY_DATABASE_URI"] == "http://database-url"
+
+
+class CountingCrypt(CryptAbstract):
+    """Reverse the messages and wait until `barrier` threads decrypt at the same time"""
+
+    barrier = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.decrypted = []
+
+    def encrypt(self, message):
+        return message[::-1]
+
+    def decrypt(self, encrypted):
+        if self.barrier is not None:
+            self.barrier.wait()
+        self.decrypted.append(encrypted)
+        return encrypted[::-1]
+
+
+class DecryptCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.temp_dir.name, "config.yml")
+        with open(path, "w", encoding="utf-8") as config_file:
+            config_file.write(
+                "pyms:\n  config:\n    enc_a: 1a\n    enc_b: 1b\n    nested:\n      enc_c: 1c\n      enc_d: 1a\n"
+            )
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = path
+        config_registry.reload()
+        self.crypt = CountingCrypt()
+
+    def tearDown(self):
+        del os.environ[CONFIGMAP_FILE_ENVIRONMENT]
+        config_registry.reload()
+        self.temp_dir.cleanup()
+
+    def test_decrypted_once(self):
+        config = ConfFile(crypt=lambda path=None: self.crypt)
+        ConfFile(crypt=lambda path=None: self.crypt)
+
+        self.assertEqual("a1", config.pyms.config.a)
+        self.assertEqual("a1", config.pyms.config.nested.d)
+        self.assertEqual(["1a", "1b", "1c"], sorted(self.crypt.decrypted))
+
+    def test_decrypted_again_after_reload(self):
+        decrypt_many(self.crypt, ["1a", "1b"])
+        config_registry.reload()
+        decrypt_many(self.crypt, ["1a"])
+
+        self.assertEqual(["1a", "1a", "1b"], sorted(self.crypt.decrypted))
+
+    def test_decrypted_again_in_stage(self):
+        decrypt_many(self.crypt, ["1a"])
+
+        with config_registry.stage() as trees:
+            decrypt_many(self.crypt, ["1a", "1b"])
+        decrypt_many(self.crypt, ["1a"])
+        config_registry.publish(trees)
+        decrypt_many(self.crypt, ["1b"])
+
+        self.assertEqual(["1a", "1a", "1b", "1b"], sorted(self.crypt.decrypted))
+
+    def test_decrypted_concurrently(self):
+        self.crypt.barrier = threading.Barrier(3, timeout=5)
+
+        config = ConfFile(crypt=lambda path=None: self.crypt)
+
+        self.assertEqual("c1", config.pyms.config.nested.c)
+        self.assertEqual(3, len(self.crypt.decrypted))
+
+
+class CryptFernetCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        os.environ[CRYPT_FILE_KEY_ENVIRONMENT] = os.path.join(self.temp_dir.name, "key.key")
+        self.crypt = CryptFernet()
+        self.old_key = self.crypt.generate_key("old password")
+        self.new_key = self.crypt.generate_key("new password")
+        self.write_keys(self.old_key)
+
+    def tearDown(self):
+        del os.environ[CRYPT_FILE_KEY_ENVIRONMENT]
+        config_registry.reload()
+        self.temp_dir.cleanup()
+
+    def write_keys(self, *keys, mtime=None):
+        self.crypt._loader.put_file(b"\n".join(keys), "wb")
+        if mtime is not None:
+            os.utime(self.crypt._loader.get_path(), ns=(mtime, mtime))
+
+    def test_fernet_built_once(self):
+        with patch("pyms.crypt.fernet.Fernet", wraps=Fernet) as fernet:
+            encrypted = self.crypt.encrypt("message")
+            self.crypt.decrypt(str(encrypted, encoding="utf-8"))
+            self.crypt.decrypt_many([str(encrypted, encoding="utf-8")] * 3)
+
+        fernet.assert_called_once_with(self.old_key)
+
+    def test_fernet_built_again_if_key_file_changes(self):
+        encrypted = self.crypt.encrypt("message")
+        self.write_keys(self.new_key, mtime=1)
+
+        with pytest.raises(InvalidToken):
+            self.crypt.decrypt(str(encrypted, encoding="utf-8"))
+
+    def test_key_rotation(self):
+        encrypted = str(self.crypt.encrypt("message"), encoding="utf-8")
+        self.write_keys(self.new_key, self.old_key, mtime=1)
+
+        rotated = str(self.crypt.rotate(encrypted), encoding="utf-8")
+        self.write_keys(self.new_key, mtime=2)
+
+        self.assertEqual(["message"], self.crypt.decrypt_many([rotated]))
+
+
+class CryptAwsEnvelopeTests(unittest.TestCase):
+    PLAIN_DATA_KEY = b"k" * 32
+
+    def setUp(self):
+        data_key_cache.clear()
+        self.client = boto3.client(
+            "kms", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test"
+        )
+        self.stubber = Stubber(self.client)
+        self.stubber.activate()
+        with patch.object(CryptAws, "_init_boto"):
+            self.crypt = CryptAws(
+                config=ConfFile(config={"key_id": "alias/test", "envelope": True, "data_key_max_uses": 3})
+            )
+        self.crypt.client = self.client
+
+    def tearDown(self):
+        self.stubber.deactivate()
+        data_key_cache.clear()
+
+    def add_generate_data_key(self, encrypted_data_key=b"encrypted data key", key_id="alias/test"):
+        self.stubber.add_response(
+            "generate_data_key",
+            {"Plaintext": self.PLAIN_DATA_KEY, "CiphertextBlob": encrypted_data_key, "KeyId": key_id},
+            {"KeyId": key_id, "KeySpec": "AES_256"},
+        )
+
+    def add_decrypt(self, plaintext):
+        self.stubber.add_response("decrypt", {"Plaintext": plaintext, "KeyId": "alias/test"})
+
+    def test_envelope_round_trip(self):
+        self.add_generate_data_key()
+        encrypted = [self.crypt.encrypt("message{}".format(i)) for i in range(2)]
+        data_key_cache.clear()
+        self.add_decrypt(self.PLAIN_DATA_KEY)
+
+        self.assertTrue(all(self.crypt.is_envelope(value) for value in encrypted))
+        self.assertEqual(["message0", "message1", "message0"], self.crypt.decrypt_many(encrypted + encrypted[:1]))
+        self.assertEqual("message1", self.crypt.decrypt(encrypted[1]))
+        self.stubber.assert_no_pending_responses()
+
+    def test_data_key_expires_after_max_uses(self):
+        self.add_generate_data_key(b"first")
+        self.add_generate_data_key(b"second")
+
+        encrypted = [self.crypt.encrypt("message") for _ in range(4)]
+
+        self.assertEqual(2, len({self.crypt._parse_envelope(value)[0] for value in encrypted}))
+        self.stubber.assert_no_pending_responses()
+
+    def test_data_key_expires_after_max_age(self):
+        self.add_generate_data_key(b"first")
+        self.add_generate_data_key(b"second")
+
+        with patch("pyms.cloud.aws.kms.time.monotonic", return_value=0):
+            first = self.crypt.encrypt("message")
+        with patch("pyms.cloud.aws.kms.time.monotonic", return_value=301):
+            second = self.crypt.encrypt("message")
+
+        self.assertNotEqual(self.crypt._parse_envelope(first)[0], self.crypt._parse_envelope(second)[0])
+        self.stubber.assert_no_pending_responses()
+
+    def test_data_key_by_kms_key(self):
+        with patch.object(CryptAws, "_init_boto"):
+            other_crypt = CryptAws(config=ConfFile(config={"key_id": "alias/other", "envelope": True}))
+        other_crypt.client = self.client
+        self.add_generate_data_key(b"first")
+        self.add_generate_data_key(b"second", key_id="alias/other")
+
+        first = self.crypt.encrypt("message")
+        second = other_crypt.encrypt("message")
+
+        self.assertEqual(b"first", self.crypt._parse_envelope(first)[0])
+        self.assertEqual(b"second", self.crypt._parse_envelope(second)[0])
+        self.stubber.add_response(
+            "decrypt",
+            {"Plaintext": self.PLAIN_DATA_KEY, "KeyId": "alias/other"},
+            {"CiphertextBlob": b"first", "KeyId": "alias/other", "EncryptionAlgorithm": "SYMMETRIC_DEFAULT"},
+        )
+        self.assertEqual("message", other_crypt.decrypt(first))
+        self.stubber.assert_no_pending_responses()
+
+    def test_decrypt_many_with_kms_values(self):
+        self.add_generate_data_key()
+        envelope = self.crypt.encrypt("message")
+        self.add_decrypt(b"plain")
+
+        self.assertEqual(["message", "plain"], self.crypt.decrypt_many([envelope, "cGxhaW4="]))
+        self.stubber.assert_no_pending_responses()
+
+    def test_data_keys_cleared_on_reload(self):
+        self.add_generate_data_key()
+        encrypted = self.crypt.encrypt("message")
+        config_registry.reload()
+        self.add_decrypt(self.PLAIN_DATA_KEY)
+
+        self.assertEqual("message", self.crypt.decrypt(encrypted))
+        self.stubber.assert_no_pending_responses()
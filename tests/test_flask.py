@@ -1,13 +1,23 @@
 import os
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
 
 import pytest
 from flask import current_app
 
+from pyms.config import ConfFile, get_conf
 from pyms.constants import CONFIGMAP_FILE_ENVIRONMENT
+from pyms.exceptions import ConfigErrorException
 from pyms.flask.app import Microservice, config
-from pyms.flask.services.driver import DriverService
-from tests.common import MyMicroservice
+from pyms.flask.app.json_provider import JSONProvider
+from pyms.flask.app.utils import EpochTracker
+from pyms.flask.services.driver import DriverService, ServicesResource
+from pyms.utils.json_backend import get_json_backend, set_json_backend
+from tests.common import MyMicroservice, MyMicroserviceNoSingleton
 
 
 def home():
@@ -106,6 +116,348 @@ class ReloadTests(unittest.TestCase):
         self.assertEqual("reload2", config()["APP_NAME"])
 
 
+class ConfigFileMicroserviceTestCase(unittest.TestCase):
+    """
+    Microservice with a temporary config file, see `write_config`
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "config.yml")
+        self.write_config()
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = self.path
+        self.ms = MyMicroserviceNoSingleton(path=__file__)
+        self.ms.reload_conf()
+        self.app = self.ms.application
+
+    def tearDown(self):
+        self.ms.init_watcher()  # Stop it, the config of the tests disables it
+        self.ms.shutdown_services_actions()
+        del os.environ[CONFIGMAP_FILE_ENVIRONMENT]
+        self.temp_dir.cleanup()
+
+    def write_config(
+        self, app_name="reload1", retries=1, metrics=None, watch=False, json_backend="stdlib", cache="", data="data"
+    ):
+        with open(self.path, "w", encoding="utf-8") as config_file:
+            config_file.write(
+                "pyms:\n"
+                "  services:\n"
+                "{metrics}"
+                "    requests:\n"
+                "      data: data\n"
+                "      retries: {retries}\n"
+                "{cache}"
+                "    requests_async:\n"
+                "      data: {data}\n"
+                "  config:\n"
+                "    DEBUG: true\n"
+                "    TESTING: true\n"
+                "    APP_NAME: {app_name}\n"
+                "    json_backend: {json_backend}\n"
+                "    watch_config: {watch}\n"
+                "    watch_interval: 0.01\n"
+                "    watch_debounce: 0\n".format(
+                    app_name=app_name,
+                    retries=retries,
+                    metrics="" if metrics is None else "    metrics:\n      enabled: {}\n".format(str(metrics).lower()),
+                    data=data,
+                    watch=str(watch).lower(),
+                    json_backend=json_backend,
+                    cache="      cache:\n        backend: {}\n".format(cache) if cache else "",
+                )
+            )
+
+
+class ReloadChangedConfTests(ConfigFileMicroserviceTestCase):
+    """
+    Tests for the reload of the services whose config changed
+    """
+
+    def test_only_changed_services_replaced(self):
+        requests, requests_async = self.ms.requests, self.ms.requests_async
+        self.write_config(app_name="reload2", retries=2)
+
+        changed = self.ms.reload_changed_conf()
+
+        self.assertEqual(["requests"], changed)
+        self.assertIs(self.app, self.ms.application)
+        self.assertIs(requests_async, self.ms.requests_async)
+        self.assertIsNot(requests, self.ms.requests)
+        self.assertEqual(2, self.ms.requests.retries)
+        self.assertEqual("reload2", self.app.config["APP_NAME"])
+        self.assertEqual("reload2", self.ms.requests.app_name)
+
+    def test_nothing_changed(self):
+        requests = self.ms.requests
+
+        self.assertEqual([], self.ms.reload_changed_conf())
+        self.assertIs(requests, self.ms.requests)
+
+    def test_invalid_service_config_changes_nothing(self):
+        requests, config, json_backend = self.ms.requests, self.ms.config, type(get_json_backend())
+        self.write_config(app_name="reload2", retries=2, json_backend="orjson", cache="bogus")
+
+        with self.assertRaises(ConfigErrorException):
+            self.ms.reload_changed_conf()
+
+        self.assertIs(requests, self.ms.requests)
+        self.assertIs(config, self.ms.config)
+        self.assertEqual("reload1", self.app.config["APP_NAME"])
+        self.assertEqual("stdlib", self.app.config["JSON_BACKEND"])
+        self.assertIs(json_backend, type(get_json_backend()))
+
+        self.write_config(app_name="reload2", retries=2)
+        self.assertEqual(["requests"], self.ms.reload_changed_conf())
+        self.assertEqual("reload2", self.ms.config.APP_NAME)
+
+    def test_app_rebuilt_if_app_service_changes(self):
+        requests = self.ms.requests
+        self.write_config(metrics=True)
+
+        changed = self.ms.reload_changed_conf()
+
+        self.assertEqual(["metrics"], changed)
+        self.assertIsNot(self.app, self.ms.application)
+        self.assertIs(requests, self.ms.requests)
+        self.assertEqual(200, self.ms.application.test_client().get("/metrics").status_code)
+
+    def test_init_action_with_staged_config(self):
+        self.write_config(app_name="reload2", retries=2)
+        app_names = []
+
+        def init_action(service, microservice):
+            app_names.append((get_conf(service="pyms.config").APP_NAME, microservice.requests.retries))
+
+        with mock.patch("pyms.flask.services.requests.Service.init_action", init_action):
+            self.ms.reload_changed_conf()
+
+        self.assertEqual([("reload2", 2)], app_names)
+
+    def test_disabled_services_kept(self):
+        self.write_config(metrics=True)
+
+        with mock.patch("pyms.flask.services.metrics.Service.enabled", False):
+            self.assertEqual(["metrics"], self.ms.reload_changed_conf())
+            self.assertIn("metrics", self.ms.services)
+            self.assertIsNone(self.ms.metrics)
+            self.assertEqual([], self.ms.reload_changed_conf())
+            self.assertIn("metrics", self.ms.services)
+
+    def test_watcher(self):
+        self.write_config(watch=True)
+        self.ms.reload_conf()
+        self.write_config(retries=3, watch=True)
+
+        for _ in range(500):
+            if self.ms.requests.retries == 3:
+                break
+            time.sleep(0.01)
+
+        self.assertEqual(3, self.ms.requests.retries)
+        self.assertEqual([self.path], self.ms.get_watched_files())
+
+
+class JSONProviderTests(ConfigFileMicroserviceTestCase):
+    """
+    Tests for the JSON provider of the responses of Flask
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(set_json_backend)
+        self.config = ConfFile(config={"json_backend": "orjson"})
+
+    def test_json_backend_in_responses(self):
+        self.ms.init_json(self.config)
+
+        self.assertIsInstance(self.app.json, JSONProvider)
+        self.assertEqual('{"a":1}', self.app.json.dumps({"a": 1}))
+
+    def test_flask_without_json_providers(self):
+        json_provider = self.app.json
+        with mock.patch.dict(sys.modules, {"pyms.flask.app.json_provider": None}):
+            self.ms.init_json(self.config)
+
+        self.assertIs(json_provider, self.app.json)
+        self.assertEqual("orjson", get_json_backend().name)
+
+
+class AtomicReloadTests(ConfigFileMicroserviceTestCase):
+    """
+    Tests for the reload of the services while the app is serving requests
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.released = []
+        release_services = self.ms.release_services
+
+        def release(services):
+            for service in services.values():
+                service.released = True
+            self.released.extend(services)
+            release_services(services)
+
+        self.ms.release_services = release
+        self.app.add_url_rule("/service", "service", self.service_view)
+
+    @staticmethod
+    def service_view():
+        service = current_app.ms.requests
+        time.sleep(0.001)
+        return "released" if getattr(service, "released", False) else str(service.retries)
+
+    def test_old_services_released_after_requests(self):
+        with self.app.test_request_context("/service"):
+            self.app.preprocess_request()
+            old_service = self.ms.requests
+            self.write_config(retries=2)
+            self.ms.reload_changed_conf()
+
+            self.assertIs(old_service, self.ms.requests)
+            self.assertEqual([], self.released)
+        self.assertIsNot(old_service, self.ms.requests)
+        self.assertEqual(["requests"], self.released)
+        self.assertEqual(0, self.ms.epochs.pending())
+
+    def test_request_never_mixes_old_and_new_services(self):
+        with self.app.test_request_context("/service"):
+            self.app.preprocess_request()
+            requests, requests_async = self.ms.requests, self.ms.requests_async
+            self.write_config(retries=2, data="data2")
+
+            self.assertEqual(["requests", "requests_async"], self.ms.reload_changed_conf())
+            self.assertIs(requests, self.ms.requests)
+            self.assertIs(requests_async, self.ms.requests_async)
+        self.assertIsNot(requests, self.ms.requests)
+        self.assertIsNot(requests_async, self.ms.requests_async)
+
+    def test_invalid_config_not_applied(self):
+        requests = self.ms.requests
+        with open(self.path, "w", encoding="utf-8") as config_file:
+            config_file.write("pyms:\n  services:\n    requests:\n      data: data\n")
+
+        with pytest.raises(ConfigErrorException):
+            self.ms.reload_changed_conf()
+        self.assertIs(requests, self.ms.requests)
+
+    def test_configreload_endpoint(self):
+        requests = self.ms.requests
+        self.write_config(app_name="reload2", retries=2)
+        with mock.patch.object(self.ms, "reload_conf") as reload_conf, mock.patch.dict(
+            self.ms.config, {"atomic_reload": True}
+        ):
+            response = self.app.test_client().post("/reload-config")
+
+        self.assertEqual(200, response.status_code)
+        reload_conf.assert_not_called()
+        self.assertIs(self.app, self.ms.application)
+        self.assertIsNot(requests, self.ms.requests)
+
+    def test_requests_during_reloads(self):
+        stop = threading.Event()
+        responses = []
+
+        def hammer():
+            client = self.app.test_client()
+            while not stop.is_set():
+                response = client.get("/service")
+                responses.append((response.status_code, response.data))
+
+        threads = [threading.Thread(target=hammer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        try:
+            for reload in range(20):
+                self.write_config(retries=reload % 2 + 2)
+                self.ms.reload_changed_conf()
+                time.sleep(0.005)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertTrue(responses)
+        self.assertEqual({200}, {status_code for status_code, _ in responses})
+        self.assertLessEqual({data for _, data in responses}, {b"1", b"2", b"3"})
+        self.assertEqual(20, self.ms.epochs.epoch)
+        self.assertEqual(0, self.ms.epochs.in_flight())
+        self.assertEqual(0, self.ms.epochs.pending())
+        self.assertEqual(["requests"] * 20, self.released)
+
+
+class EpochTrackerTests(unittest.TestCase):
+    def setUp(self):
+        self.epochs = EpochTracker()
+        self.on_drained = mock.Mock()
+
+    def test_drained_without_requests(self):
+        self.assertEqual(1, self.epochs.advance(self.on_drained))
+        self.on_drained.assert_called_once_with()
+
+    def test_drained_after_requests_of_old_epochs(self):
+        first = self.epochs.enter()
+        self.epochs.advance(self.on_drained)
+        second = self.epochs.enter()
+
+        self.epochs.exit(second)
+        self.on_drained.assert_not_called()
+        self.epochs.exit(first)
+        self.on_drained.assert_called_once_with()
+        self.assertEqual(0, self.epochs.in_flight())
+
+    def test_drained_in_order(self):
+        calls = []
+        request = self.epochs.enter()
+        self.epochs.advance(lambda: calls.append(1))
+        self.epochs.advance(lambda: calls.append(2))
+
+        self.epochs.exit(request)
+
+        self.assertEqual([1, 2], calls)
+        self.assertEqual(0, self.epochs.pending())
+
+
+class LazyServicesTests(unittest.TestCase):
+    """
+    Tests for the services created on the first access
+    """
+
+    def setUp(self):
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "config-tests-requests-async.yml"
+        )
+        with mock.patch.object(ServicesResource, "get_service", wraps=ServicesResource.get_service) as get_service:
+            self.ms = MyMicroserviceNoSingleton(path=__file__)
+            self.ms.services = ["requests_async"]
+        self.get_service = get_service
+
+    def tearDown(self):
+        self.ms.shutdown_services_actions()
+        del os.environ[CONFIGMAP_FILE_ENVIRONMENT]
+
+    def test_created_on_first_access(self):
+        self.assertNotIn("requests_async", self.ms.__dict__)
+
+        with mock.patch.object(ServicesResource, "get_service", wraps=ServicesResource.get_service) as get_service:
+            service = self.ms.requests_async
+
+            self.assertIs(service, self.ms.requests_async)
+        get_service.assert_called_once_with("requests_async")
+        self.get_service.assert_not_called()
+
+    def test_not_configured(self):
+        self.assertIsNone(self.ms.swagger)
+        with pytest.raises(AttributeError):
+            self.ms.requests  # pylint: disable=pointless-statement
+
+    def test_not_created_to_shut_down(self):
+        self.ms.shutdown_services_actions()
+
+        self.assertNotIn("requests_async", self.ms.__dict__)
+
+
 class MicroserviceTest(unittest.TestCase):
     """
     Tests for Singleton
@@ -0,0 +1,65 @@
+"""Startup cost of importing PyMS, measured with `python -X importtime` in a new interpreter. The optional packages
+are imported only when a service or a command uses them, and the modules of PyMS must load within
+`PYMS_IMPORT_BUDGET_MS` milliseconds (their own time, without the packages they import).
+"""
+
+import os
+import subprocess  # nosec
+import sys
+import unittest
+from typing import Dict, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_BUDGET_MS = float(os.environ.get("PYMS_IMPORT_BUDGET_MS", 150))
+
+OPTIONAL_PACKAGES = [
+    "anyconfig",
+    "boto3",
+    "connexion",
+    "consulate",
+    "httpx",
+    "inotify_simple",
+    "jaeger_client",
+    "orjson",
+    "prance",
+    "prometheus_client",
+    "requests",
+    "ujson",
+]
+
+
+def get_import_times(module: str) -> Dict[str, Tuple[int, int]]:
+    """Self and cumulative import time, in microseconds, of each module imported by `import module`"""
+    result = subprocess.run(  # nosec
+        [sys.executable, "-X", "importtime", "-c", "import {}".format(module)],
+        capture_output=True,
+        check=True,
+        cwd=ROOT_DIR,
+        text=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_time, cumulative_time, name = line[len("import time:") :].split("|")  # noqa: E203
+        if self_time.strip().isdigit():
+            times[name.strip()] = (int(self_time), int(cumulative_time))
+    return times
+
+
+class ImportTimeTests(unittest.TestCase):
+    def test_optional_packages_not_imported(self):
+        for module in ("pyms.flask.app", "pyms.cmd", "pyms.logger"):
+            with self.subTest(module=module):
+                imported = {name.split(".")[0] for name in get_import_times(module)}
+
+                self.assertEqual(set(), imported & set(OPTIONAL_PACKAGES))
+
+    def test_import_time_budget(self):
+        own_times = []
+        for _ in range(3):
+            times = get_import_times("pyms.flask.app")
+            own_times.append(sum(self_time for name, (self_time, _) in times.items() if name.startswith("pyms")))
+
+        self.assertLessEqual(min(own_times) / 1000, IMPORT_BUDGET_MS)
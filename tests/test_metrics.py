@@ -1,14 +1,20 @@
+import datetime
+import logging
 import os
+import re
 import unittest.mock
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
+import requests
 import requests_mock
 from opentracing import global_tracer
 from prometheus_client import generate_latest, values
 
 from pyms.constants import CONFIGMAP_FILE_ENVIRONMENT
 from pyms.flask.services.metrics import FLASK_REQUEST_COUNT, FLASK_REQUEST_LATENCY, LOGGER_TOTAL_MESSAGES
+from pyms.flask.services.http.base import REQUESTS_COUNT
+from pyms.flask.services.http.template import METRICS_OTHER_URI
 from tests.common import MyMicroserviceNoSingleton
 
 
@@ -77,6 +83,39 @@ class TestMetricsFlask(unittest.TestCase):
         generated_count_url = b'http_client_requests_count_total{method="GET",service="Python Microservice with Jaeger",status="200",uri="http://www.my-site.com/users"}'
         assert generated_count_url in generate_latest()
 
+    def test_metrics_responses_uri_template(self):
+        response = requests.Response()
+        response.status_code = 200
+        response.request = requests.Request("GET", "http://www.my-site.com/users/1").prepare()
+        response.elapsed = datetime.timedelta(milliseconds=1)
+        reset_metric(REQUESTS_COUNT)
+        self.app.logger.setLevel(logging.INFO)
+        with self.app.app_context(), unittest.mock.patch.object(requests.Session, "request", return_value=response):
+            for user_id in range(10000):
+                self.request.get("http://www.my-site.com/users/{id}", path_params={"id": user_id})
+        self.app.logger.setLevel(logging.DEBUG)
+        samples = [
+            sample
+            for sample in REQUESTS_COUNT.collect()[0].samples
+            if sample.name == "http_client_requests_count_total"
+        ]
+        assert 1 == len(samples)
+        assert "http://www.my-site.com/users/{id}" == samples[0].labels["uri"]
+        assert 10000 == samples[0].value
+
+    @requests_mock.Mocker()
+    def test_metrics_responses_uri_limit(self, mock_request):
+        mock_request.get(re.compile(r"http://www.my-site.com/.*"))
+        self.request._uri_labels.max_uris = 2
+        with self.app.app_context():
+            for path in ("users", "posts", "comments"):
+                self.request.get("http://www.my-site.com/" + path)
+        self.client.get("/metrics")
+        generated_count_other = 'http_client_requests_count_total{{method="GET",service="Python Microservice with Jaeger",status="200",uri="{}"}}'.format(
+            METRICS_OTHER_URI
+        ).encode()
+        assert generated_count_other in generate_latest()
+
     def test_metrics_logger(self):
         self.client.get("/")
         self.client.get("/metrics")
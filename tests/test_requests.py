@@ -1,15 +1,49 @@
 """Test common rest operations wrapper.
 """
 
+import concurrent.futures
 import json
 import os
+import re
+import tempfile
+import threading
+import time
+import types
 import unittest
+import unittest.mock
 
+import pytest
+import requests
 import requests_mock
 
+from pyms.config import ConfFile
 from pyms.constants import CONFIGMAP_FILE_ENVIRONMENT
 from pyms.flask.app import Microservice
-from pyms.flask.services.requests import DEFAULT_RETRIES
+from pyms.exceptions import CircuitBreakerOpenException, ConfigErrorException, PathParamsException
+from pyms.flask.services.http import (
+    CircuitBreaker,
+    FileStateStore,
+    MemoryStateStore,
+    ResponseCache,
+    RetryBudget,
+    RetryPolicy,
+    SessionPool,
+    SingleFlight,
+)
+from pyms.flask.services.http.cache import CacheEntry, FileCache, MemoryCache, get_ttl, is_cacheable_vary
+from pyms.flask.services.http.circuitbreaker import CLOSED, HALF_OPEN, OPEN
+from pyms.flask.services.http.headers import HeadersFilter
+from pyms.flask.services.http.template import compile_template
+from pyms.flask.services.requests import DEFAULT_RETRIES, Service
+from pyms.utils.json_backend import set_json_backend
+from tests.common import StubServer
+
+CONFFILE_INIT = ConfFile.__init__
+
+
+def slow_route(handler):
+    time.sleep(0.2)
+    return 200, json.dumps({"data": handler.path})
 
 
 class RequestServiceNoDataTests(unittest.TestCase):
@@ -323,11 +357,7 @@ class RequestServiceTests(unittest.TestCase):
         self,
     ):
         input_headers = {}
-        expected_headers = {
-            "Content-Length": "12",
-            "Content-Type": "application/x-www-form-urlencoded",
-            "Host": "localhost",
-        }
+        expected_headers = {}
         with self.app.test_request_context("/tests/", data={"format": "short"}):
             headers = self.request.set_propagate_headers(input_headers)
 
@@ -344,9 +374,6 @@ class RequestServiceTests(unittest.TestCase):
     def test_propagate_headers_propagate(self):
         input_headers = {}
         expected_headers = {
-            "Content-Length": "12",
-            "Content-Type": "application/x-www-form-urlencoded",
-            "Host": "localhost",
             "A": "b",
         }
         with self.app.test_request_context("/tests/", data={"format": "short"}, headers={"a": "b"}):
@@ -354,6 +381,32 @@ class RequestServiceTests(unittest.TestCase):
 
         self.assertEqual(expected_headers, headers)
 
+    def test_propagate_headers_hop_by_hop_not_propagated(self):
+        with self.app.test_request_context(
+            "/tests/", headers={"a": "b", "Connection": "close", "Transfer-Encoding": "chunked"}
+        ):
+            headers = self.request.set_propagate_headers({})
+
+        self.assertEqual({"A": "b"}, headers)
+
+    def test_propagate_headers_computed_once_per_request(self):
+        with self.app.test_request_context("/tests/", headers={"a": "b"}):
+            with unittest.mock.patch.object(
+                HeadersFilter, "filter", autospec=True, side_effect=HeadersFilter.filter
+            ) as filter_headers:
+                first = self.request.set_propagate_headers({})
+                second = self.request.set_propagate_headers({"A": "c"})
+
+        self.assertEqual({"A": "b"}, first)
+        self.assertEqual({"A": "c"}, second)
+        filter_headers.assert_called_once()
+
+    def test_propagate_headers_outside_request(self):
+        with self.app.app_context():
+            headers = self.request.set_propagate_headers({"A": "b"})
+
+        self.assertEqual({"A": "b"}, headers)
+
     def test_propagate_headers_propagate_no_override(self):
         input_headers = {
             "Host": "my-server",
@@ -415,3 +468,984 @@ class RequestServiceTests(unittest.TestCase):
 
         self.assertEqual(1, mock_request.call_count)
         self.assertEqual(200, response.status_code)
+
+    @requests_mock.Mocker()
+    def test_retries_with_connection_error(self, mock_request):
+        url = "http://localhost:9999"
+        with self.app.app_context():
+            mock_request.get(url, [{"exc": requests.exceptions.ConnectTimeout}, {"text": "", "status_code": 200}])
+            response = self.request.get(url)
+
+        self.assertEqual(2, mock_request.call_count)
+        self.assertEqual(200, response.status_code)
+
+    @requests_mock.Mocker()
+    def test_not_retry_read_timeout_on_post(self, mock_request):
+        url = "http://localhost:9999"
+        with self.app.app_context():
+            mock_request.post(url, exc=requests.exceptions.ReadTimeout)
+            with pytest.raises(requests.exceptions.ReadTimeout):
+                self.request.post(url, json={})
+
+        self.assertEqual(1, mock_request.call_count)
+
+    @requests_mock.Mocker()
+    def test_retries_honor_retry_after(self, mock_request):
+        url = "http://localhost:9999"
+        with self.app.app_context():
+            mock_request.get(url, [{"status_code": 500, "headers": {"Retry-After": "0"}}, {"status_code": 200}])
+            with unittest.mock.patch("pyms.flask.services.requests.time.sleep") as sleep:
+                response = self.request.get(url)
+
+        sleep.assert_called_once_with(0.0)
+        self.assertEqual(200, response.status_code)
+
+    @requests_mock.Mocker()
+    def test_retries_dropped_by_budget(self, mock_request):
+        url = "http://localhost:9999"
+        self.request._retry_policy.budget = RetryBudget(ratio=0.1, min_per_second=0)
+        with self.app.app_context():
+            mock_request.get(url, text="", status_code=500)
+            response = self.request.get(url)
+
+        self.assertEqual(1, mock_request.call_count)
+        self.assertEqual(500, response.status_code)
+
+    @requests_mock.Mocker()
+    def test_pooled_session_reused_by_host(self, mock_request):
+        mock_request.get("http://www.my-site.com/users", text="")
+        mock_request.get("http://www.my-site.com/posts", text="")
+        mock_request.get("http://www.another-site.com/users", text="")
+
+        with self.app.app_context():
+            self.request.get("http://www.my-site.com/users")
+            with self.request._pool.session("http://www.my-site.com/") as session:
+                first_session = session
+            self.request.get("http://www.my-site.com/posts")
+            with self.request._pool.session("http://www.my-site.com/") as session:
+                second_session = session
+            self.request.get("http://www.another-site.com/users")
+
+        self.assertIs(first_session, second_session)
+        self.assertEqual(2, len(self.request._pool))
+
+    @requests_mock.Mocker()
+    def test_pooled_session_closed_on_shutdown(self, mock_request):
+        mock_request.get("http://www.my-site.com/users", text="")
+        with self.app.app_context():
+            self.request.get("http://www.my-site.com/users")
+
+        self.app.ms.shutdown_services_actions()
+
+        self.assertEqual(0, len(self.request._pool))
+
+    @requests_mock.Mocker()
+    def test_config_not_parsed_per_request(self, mock_request):
+        url = "http://www.my-site.com/users/{user-id}"
+        mock_request.get("http://www.my-site.com/users/123", text=json.dumps({"data": {"id": 123}}))
+        with self.app.app_context():
+            self.request.get_for_object(url, path_params={"user-id": 123})
+            with unittest.mock.patch.object(ConfFile, "__init__", autospec=True, side_effect=CONFFILE_INIT) as init:
+                response = self.request.get_for_object(url, path_params={"user-id": 123})
+
+        self.assertEqual({"id": 123}, response)
+        self.assertEqual(0, init.call_count)
+
+
+class RequestServiceStreamTests(unittest.TestCase):
+    """Test the streaming extraction of the data node of the rest operations wrapper."""
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    RESULTS = {"count": 2, "results": {"items": [{"id": 1, "score": 1.5}, {"id": 2, "score": 2.5}], "next": None}}
+
+    def setUp(self):
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = os.path.join(self.BASE_DIR, "config-tests-requests-stream.yml")
+        ms = Microservice(path=__file__)
+        ms.reload_conf()
+        self.app = ms.create_app()
+        self.request = ms.requests
+
+    @requests_mock.Mocker()
+    def test_get_for_object(self, mock_request):
+        url = "http://www.my-site.com/users"
+        mock_request.get(url, text=json.dumps(self.RESULTS))
+        with self.app.app_context():
+            response = self.request.get_for_object(url)
+
+        self.assertEqual(self.RESULTS["results"]["items"], response)
+
+    @requests_mock.Mocker()
+    def test_get_for_object_missing_node(self, mock_request):
+        url = "http://www.my-site.com/users"
+        mock_request.get(url, text=json.dumps({"results": []}))
+        with self.app.app_context():
+            response = self.request.get_for_object(url)
+
+        self.assertEqual({}, response)
+
+    @requests_mock.Mocker()
+    def test_get_for_object_without_valid_json(self, mock_request):
+        url = "http://www.my-site.com/users"
+        mock_request.get(url, text='{"results": {"items": [')
+        with self.app.app_context():
+            response = self.request.get_for_object(url)
+
+        self.assertEqual({}, response)
+
+    @requests_mock.Mocker()
+    def test_get_for_iterator(self, mock_request):
+        url = "http://www.my-site.com/users"
+        mock_request.get(url, text=json.dumps(self.RESULTS))
+        with self.app.app_context():
+            items = self.request.get_for_iterator(url)
+            self.assertEqual(1, mock_request.call_count)
+
+            self.assertEqual({"id": 1, "score": 1.5}, next(items))
+            self.assertEqual([{"id": 2, "score": 2.5}], list(items))
+
+    @requests_mock.Mocker()
+    def test_without_ijson(self, mock_request):
+        url = "http://www.my-site.com/users"
+        mock_request.get(url, text=json.dumps(self.RESULTS))
+        with self.app.app_context(), unittest.mock.patch(
+            "pyms.flask.services.requests.stream_available", return_value=False
+        ):
+            response = self.request.get_for_object(url)
+            items = list(self.request.get_for_iterator(url))
+
+        self.assertEqual(self.RESULTS["results"]["items"], response)
+        self.assertEqual(self.RESULTS["results"]["items"], items)
+
+    def test_stream_from_socket(self):
+        with StubServer({"/users": (200, json.dumps(self.RESULTS))}) as server, self.app.app_context():
+            items = list(self.request.get_for_iterator(server.url + "/users"))
+
+        self.assertEqual(self.RESULTS["results"]["items"], items)
+
+
+class RequestServiceJsonBackendTests(unittest.TestCase):
+    """Test the rest operations wrapper with the orjson backend."""
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+    def setUp(self):
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = os.path.join(self.BASE_DIR, "config-tests-requests-orjson.yml")
+        ms = Microservice(path=__file__)
+        ms.reload_conf()
+        self.app = ms.create_app()
+        self.request = ms.requests
+
+    def tearDown(self):
+        set_json_backend()
+
+    @requests_mock.Mocker()
+    def test_parse_response(self, mock_request):
+        url = "http://www.my-site.com/users"
+        mock_request.get(url, text=json.dumps({"data": [{"id": 1, "name": "Peter"}]}))
+        with self.app.app_context():
+            response = self.request.get_for_object(url)
+
+        self.assertEqual([{"id": 1, "name": "Peter"}], response)
+
+    @requests_mock.Mocker()
+    def test_json_body(self, mock_request):
+        url = "http://www.my-site.com/users"
+        mock_request.post(url, text=json.dumps({"data": {"id": 1}}))
+        with self.app.app_context():
+            self.request.post(url, json={"name": "Peter"})
+
+        self.assertEqual({"name": "Peter"}, mock_request.last_request.json())
+        self.assertEqual("application/json", mock_request.last_request.headers["Content-Type"])
+
+    def test_flask_json_provider(self):
+        with self.app.test_request_context():
+            response = self.app.json.response({"id": 1, "name": "Peter"})
+
+        self.assertEqual(b'{"id":1,"name":"Peter"}\n', response.data)
+        self.assertEqual({"id": 1}, self.app.json.loads(b'{"id": 1}'))
+
+
+class RequestServiceCircuitBreakerTests(unittest.TestCase):
+    """Test the circuit breaker of the rest operations wrapper."""
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+    def setUp(self):
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = os.path.join(
+            self.BASE_DIR, "config-tests-requests-circuit-breaker.yml"
+        )
+        ms = Microservice(path=__file__)
+        ms.reload_conf()
+        self.app = ms.create_app()
+        self.request = ms.requests
+
+    def test_disabled_by_default(self):
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = os.path.join(self.BASE_DIR, "config-tests-requests.yml")
+        ms = Microservice(path=__file__)
+        ms.reload_conf()
+        ms.create_app()
+
+        self.assertIsNone(ms.requests._circuit_breaker)
+
+    @requests_mock.Mocker()
+    def test_open_after_failures(self, mock_request):
+        mock_request.get("http://www.my-site.com/users", status_code=500)
+        mock_request.get("http://www.another-site.com/users", status_code=200)
+        with self.app.app_context():
+            self.request.get("http://www.my-site.com/users")
+            self.request.get("http://www.my-site.com/users")
+            with pytest.raises(CircuitBreakerOpenException):
+                self.request.get("http://www.my-site.com/users")
+            response = self.request.get("http://www.another-site.com/users")
+
+        self.assertEqual(3, mock_request.call_count)
+        self.assertEqual(200, response.status_code)
+
+    @requests_mock.Mocker()
+    def test_open_after_connection_errors(self, mock_request):
+        mock_request.post("http://www.my-site.com/users", exc=requests.exceptions.ReadTimeout)
+        with self.app.app_context():
+            for _ in range(2):
+                with pytest.raises(requests.exceptions.ReadTimeout):
+                    self.request.post("http://www.my-site.com/users", json={})
+            with pytest.raises(CircuitBreakerOpenException):
+                self.request.post("http://www.my-site.com/users", json={})
+
+        self.assertEqual(2, mock_request.call_count)
+
+    @requests_mock.Mocker()
+    def test_close_after_recovery_timeout(self, mock_request):
+        mock_request.get("http://www.my-site.com/users", [{"status_code": 500}, {"status_code": 500}, {"text": ""}])
+        with self.app.app_context():
+            self.request.get("http://www.my-site.com/users")
+            self.request.get("http://www.my-site.com/users")
+            time.sleep(0.1)
+            response = self.request.get("http://www.my-site.com/users")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(CLOSED, self.request._circuit_breaker.get_state("http://www.my-site.com"))
+
+    @requests_mock.Mocker()
+    def test_half_open_released_on_other_errors(self, mock_request):
+        mock_request.get("http://www.my-site.com/users", [{"status_code": 500}, {"status_code": 500}, {"text": ""}])
+        with self.app.app_context():
+            self.request.get("http://www.my-site.com/users")
+            self.request.get("http://www.my-site.com/users")
+            time.sleep(0.1)
+            with unittest.mock.patch.object(self.request, "_send_with_retries", side_effect=KeyboardInterrupt):
+                with pytest.raises(KeyboardInterrupt):
+                    self.request.get("http://www.my-site.com/users")
+            self.assertEqual(HALF_OPEN, self.request._circuit_breaker.get_state("http://www.my-site.com"))
+            response = self.request.get("http://www.my-site.com/users")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(CLOSED, self.request._circuit_breaker.get_state("http://www.my-site.com"))
+
+    @requests_mock.Mocker()
+    def test_circuit_by_template(self, mock_request):
+        self.request._circuit_breaker.circuit_key = "template"
+        mock_request.get("http://www.my-site.com/users/1", status_code=500)
+        mock_request.get("http://www.my-site.com/posts", status_code=200)
+        with self.app.app_context():
+            self.request.get("http://www.my-site.com/users/{id}", path_params={"id": 1})
+            self.request.get("http://www.my-site.com/users/{id}", path_params={"id": 1})
+            with pytest.raises(CircuitBreakerOpenException):
+                self.request.get("http://www.my-site.com/users/{id}", path_params={"id": 2})
+            response = self.request.get("http://www.my-site.com/posts")
+
+        self.assertEqual(200, response.status_code)
+
+    @requests_mock.Mocker()
+    def test_gather_circuit_open(self, mock_request):
+        mock_request.get("http://www.my-site.com/users", status_code=500)
+        with self.app.app_context():
+            responses = self.request.gather([{"url": "http://www.my-site.com/users"}] * 3, max_concurrency=1)
+
+        self.assertEqual([500, 500], [response.status_code for response in responses[:2]])
+        self.assertIsInstance(responses[2], CircuitBreakerOpenException)
+
+
+class RequestServiceCacheTests(unittest.TestCase):
+    """Test the response cache of the rest operations wrapper."""
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+    def setUp(self):
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = os.path.join(self.BASE_DIR, "config-tests-requests-cache.yml")
+        ms = Microservice(path=__file__)
+        ms.reload_conf()
+        self.app = ms.create_app()
+        self.request = ms.requests
+
+    @requests_mock.Mocker()
+    def test_fresh_response_cached(self, mock_request):
+        url = "http://www.my-site.com/users/{id}"
+        mock_request.get(
+            "http://www.my-site.com/users/1",
+            text=json.dumps({"data": {"id": 1}}),
+            headers={"Cache-Control": "max-age=60"},
+        )
+        with self.app.app_context():
+            first = self.request.get_for_object(url, path_params={"id": 1})
+            second = self.request.get_for_object(url, path_params={"id": 1})
+            self.request.get_for_object(url, path_params={"id": 1}, params={"page": 2})
+
+        self.assertEqual({"id": 1}, first)
+        self.assertIs(first, second)
+        self.assertEqual(2, mock_request.call_count)
+
+    @requests_mock.Mocker()
+    def test_no_store_not_cached(self, mock_request):
+        url = "http://www.my-site.com/users"
+        mock_request.get(url, text=json.dumps({"data": []}), headers={"Cache-Control": "no-store"})
+        with self.app.app_context():
+            self.request.get_for_object(url)
+            self.request.get_for_object(url)
+
+        self.assertEqual(2, mock_request.call_count)
+
+    @requests_mock.Mocker()
+    def test_revalidate_with_etag(self, mock_request):
+        url = "http://www.my-site.com/users"
+        mock_request.get(
+            url,
+            [
+                {"text": json.dumps({"data": [{"id": 1}]}), "headers": {"ETag": '"v1"'}},
+                {"status_code": 304, "headers": {"ETag": '"v1"'}},
+            ],
+        )
+        with self.app.app_context():
+            first = self.request.get_for_object(url)
+            second = self.request.get_for_object(url)
+
+        self.assertEqual([{"id": 1}], second)
+        self.assertIs(first, second)
+        self.assertEqual('"v1"', mock_request.last_request.headers["If-None-Match"])
+
+    @requests_mock.Mocker()
+    def test_route_ttl(self, mock_request):
+        url = "http://www.my-site.com/posts/{id}"
+        mock_request.get("http://www.my-site.com/posts/1", text=json.dumps({"data": {"id": 1}}))
+        with self.app.app_context():
+            self.request.get_for_object(url, path_params={"id": 1})
+            self.request.get_for_object(url, path_params={"id": 1})
+
+        self.assertEqual(1, mock_request.call_count)
+
+    @requests_mock.Mocker()
+    def test_vary_headers(self, mock_request):
+        url = "http://www.my-site.com/posts/{id}"
+        mock_request.get("http://www.my-site.com/posts/1", text=json.dumps({"data": {"id": 1}}))
+        with self.app.app_context():
+            self.request.get_for_object(url, path_params={"id": 1}, headers={"Authorization": "a"})
+            self.request.get_for_object(url, path_params={"id": 1}, headers={"Authorization": "b"})
+            self.request.get_for_object(url, path_params={"id": 1}, headers={"Authorization": "a"})
+
+        self.assertEqual(2, mock_request.call_count)
+
+    @requests_mock.Mocker()
+    def test_credentials_not_cached(self, mock_request):
+        url = "http://www.my-site.com/posts/{id}"
+        mock_request.get(
+            "http://www.my-site.com/posts/1",
+            [{"text": json.dumps({"data": {"user": user}})} for user in ("a", "b", "a")],
+        )
+        with self.app.app_context():
+            first = self.request.get_for_object(url, path_params={"id": 1}, auth=("a", "password"))
+            second = self.request.get_for_object(url, path_params={"id": 1}, auth=("b", "password"))
+            third = self.request.get_for_object(url, path_params={"id": 1}, cookies={"session": "a"})
+
+        self.assertEqual([{"user": "a"}, {"user": "b"}, {"user": "a"}], [first, second, third])
+        self.assertEqual(3, mock_request.call_count)
+
+    @requests_mock.Mocker()
+    def test_arguments_in_key(self, mock_request):
+        url = "http://www.my-site.com/posts/{id}"
+        mock_request.get("http://www.my-site.com/posts/1", text=json.dumps({"data": {"id": 1}}))
+        with self.app.app_context():
+            self.request.get_for_object(url, path_params={"id": 1}, timeout=1)
+            self.request.get_for_object(url, path_params={"id": 1}, timeout=2)
+            self.request.get_for_object(url, path_params={"id": 1}, allow_redirects=False)
+
+        self.assertEqual(2, mock_request.call_count)
+
+    @requests_mock.Mocker()
+    def test_vary_response_header(self, mock_request):
+        mock_request.get("http://www.my-site.com/posts/1", text=json.dumps({"data": {}}), headers={"Vary": "Cookie"})
+        mock_request.get("http://www.my-site.com/posts/2", text=json.dumps({"data": {}}), headers={"Vary": "*"})
+        mock_request.get(
+            "http://www.my-site.com/posts/3",
+            text=json.dumps({"data": {}}),
+            headers={"Vary": "accept, Accept-Encoding"},
+        )
+        with self.app.app_context():
+            for post_id in (1, 1, 2, 2, 3, 3):
+                self.request.get_for_object("http://www.my-site.com/posts/{id}", path_params={"id": post_id})
+
+        self.assertEqual(5, mock_request.call_count)
+
+
+class RequestServiceCoalesceTests(unittest.TestCase):
+    """Test the coalescing of identical concurrent calls of the rest operations wrapper."""
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+    def setUp(self):
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = os.path.join(self.BASE_DIR, "config-tests-requests-coalesce.yml")
+        ms = Microservice(path=__file__)
+        ms.reload_conf()
+        self.app = ms.create_app()
+        self.request = ms.requests
+        self.server = StubServer({"/slow": slow_route})
+        self.server.__enter__()
+
+    def tearDown(self):
+        self.server.__exit__()
+
+    def test_identical_calls_coalesced(self):
+        with self.app.app_context():
+            responses = self.request.gather(
+                [{"method": "get_for_object", "url": self.server.url + "/slow"}] * 5, max_concurrency=5
+            )
+
+        self.assertEqual(["/slow"] * 5, responses)
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_different_calls_not_coalesced(self):
+        with self.app.app_context():
+            self.request.gather(
+                [
+                    {"url": self.server.url + "/slow", "params": {"page": 1}},
+                    {"url": self.server.url + "/slow", "params": {"page": 2}},
+                    {"url": self.server.url + "/slow", "headers": {"Authorization": "a"}},
+                    {"url": self.server.url + "/slow", "headers": {"Authorization": "a"}},
+                ],
+                max_concurrency=4,
+            )
+
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_calls_with_different_timeout_coalesced(self):
+        with self.app.app_context():
+            responses = self.request.gather(
+                [
+                    {"method": "get_for_object", "url": self.server.url + "/slow", "timeout": 5},
+                    {"method": "get_for_object", "url": self.server.url + "/slow", "timeout": 10},
+                ],
+                max_concurrency=2,
+            )
+
+        self.assertEqual(["/slow"] * 2, responses)
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_shared_call_waited_with_own_timeout(self):
+        responses = []
+
+        def leader():
+            with self.app.app_context():
+                responses.append(self.request.get_for_object(self.server.url + "/slow"))
+
+        thread = threading.Thread(target=leader)
+        thread.start()
+        time.sleep(0.05)
+        with self.app.app_context():
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                self.request.get(self.server.url + "/slow", timeout=0.05)
+        thread.join()
+
+        self.assertEqual(["/slow"], responses)
+        self.assertEqual(1, len(self.server.requests))
+
+
+class RequestServicePropagateHeadersTests(unittest.TestCase):
+    """Test the allowlist and denylist of the propagated headers."""
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+    def setUp(self):
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = os.path.join(
+            self.BASE_DIR, "config-tests-requests-propagate-headers.yml"
+        )
+        ms = Microservice(path=__file__)
+        ms.reload_conf()
+        self.app = ms.create_app()
+        self.request = ms.requests
+
+    def test_only_allowed_headers(self):
+        with self.app.test_request_context(
+            "/tests/", headers={"Authorization": "token", "Accept-Language": "es", "a": "b"}
+        ):
+            headers = self.request.set_propagate_headers({})
+
+        self.assertEqual({"Authorization": "token", "Accept-Language": "es"}, headers)
+
+    def test_denied_headers(self):
+        with self.app.test_request_context("/tests/", headers={"Authorization": "token", "Cookie": "a=b"}):
+            headers = self.request.set_propagate_headers({})
+
+        self.assertEqual({"Authorization": "token"}, headers)
+
+    @requests_mock.Mocker()
+    def test_shared_by_outbound_calls(self, mock_request):
+        mock_request.get(re.compile(r"http://www.my-site.com/.*"))
+        with self.app.test_request_context("/tests/", headers={"Authorization": "token", "a": "b"}):
+            self.request.get("http://www.my-site.com/users")
+            self.request.get("http://www.my-site.com/posts")
+
+        for sent in mock_request.request_history:
+            self.assertEqual("token", sent.headers["Authorization"])
+            self.assertNotIn("A", sent.headers)
+
+
+class SingleFlightTests(unittest.TestCase):
+    def test_error_shared(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        errors = []
+
+        def fail():
+            started.set()
+            time.sleep(0.1)
+            raise requests.exceptions.ConnectionError()
+
+        def follower():
+            started.wait()
+            try:
+                single_flight.do("key", fail)
+            except requests.exceptions.ConnectionError as ex:
+                errors.append(ex)
+
+        thread = threading.Thread(target=follower)
+        thread.start()
+        with pytest.raises(requests.exceptions.ConnectionError):
+            single_flight.do("key", fail)
+        thread.join()
+
+        self.assertEqual(1, len(errors))
+        self.assertEqual(0, len(single_flight))
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def test_get_ttl(self):
+        self.assertEqual((True, 30.0), get_ttl({"Cache-Control": "public, max-age=30"}, 5))
+        self.assertEqual((True, 5), get_ttl({}, 5))
+        self.assertEqual((True, 0), get_ttl({"Cache-Control": "no-cache"}, 5))
+        self.assertEqual((False, 0), get_ttl({"Cache-Control": "private, max-age=30"}, 5))
+
+    def test_is_cacheable_vary(self):
+        self.assertTrue(is_cacheable_vary({}, ()))
+        self.assertTrue(is_cacheable_vary({"Vary": "Accept-Language, accept-encoding"}, ("Accept-Language",)))
+        self.assertFalse(is_cacheable_vary({"Vary": "Accept-Language, Cookie"}, ("Accept-Language",)))
+        self.assertFalse(is_cacheable_vary({"Vary": "*"}, ("Accept-Language",)))
+
+    def test_memory_lru(self):
+        evicted = []
+        cache = MemoryCache(max_entries=2, on_evict=evicted.append)
+        cache.set("a", CacheEntry(1, None, time.time() + 60))
+        cache.set("b", CacheEntry(2, None, time.time() + 60))
+        cache.get("a")
+        cache.set("c", CacheEntry(3, None, time.time() + 60))
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(1, cache.get("a").value)
+        self.assertEqual([1], evicted)
+
+    def test_from_config(self):
+        self.assertIsNone(ResponseCache.from_config(False))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ResponseCache.from_config({"backend": "file", "path": tmpdir, "routes": [{"url": "a", "ttl": 5}]})
+
+            self.assertIsInstance(cache.store, FileCache)
+            self.assertEqual({"a": 5}, cache.routes)
+        with pytest.raises(ConfigErrorException):
+            ResponseCache.from_config({"backend": "redis"})
+
+    def test_file_shared(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = FileCache(tmpdir, max_entries=1)
+            other_worker = FileCache(tmpdir, max_entries=1)
+            cache.set("a", CacheEntry({"id": 1}, '"v1"', time.time() + 60))
+
+            entry = other_worker.get("a")
+            self.assertEqual(({"id": 1}, '"v1"'), (entry.value, entry.etag))
+            self.assertTrue(entry.is_fresh())
+
+            os.utime(cache._get_filename("a"), (0, 0))
+            other_worker.set("b", CacheEntry(2, None, time.time() + 60))
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(1, len(cache))
+
+    def test_file_entries_are_json(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = FileCache(tmpdir)
+            cache.set("a", CacheEntry({"id": 1}, None, 1.5))
+            with open(cache._get_filename("a"), "rb") as entry_file:
+                self.assertEqual([{"id": 1}, None, 1.5], json.loads(entry_file.read()))
+
+            with open(cache._get_filename("b"), "wb") as entry_file:
+                entry_file.write(b"\x80\x04not json")
+            self.assertIsNone(cache.get("b"))
+
+    def test_file_directory_writable_by_others(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.chmod(tmpdir, 0o777)
+            with pytest.raises(ConfigErrorException):
+                FileCache(tmpdir)
+
+    def test_file_directory_of_other_user(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with unittest.mock.patch("os.getuid", return_value=os.getuid() + 1):
+                with pytest.raises(ConfigErrorException):
+                    FileCache(tmpdir)
+
+    def test_file_default_path_per_user(self):
+        self.assertIn(str(os.getuid()), os.path.basename(FileCache.get_default_path()))
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def setUp(self):
+        self.changes = []
+        self.breaker = CircuitBreaker(
+            failure_threshold=2,
+            recovery_timeout=0.05,
+            half_open_max_calls=1,
+            store=MemoryStateStore(),
+            on_state_change=lambda circuit, state: self.changes.append((circuit, state)),
+        )
+
+    def test_failures_must_be_consecutive(self):
+        self.breaker.record_failure("users")
+        self.breaker.record_success("users")
+        self.breaker.record_failure("users")
+
+        self.assertEqual(CLOSED, self.breaker.get_state("users"))
+
+    def test_half_open(self):
+        self.breaker.record_failure("users")
+        self.breaker.record_failure("users")
+        with pytest.raises(CircuitBreakerOpenException):
+            self.breaker.before_call("users")
+        time.sleep(0.05)
+
+        self.breaker.before_call("users")
+        with pytest.raises(CircuitBreakerOpenException):
+            self.breaker.before_call("users")
+        self.assertEqual(HALF_OPEN, self.breaker.get_state("users"))
+
+        self.breaker.record_failure("users")
+        self.assertEqual(OPEN, self.breaker.get_state("users"))
+        self.assertEqual([("users", OPEN), ("users", HALF_OPEN), ("users", OPEN)], self.changes)
+
+    def test_half_open_release(self):
+        self.breaker.record_failure("users")
+        self.breaker.record_failure("users")
+        time.sleep(0.05)
+
+        self.breaker.before_call("users")
+        with pytest.raises(CircuitBreakerOpenException):
+            self.breaker.before_call("users")
+        self.breaker.release("users")
+
+        self.breaker.before_call("users")
+        self.breaker.record_success("users")
+        self.assertEqual(CLOSED, self.breaker.get_state("users"))
+
+    def test_half_open_call_lost(self):
+        self.breaker.record_failure("users")
+        self.breaker.record_failure("users")
+        time.sleep(0.05)
+
+        self.breaker.before_call("users")
+        with pytest.raises(CircuitBreakerOpenException):
+            self.breaker.before_call("users")
+        time.sleep(0.05)
+
+        self.breaker.before_call("users")
+        self.breaker.record_success("users")
+        self.assertEqual(CLOSED, self.breaker.get_state("users"))
+
+    def test_file_store_shared(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "circuits.json")
+            breaker = CircuitBreaker(failure_threshold=2, store=FileStateStore(path))
+            other_worker = CircuitBreaker(failure_threshold=2, store=FileStateStore(path))
+
+            breaker.record_failure("users")
+            other_worker.record_failure("users")
+
+            with pytest.raises(CircuitBreakerOpenException):
+                breaker.before_call("users")
+            self.assertEqual(OPEN, other_worker.get_state("users"))
+
+    def test_file_store_dir_writable_by_others(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.chmod(tmpdir, 0o777)
+            with pytest.raises(ConfigErrorException):
+                FileStateStore(os.path.join(tmpdir, "circuits.json"))
+
+    def test_file_store_symlink(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "circuits.json")
+            os.symlink(os.path.join(tmpdir, "other.json"), path)
+            breaker = CircuitBreaker(store=FileStateStore(path))
+
+            with pytest.raises(ConfigErrorException):
+                breaker.get_state("users")
+
+    def test_default_state_path(self):
+        with tempfile.TemporaryDirectory() as tmpdir, unittest.mock.patch("tempfile.tempdir", tmpdir):
+            path = CircuitBreaker.get_default_state_path()
+
+            self.assertEqual(os.path.join(tmpdir, "pyms-circuit-breaker-{}".format(os.getuid())), os.path.dirname(path))
+            self.assertEqual(0o700, os.stat(os.path.dirname(path)).st_mode & 0o777)
+
+
+class URLTemplateTests(unittest.TestCase):
+    def test_encode_path_params(self):
+        url = Service._build_url("http://www.my-site.com/users/{id}/posts?q={q}", {"id": "a/b c", "q": "x&y"})
+
+        self.assertEqual("http://www.my-site.com/users/a%2Fb%20c/posts?q=x%26y", url)
+
+    def test_not_encode_base_url(self):
+        self.assertEqual(
+            "http://www.my-site.com:8080/api/users/1",
+            Service._build_url("{base_url}/users/{id}", {"base_url": "http://www.my-site.com:8080/api", "id": 1}),
+        )
+        self.assertEqual(
+            "http://www.my-site.com/users/1",
+            Service._build_url("http://{host}/users/{id}", {"host": "www.my-site.com", "id": 1}),
+        )
+
+    def test_format_spec_and_attributes(self):
+        url = Service._build_url(
+            "http://www.my-site.com/users/{id:03d}/{user.name}/{ids[0]}",
+            {"id": 7, "user": types.SimpleNamespace(name="Peter Parker"), "ids": [3]},
+        )
+
+        self.assertEqual("http://www.my-site.com/users/007/Peter%20Parker/3", url)
+
+    def test_missing_path_params(self):
+        with pytest.raises(PathParamsException) as excinfo:
+            Service._build_url("http://www.my-site.com/users/{user-id}/posts/{post-id}", {"user-id": 1})
+
+        assert "post-id" in str(excinfo.value)
+
+    def test_escaped_braces(self):
+        self.assertEqual("http://www.my-site.com/{a}", compile_template("http://www.my-site.com/{{a}}").expand({}))
+        self.assertEqual(
+            "http://www.my-site.com/{a}/1", Service._build_url("http://www.my-site.com/{{a}}/{id}", {"id": 1})
+        )
+
+    def test_compiled_once(self):
+        template = compile_template("http://www.my-site.com/users/{id}")
+
+        self.assertIs(template, Service.get_url_template("http://www.my-site.com/users/{id}"))
+        self.assertEqual(("id",), template.fields)
+        self.assertEqual("http://www.my-site.com/users/{id}", template.template)
+
+
+class RetryPolicyTests(unittest.TestCase):
+    def test_attempts(self):
+        policy = RetryPolicy(attempts=3, status_retries=(500,))
+
+        self.assertTrue(policy.is_retryable(1, status_code=500))
+        self.assertTrue(policy.is_retryable(2, retryable_error=True))
+        self.assertFalse(policy.is_retryable(3, status_code=500))
+        self.assertFalse(policy.is_retryable(1, status_code=404))
+        self.assertFalse(policy.is_retryable(1))
+
+    def test_backoff_full_jitter(self):
+        policy = RetryPolicy(attempts=10, status_retries=(500,), backoff_factor=0.5, backoff_max=2)
+        backoffs = [policy.get_backoff(attempt) for attempt in range(1, 10) for _ in range(20)]
+
+        self.assertTrue(all(0 <= backoff <= 2 for backoff in backoffs))
+        self.assertLessEqual(policy.get_backoff(1), 0.5)
+
+    def test_backoff_retry_after(self):
+        policy = RetryPolicy(attempts=3, status_retries=(503,), backoff_max=10)
+
+        self.assertEqual(2, policy.get_backoff(1, "2"))
+        self.assertEqual(10, policy.get_backoff(1, "120"))
+        self.assertEqual(0, policy.get_backoff(1, "Wed, 21 Oct 2015 07:28:00 GMT"))
+        self.assertLessEqual(policy.get_backoff(1, "not a date"), 0.3)
+
+    def test_budget(self):
+        budget = RetryBudget(ratio=0.5, min_per_second=0)
+
+        self.assertFalse(budget.try_withdraw())
+        budget.deposit()
+        budget.deposit()
+        self.assertTrue(budget.try_withdraw())
+        self.assertFalse(budget.try_withdraw())
+
+    def test_budget_refill(self):
+        budget = RetryBudget(ratio=0, min_per_second=100, max_tokens=1)
+
+        self.assertTrue(budget.try_withdraw())
+        time.sleep(0.02)
+        self.assertTrue(budget.try_withdraw())
+
+
+class SessionPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.sessions_created = 0
+
+    def session_factory(self):
+        self.sessions_created += 1
+        return requests.Session()
+
+    def test_pool_key(self):
+        self.assertEqual("https://my-site.com:8080", SessionPool.get_pool_key("HTTPS://My-Site.com:8080/users?id=1"))
+
+    def test_evict_idle(self):
+        pool = SessionPool(self.session_factory, idle_timeout=0.01)
+        with pool.session("http://www.my-site.com/users"):
+            pass
+        time.sleep(0.02)
+
+        self.assertEqual(1, pool.evict_idle())
+        self.assertEqual(0, len(pool))
+
+    def test_not_evict_in_use(self):
+        pool = SessionPool(self.session_factory, idle_timeout=0.01)
+        with pool.session("http://www.my-site.com/users"):
+            time.sleep(0.02)
+            self.assertEqual(0, pool.evict_idle())
+        self.assertEqual(1, len(pool))
+
+    @requests_mock.Mocker()
+    def test_cookies_not_persisted(self, mock_request):
+        url = "http://www.my-site.com/users"
+        mock_request.get(url, text="", headers={"Set-Cookie": "session_id=1234"})
+        pool = SessionPool(self.session_factory)
+        with pool.session(url) as session:
+            response = session.get(url)
+
+        self.assertEqual("1234", response.cookies["session_id"])
+        self.assertEqual(0, len(session.cookies))
+
+    def test_shared_between_threads(self):
+        pool = SessionPool(self.session_factory)
+
+        def checkout():
+            with pool.session("http://www.my-site.com/users"):
+                pass
+
+        threads = [threading.Thread(target=checkout) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, self.sessions_created)
+
+
+class RequestServiceGatherTests(unittest.TestCase):
+    """Test concurrent calls of the rest operations wrapper."""
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+    def setUp(self):
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = os.path.join(self.BASE_DIR, "config-tests-requests.yml")
+        ms = Microservice(path=__file__)
+        ms.reload_conf()
+        self.app = ms.create_app()
+        self.request = ms.requests
+        self.server = StubServer(
+            {
+                "/users": (200, json.dumps({"data": [{"id": 1}]})),
+                "/users/123": (200, json.dumps({"data": {"id": 123}})),
+                "/slow": slow_route,
+            }
+        )
+        self.server.__enter__()
+
+    def tearDown(self):
+        self.server.__exit__()
+
+    def test_gather_in_order(self):
+        with self.app.app_context():
+            responses = self.request.gather(
+                [
+                    {"method": "get_for_object", "url": self.server.url + "/slow"},
+                    {"method": "get_for_object", "url": self.server.url + "/users/{id}", "path_params": {"id": 123}},
+                    {"method": "post", "url": self.server.url + "/users", "json": {"name": "Peter"}},
+                ]
+            )
+
+        self.assertEqual("/slow", responses[0])
+        self.assertEqual({"id": 123}, responses[1])
+        self.assertEqual(200, responses[2].status_code)
+
+    def test_gather_concurrently(self):
+        start = time.time()
+        with self.app.app_context():
+            responses = self.request.gather([{"url": self.server.url + "/slow"}] * 5, max_concurrency=5)
+
+        self.assertEqual([200] * 5, [response.status_code for response in responses])
+        self.assertLess(time.time() - start, 0.8)
+
+    @requests_mock.Mocker(real_http=True)
+    def test_gather_errors(self, mock_request):
+        mock_request.get("http://www.my-site.com/users", exc=requests.exceptions.ConnectTimeout)
+        with self.app.app_context():
+            responses = self.request.gather(
+                [{"url": "http://www.my-site.com/users"}, {"url": self.server.url + "/users/123"}]
+            )
+
+        self.assertIsInstance(responses[0], requests.exceptions.ConnectTimeout)
+        self.assertEqual(200, responses[1].status_code)
+
+    def test_gather_timeout(self):
+        with self.app.app_context():
+            responses = self.request.gather(
+                [{"url": self.server.url + "/users"}, {"url": self.server.url + "/slow"}], timeout=0.1
+            )
+
+        self.assertEqual(200, responses[0].status_code)
+        self.assertIsInstance(responses[1], concurrent.futures.TimeoutError)
+
+    def test_gather_timeout_passed_to_calls(self):
+        with unittest.mock.patch.object(self.request, "_send", wraps=self.request._send) as send:
+            with self.app.app_context():
+                responses = self.request.gather(
+                    [{"url": self.server.url + "/slow"}, {"url": self.server.url + "/slow", "timeout": 5}], timeout=0.1
+                )
+            for _ in range(100):
+                if send.call_count == 2:
+                    break
+                time.sleep(0.01)
+
+        self.assertIsInstance(responses[0], concurrent.futures.TimeoutError)
+        timeouts = sorted(call.kwargs["timeout"] for call in send.call_args_list)
+        self.assertLessEqual(timeouts[0], 0.1)
+        self.assertEqual(5, timeouts[1])
+
+    def test_gather_call_not_started_before_timeout(self):
+        call = self.request.get_call({"url": self.server.url + "/users"}, deadline=time.monotonic() - 1)
+
+        with pytest.raises(concurrent.futures.TimeoutError):
+            call()
+        self.assertEqual([], self.server.requests)
+
+    def test_gather_propagate_headers(self):
+        with self.app.test_request_context("/tests/", headers={"a": "b"}):
+            self.request.gather([{"url": self.server.url + "/users", "propagate_headers": True}])
+
+        _, _, headers, _ = self.server.requests[0]
+        self.assertEqual("b", headers["A"])
+
+    def test_gather_propagate_headers_filtered_once(self):
+        with self.app.test_request_context("/tests/", headers={"a": "b"}):
+            with unittest.mock.patch.object(
+                HeadersFilter, "filter", autospec=True, side_effect=HeadersFilter.filter
+            ) as filter_headers:
+                self.request.set_propagate_headers({})
+                self.request.gather([{"url": self.server.url + "/users", "propagate_headers": True}] * 3)
+
+        filter_headers.assert_called_once()
+        self.assertEqual(["b"] * 3, [headers["A"] for _, _, headers, _ in self.server.requests])
+
+    def test_gather_method_not_allowed(self):
+        with pytest.raises(ValueError):
+            self.request.gather([{"method": "requests", "url": self.server.url + "/users"}])
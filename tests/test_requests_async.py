@@ -0,0 +1,174 @@
+"""Test asynchronous rest operations wrapper.
+"""
+
+import concurrent.futures
+import json
+import os
+import time
+import unittest
+
+import httpx
+
+from pyms.config import ConfFile
+from pyms.constants import CONFIGMAP_FILE_ENVIRONMENT
+from pyms.exceptions import ConfigErrorException
+from pyms.flask.app import Microservice
+from pyms.flask.services.http import SessionPool
+from pyms.flask.services.http.base import DEFAULT_RETRIES
+from pyms.flask.services.http.circuitbreaker import CLOSED, HALF_OPEN, CircuitBreaker
+from tests.common import StubServer
+
+USERS = {"data": [{"id": 1, "name": "Peter"}, {"id": 2, "name": "Jon"}]}
+
+
+def slow_route(handler):
+    time.sleep(0.2)
+    return 200, json.dumps({"data": handler.path})
+
+
+class RequestAsyncServiceTests(unittest.TestCase):
+    """Test asynchronous rest operations wrapper."""
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+    def setUp(self):
+        os.environ[CONFIGMAP_FILE_ENVIRONMENT] = os.path.join(self.BASE_DIR, "config-tests-requests-async.yml")
+        ms = Microservice(path=__file__)
+        ms.reload_conf()
+        self.app = ms.create_app()
+        self.request = ms.requests_async
+        self.server = StubServer(
+            {
+                "/users": (200, json.dumps(USERS)),
+                "/users/123": (200, json.dumps({"data": {"id": 123}})),
+                "/error": (500, ""),
+                "/slow": slow_route,
+            }
+        )
+        self.server.__enter__()
+
+    def tearDown(self):
+        self.server.__exit__()
+        self.app.ms.shutdown_services_actions()
+
+    def test_get(self):
+        with self.app.app_context():
+            (response,) = self.request.run(self.request.get(self.server.url + "/users"))
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(USERS, response.json())
+
+    def test_get_for_object(self):
+        with self.app.app_context():
+            (response,) = self.request.run(
+                self.request.get_for_object(self.server.url + "/users/{user-id}", path_params={"user-id": 123})
+            )
+
+        self.assertEqual({"id": 123}, response)
+
+    def test_get_for_iterator(self):
+        with self.app.app_context():
+            (items,) = self.request.run(self.request.get_for_iterator(self.server.url + "/users"))
+
+        self.assertEqual(USERS["data"], list(items))
+
+    def test_unsupported_settings(self):
+        self.addCleanup(self.request.set_config, self.request.config)
+        for setting in ("cache", "coalesce", "stream_data"):
+            with self.subTest(setting=setting):
+                self.request.set_config(ConfFile(config={"data": "data", setting: True}))
+
+                with self.assertRaises(ConfigErrorException):
+                    self.request.load_settings()
+        self.assertFalse(hasattr(type(self.request), "get_cached_object"))
+
+    def test_post_for_object(self):
+        user = {"name": "Peter"}
+        with self.app.app_context():
+            (response,) = self.request.run(self.request.post_for_object(self.server.url + "/users", json=user))
+
+        method, path, _, body = self.server.requests[0]
+        self.assertEqual(USERS["data"], response)
+        self.assertEqual(("POST", "/users"), (method, path))
+        self.assertEqual(user, json.loads(body))
+
+    def test_run_concurrently(self):
+        start = time.time()
+        with self.app.app_context():
+            responses = self.request.run(*[self.request.get_for_object(self.server.url + "/slow") for _ in range(5)])
+
+        self.assertEqual(["/slow"] * 5, responses)
+        self.assertLess(time.time() - start, 0.8)
+
+    def test_run_return_exceptions(self):
+        with self.app.app_context():
+            responses = self.request.run(
+                self.request.get_for_object(self.server.url + "/users/{user-id}", path_params={"user-id": 123}),
+                self.request.get("http://127.0.0.1:1/users"),
+                return_exceptions=True,
+            )
+
+        self.assertEqual({"id": 123}, responses[0])
+        self.assertIsInstance(responses[1], httpx.ConnectError)
+
+    def test_propagate_headers(self):
+        with self.app.test_request_context("/tests/", headers={"a": "b"}):
+            self.request.run(self.request.get(self.server.url + "/users", propagate_headers=True))
+
+        _, _, headers, _ = self.server.requests[0]
+        self.assertEqual("b", headers["A"])
+
+    def test_retries_with_500(self):
+        with self.app.app_context():
+            (response,) = self.request.run(self.request.get(self.server.url + "/error"))
+
+        self.assertEqual(500, response.status_code)
+        self.assertEqual(DEFAULT_RETRIES, len(self.server.requests))
+
+    def test_shutdown(self):
+        with self.app.app_context():
+            self.request.run(self.request.get(self.server.url + "/users"))
+        loop_thread = self.request._loop_thread
+
+        self.app.ms.shutdown_services_actions()
+
+        self.assertTrue(loop_thread.loop.is_closed())
+        self.assertIsNone(self.request._loop_thread)
+
+    def test_gather(self):
+        with self.app.app_context():
+            responses = self.request.gather(
+                [
+                    {"method": "get_for_object", "url": self.server.url + "/users/{id}", "path_params": {"id": 123}},
+                    {"method": "get", "url": "http://127.0.0.1:1/users"},
+                    {"method": "post_for_object", "url": self.server.url + "/users", "json": {"name": "Peter"}},
+                ]
+            )
+
+        self.assertEqual({"id": 123}, responses[0])
+        self.assertIsInstance(responses[1], httpx.ConnectError)
+        self.assertEqual(USERS["data"], responses[2])
+
+    def test_gather_timeout(self):
+        with self.app.app_context():
+            responses = self.request.gather(
+                [{"url": self.server.url + "/users"}, {"url": self.server.url + "/slow"}], timeout=0.1
+            )
+
+        self.assertEqual(200, responses[0].status_code)
+        self.assertIsInstance(responses[1], concurrent.futures.TimeoutError)
+
+    def test_gather_timeout_releases_half_open_circuit(self):
+        self.request.load_settings()
+        self.request._circuit_breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+        circuit = SessionPool.get_pool_key(self.server.url)
+        self.request._circuit_breaker.record_failure(circuit)
+        with self.app.app_context():
+            responses = self.request.gather([{"url": self.server.url + "/slow"}], timeout=0.05)
+            self.assertIsInstance(responses[0], concurrent.futures.TimeoutError)
+            self.assertEqual(HALF_OPEN, self.request._circuit_breaker.get_state(circuit))
+
+            (response,) = self.request.run(self.request.get(self.server.url + "/users"))
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(CLOSED, self.request._circuit_breaker.get_state(circuit))
@@ -1,10 +1,18 @@
 """Test common rest operations wrapper.
 """
 
+import json
 import os
+import shutil
+import tempfile
 import unittest
+from pathlib import Path
+from unittest import mock
 
+from pyms.cmd import Command
 from pyms.constants import CONFIGMAP_FILE_ENVIRONMENT
+from pyms.exceptions import ConfigErrorException
+from pyms.flask.services import swagger
 from tests.common import MyMicroserviceNoSingleton
 
 
@@ -30,6 +38,120 @@ class SwaggerTests(unittest.TestCase):
         self.assertEqual(200, response.status_code)
 
 
+class SwaggerSpecCacheTests(unittest.TestCase):
+    """Test the cache of the resolved spec"""
+
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.spec_dir = os.path.join(self.temp_dir, "swagger")
+        self.cache_dir = os.path.join(self.temp_dir, "cache")
+        shutil.copytree(os.path.join(self.BASE_DIR, "swagger_for_tests"), self.spec_dir)
+        self.main_file = Path(self.spec_dir, "swagger.yaml")
+        self.cache_file = swagger.get_spec_cache_path(self.main_file, self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def get_specs(self):
+        with mock.patch.object(swagger, "get_bundled_specs", wraps=swagger.get_bundled_specs) as bundled_specs:
+            specs = swagger.get_cached_specs(self.main_file, self.cache_dir)
+        return specs, bundled_specs.call_count
+
+    def test_cache_hit(self):
+        specs, calls = self.get_specs()
+        self.assertEqual(1, calls)
+        self.assertTrue(self.cache_file.exists())
+        self.assertEqual([], [name for name in os.listdir(self.spec_dir) if name not in ("swagger.yaml", "info.yaml")])
+
+        cached_specs, calls = self.get_specs()
+        self.assertEqual(0, calls)
+        self.assertEqual(specs, cached_specs)
+        self.assertEqual("apiteam@swagger.io", cached_specs["info"]["contact"]["email"])
+
+    def test_cache_is_json(self):
+        self.get_specs()
+
+        cached = json.loads(self.cache_file.read_text())
+        self.assertEqual("2.0", cached["specs"]["swagger"])
+
+    def test_referenced_file_changed(self):
+        self.get_specs()
+        info_file = Path(self.spec_dir, "info.yaml")
+        info_file.write_text(info_file.read_text().replace("apiteam@swagger.io", "team@example.com"))
+
+        specs, calls = self.get_specs()
+        self.assertEqual(1, calls)
+        self.assertEqual("team@example.com", specs["info"]["contact"]["email"])
+
+    def test_referenced_file_outside_folder(self):
+        shutil.move(os.path.join(self.spec_dir, "info.yaml"), os.path.join(self.temp_dir, "info.yaml"))
+        self.main_file.write_text(self.main_file.read_text().replace("'info.yaml#", "'../info.yaml#"))
+        self.get_specs()
+        info_file = Path(self.temp_dir, "info.yaml")
+        info_file.write_text(info_file.read_text().replace("apiteam@swagger.io", "team@example.com"))
+
+        specs, calls = self.get_specs()
+        self.assertEqual(1, calls)
+        self.assertEqual("team@example.com", specs["info"]["contact"]["email"])
+
+    def test_url_reference_not_cached(self):
+        self.main_file.write_text(
+            self.main_file.read_text().replace("'info.yaml#/url'", "'http://example.com/info.yaml#/url'")
+        )
+
+        self.assertIsNone(swagger.get_spec_files(self.main_file))
+        self.assertIsNone(swagger.get_spec_hash(self.main_file))
+
+    def test_other_files_ignored(self):
+        self.get_specs()
+        Path(self.spec_dir, swagger.MERGED_SWAGGER_FILE).write_text("swagger: '2.0'\n")
+        Path(self.spec_dir, "other.yaml").write_text("a: 1\n")
+
+        _, calls = self.get_specs()
+        self.assertEqual(0, calls)
+
+    def test_corrupted_cache(self):
+        self.get_specs()
+        self.cache_file.write_bytes(b"not json")
+
+        specs, calls = self.get_specs()
+        self.assertEqual(1, calls)
+        self.assertEqual("2.0", specs["swagger"])
+
+    def test_read_only_folder(self):
+        with mock.patch.object(swagger, "open", side_effect=PermissionError, create=True):
+            specs, calls = self.get_specs()
+        self.assertEqual(1, calls)
+        self.assertEqual("2.0", specs["swagger"])
+        self.assertFalse(self.cache_file.exists())
+
+    def test_cache_dir_writable_by_others(self):
+        os.makedirs(self.cache_dir)
+        os.chmod(self.cache_dir, 0o777)
+
+        with self.assertRaises(ConfigErrorException):
+            self.get_specs()
+
+    def test_default_cache_dir(self):
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": self.temp_dir}):
+            cache_file = swagger.get_spec_cache_path(self.main_file)
+
+        self.assertEqual(Path(self.temp_dir, "pyms"), cache_file.parent)
+
+    def test_merge_swagger_builds_cache(self):
+        cmd = Command(
+            arguments=["merge-swagger", "--file", str(self.main_file), "--cache", "--cache-dir", self.cache_dir],
+            autorun=False,
+        )
+        self.assertTrue(cmd.run())
+        self.assertTrue(Path(self.spec_dir, swagger.MERGED_SWAGGER_FILE).exists())
+
+        _, calls = self.get_specs()
+        self.assertEqual(0, calls)
+
+
 # class SwaggerNoAbsPathTests(unittest.TestCase):
 #     """Test common rest operations wrapper."""
 #
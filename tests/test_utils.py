@@ -1,14 +1,22 @@
 """Test common rest operations wrapper.
 """
 
+import datetime
+import json
+import logging
 import os
+import sys
 import unittest
+from unittest import mock
 
 import pytest
 
 from pyms.crypt.fernet import Crypt
-from pyms.exceptions import FileDoesNotExistException, PackageNotExists
+from pyms.exceptions import ConfigErrorException, FileDoesNotExistException, PackageNotExists
+from pyms.logger import CustomJsonFormatter
+from pyms.logger.lazy import REDACTED, LazyFields, log_debug
 from pyms.utils import check_package_exists, import_package
+from pyms.utils import json_backend
 
 
 class ConfUtils(unittest.TestCase):
@@ -24,3 +32,82 @@ class ConfUtils(unittest.TestCase):
     def test_import_package(self):
         os_import = import_package("os")
         assert os_import == os
+
+
+class JsonBackendTests(unittest.TestCase):
+    def tearDown(self):
+        json_backend.set_json_backend()
+
+    def test_orjson(self):
+        backend = json_backend.set_json_backend("orjson")
+        now = datetime.datetime(2020, 1, 1)
+
+        self.assertEqual("orjson", json_backend.get_json_backend().name)
+        self.assertEqual({"a": [1, 2]}, json_backend.loads(b'{"a": [1, 2]}'))
+        self.assertEqual('{"1":"2020-01-01T00:00:00"}', backend.dumps({1: now}, default=lambda obj: obj.isoformat()))
+        self.assertEqual(b'{"a":1,"b":2}', backend.dumps_bytes({"b": 2, "a": 1}, sort_keys=True))
+
+    def test_stdlib(self):
+        backend = json_backend.set_json_backend()
+
+        self.assertEqual('{"a": 1, "b": 2}', backend.dumps({"b": 2, "a": 1}, sort_keys=True))
+        self.assertEqual(b'{"a": 1, "b": 2}', backend.dumps_bytes({"b": 2, "a": 1}, sort_keys=True))
+
+    def test_fallback_to_stdlib(self):
+        with mock.patch.dict(sys.modules, {"ujson": None}):
+            backend = json_backend.set_json_backend("ujson")
+
+        self.assertEqual(json_backend.STDLIB, backend.name)
+
+    def test_backend_not_valid(self):
+        with pytest.raises(ConfigErrorException):
+            json_backend.set_json_backend("simplejson")
+
+    def test_log_formatter(self):
+        json_backend.set_json_backend("orjson")
+        formatter = CustomJsonFormatter()
+        record = logging.LogRecord("pyms", logging.INFO, __file__, 1, "Hello", None, None)
+        record.when = datetime.date(2020, 1, 1)
+
+        log = json.loads(formatter.format(record))
+
+        self.assertEqual("Hello", log["message"])
+        self.assertEqual("2020-01-01", log["when"])
+
+
+class LazyLoggingTests(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("pyms-lazy-tests")
+
+    def test_redacted(self):
+        fields = LazyFields({"headers": {"Authorization": "Bearer 1234", "A": "b"}})
+
+        self.assertEqual("headers {{'Authorization': '{}', 'A': 'b'}}".format(REDACTED), str(fields))
+
+    def test_truncated(self):
+        fields = LazyFields({"data": "x" * 20}, max_length=10)
+
+        self.assertEqual("data xxxxxxxxxx... (20 chars)", str(fields))
+
+    def test_nested_values_redacted(self):
+        fields = LazyFields({"json": {"user": {"name": "Peter", "password": "1234"}}})
+
+        self.assertEqual("json {'user': {'name': 'Peter', 'password': '***'}}", str(fields))
+
+    def test_not_formatted_if_disabled(self):
+        self.logger.setLevel(logging.INFO)
+        value = mock.MagicMock()
+
+        with mock.patch.object(self.logger, "_log") as log:
+            log_debug(self.logger, "Get with", url=value)
+
+        log.assert_not_called()
+        value.__str__.assert_not_called()
+
+    def test_formatted_if_enabled(self):
+        self.logger.setLevel(logging.DEBUG)
+
+        with self.assertLogs(self.logger, logging.DEBUG) as logs:
+            log_debug(self.logger, "Get with", url="http://users/1", headers={"Cookie": "a=b"})
+
+        self.assertEqual(["DEBUG:pyms-lazy-tests:Get with url http://users/1, headers {'Cookie': '***'}"], logs.output)